@@ -1,13 +1,19 @@
 import chainlit as cl
 import dotenv
-from openai.types.responses import ResponseTextDeltaEvent
 
 from agents import Runner
-from nutrition_agent import nutrition_agent
+from nutrition_agent import nutrition_agent, warmup
+from token_stream import TokenStream, default_echo
 
 dotenv.load_dotenv()
 
 
+@cl.on_app_startup
+def on_app_startup():
+    # Load the embedding model and open nutrition_db before the app reports ready
+    warmup()
+
+
 @cl.on_message
 async def on_message(message: cl.Message):
 
@@ -17,27 +23,7 @@ async def on_message(message: cl.Message):
     )
 
     msg = cl.Message(content="")
-    async for event in result.stream_events():
-        # Stream final message text to screen
-        if event.type == "raw_response_event" and isinstance(
-            event.data, ResponseTextDeltaEvent
-        ):
-            await msg.stream_token(token=event.data.delta)
-            print(event.data.delta, end="", flush=True)
-
-        elif (
-            event.type == "raw_response_event"
-            and hasattr(event.data, "item")
-            and hasattr(event.data.item, "type")
-            and event.data.item.type == "function_call"
-            and len(event.data.item.arguments) > 0
-        ):
-            with cl.Step(name=f"{event.data.item.name}", type="tool") as step:
-                step.input = event.data.item.arguments
-                print(
-                    f"\nTool call: {
-                        event.data.item.name} with args: {
-                        event.data.item.arguments}"
-                )
+    # Send the text in frames instead of one websocket message per token
+    await TokenStream(msg, echo=default_echo()).stream_events(result)
 
     await msg.update()
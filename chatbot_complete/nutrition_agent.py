@@ -1,3 +1,6 @@
+import asyncio
+import functools
+import time
 from pathlib import Path
 
 import chromadb
@@ -5,14 +8,72 @@ from agents import (
     Agent,
     function_tool,
 )
+from chromadb.errors import NotFoundError
 
 chroma_path = Path(__file__).parent.parent / "chroma"
-chroma_client = chromadb.PersistentClient(path=str(chroma_path))
-nutrition_db = chroma_client.get_collection(name="nutrition_db")
+
+# Set once the first real query ran, so its (cold start) duration gets logged
+_first_query_logged = False
+
+
+@functools.cache
+def get_nutrition_db() -> chromadb.Collection:
+    """Open the shared ChromaDB client and the nutrition_db collection on first use."""
+    start = time.perf_counter()
+    chroma_client = chromadb.PersistentClient(path=str(chroma_path))
+    try:
+        nutrition_db = chroma_client.get_collection(name="nutrition_db")
+    except NotFoundError as e:
+        raise RuntimeError(
+            f"The nutrition_db collection does not exist in {chroma_path}. "
+            "Create it with rag_setup/create_calorie_database.py."
+        ) from e
+
+    print(f"Opened nutrition_db in {time.perf_counter() - start:.3f}s")
+    return nutrition_db
+
+
+def query_nutrition_db(query_texts: list[str], n_results: int) -> dict:
+    """Embed and search the query texts in nutrition_db."""
+    global _first_query_logged
+
+    start = time.perf_counter()
+    results = get_nutrition_db().query(query_texts=query_texts, n_results=n_results)
+
+    if not _first_query_logged:
+        _first_query_logged = True
+        print(f"First nutrition_db query took {time.perf_counter() - start:.3f}s")
+
+    return results
+
+
+def warmup() -> None:
+    """
+    Open nutrition_db and load the embedding model by running a dummy query.
+    The chatbot apps call it on startup, so the first user doesn't pay for the cold start.
+    """
+    start = time.perf_counter()
+    query_nutrition_db(["banana"], n_results=1)
+    print(f"Warmed up nutrition_db in {time.perf_counter() - start:.3f}s")
+
+
+def format_nutrition_results(metadatas: list[dict]) -> list[str]:
+    """Format the metadata of the matched food items as lines for the agent."""
+    formatted_results = []
+    for metadata in metadatas:
+        food_item = metadata["food_item"].title()
+        calories = metadata["calories_per_100g"]
+        category = metadata["food_category"].title()
+
+        formatted_results.append(
+            f"{food_item} ({category}): {calories} calories per 100g"
+        )
+
+    return formatted_results
 
 
 @function_tool
-def calorie_lookup_tool(query: str, max_results: int = 3) -> str:
+async def calorie_lookup_tool(query: str, max_results: int = 3) -> str:
     """
     Tool function for a RAG database to look up calorie information for specific food items, but not for meals.
 
@@ -24,24 +85,50 @@ def calorie_lookup_tool(query: str, max_results: int = 3) -> str:
         A string containing the nutrition information.
     """
 
-    results = nutrition_db.query(query_texts=[query], n_results=max_results)
+    # The embedding and the search block, keep them off the event loop
+    results = await asyncio.to_thread(query_nutrition_db, [query], n_results=max_results)
 
     if not results["documents"][0]:
         return f"No nutrition information found for: {query}"
 
     # Format results for the agent
-    formatted_results = []
-    for i, doc in enumerate(results["documents"][0]):
-        metadata = results["metadatas"][0][i]
-        food_item = metadata["food_item"].title()
-        calories = metadata["calories_per_100g"]
-        category = metadata["food_category"].title()
+    formatted_results = format_nutrition_results(results["metadatas"][0])
 
-        formatted_results.append(
-            f"{food_item} ({category}): {calories} calories per 100g"
+    return "Nutrition Information:\n" + "\n".join(formatted_results)
+
+
+@function_tool
+async def calorie_lookup_batch_tool(foods: list[str], max_results: int = 3) -> str:
+    """
+    Tool function for a RAG database to look up calorie information for several food items at once, but not for meals.
+    Prefer this tool over calorie_lookup_tool when you need the calories of more than one ingredient.
+
+    Args:
+        foods: The food items to look up, one entry per food item.
+        max_results: The maximum number of results to return per food item.
+
+    Returns:
+        A string containing the nutrition information grouped per food item.
+    """
+
+    if not foods:
+        return "No food items were given to look up."
+
+    # A single query embeds and searches all the food items in one go
+    results = await asyncio.to_thread(query_nutrition_db, foods, n_results=max_results)
+
+    sections = []
+    for food, metadatas in zip(foods, results["metadatas"]):
+        if not metadatas:
+            sections.append(f"No nutrition information found for: {food}")
+            continue
+
+        formatted_results = format_nutrition_results(metadatas)
+        sections.append(
+            f"Nutrition Information for {food}:\n" + "\n".join(formatted_results)
         )
 
-    return "Nutrition Information:\n" + "\n".join(formatted_results)
+    return "\n\n".join(sections)
 
 
 nutrition_agent = Agent(
@@ -50,6 +137,7 @@ nutrition_agent = Agent(
     You are a helpful nutrition assistant giving out calorie information.
     You give concise answers.
     If you need to look up calorie information, use the calorie_lookup_tool.
+    If you need calorie information for several food items, look them all up at once with the calorie_lookup_batch_tool.
     """,
-    tools=[calorie_lookup_tool],
+    tools=[calorie_lookup_tool, calorie_lookup_batch_tool],
 )
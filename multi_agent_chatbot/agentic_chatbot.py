@@ -1,55 +1,212 @@
+import asyncio
 import os
+import re
+import time
 
 import chainlit as cl
 import dotenv
-from agents import InputGuardrailTripwireTriggered, Runner, SQLiteSession
-from nutrition_agent import exa_search_mcp, nutrition_agent
-from openai.types.responses import ResponseTextDeltaEvent
+from agents import InputGuardrailTripwireTriggered, Runner
+from answer_cache import SemanticAnswerCache
+from llm_scheduler import SchedulerOverloaded
+from meal_calculator import quantities
+from nutrition_agent import (
+    calorie_agent_with_search,
+    check_food_topic,
+    embed_queries,
+    exa_search_mcp,
+    get_topic_classifier,
+    nutrition_agent,
+    warmup,
+)
+from session_store import SessionStore, default_db_path
+from session_window import WindowedSession
+from telemetry import record_latency, setup_telemetry, shutdown_telemetry, timed
+from token_stream import TokenStream, default_echo
 
 dotenv.load_dotenv()
 
+# Conversation history of all users and chats, kept across restarts
+session_store = SessionStore(
+    os.getenv("SESSION_DB_PATH", default_db_path),
+    pool_size=int(os.getenv("SESSION_DB_POOL_SIZE", 4)),
+)
+
+# "blocking" runs the guarded agent, "speculative" starts the unguarded agent right
+# away, checks the message in parallel and cancels the run if the guardrail trips
+guardrail_mode = os.getenv("GUARDRAIL_MODE", "blocking")
+
+NOT_ABOUT_FOOD_REPLY = "Sorry, I can only help with questions about food."
+BUSY_REPLY = "Sorry, I'm getting too many questions right now. Please try again in a moment."
+
+
+def question_fingerprint(question: str) -> tuple[frozenset[str], frozenset[str]]:
+    """The foods and the quantities (numbers and units) a question mentions."""
+    return get_topic_classifier().food_words(question), quantities(question)
+
+
+# Answers to past single-turn questions, matched by meaning and by the foods and
+# quantities mentioned, so "200g of rice" never gets the answer for "100g of rice"
+answer_cache = None
+if os.getenv("ANSWER_CACHE", "1") == "1":
+    answer_cache = SemanticAnswerCache(
+        embed_queries,
+        fingerprint=question_fingerprint,
+        max_distance=float(os.getenv("ANSWER_CACHE_MAX_DISTANCE", 0.35)),
+        maxsize=int(os.getenv("ANSWER_CACHE_SIZE", 1024)),
+        ttl=float(os.getenv("ANSWER_CACHE_TTL_SECONDS", 24 * 3600)),
+    )
+
+
+@cl.on_app_startup
+def on_app_startup():
+    # Export spans and latency histograms if TELEMETRY_EXPORTER is set
+    setup_telemetry()
+    # Load the embedding model and open nutrition_db before the app reports ready
+    if os.getenv("NUTRITION_WARMUP", "1") == "1":
+        warmup()
+
+
+@cl.on_app_shutdown
+async def on_app_shutdown():
+    await exa_search_mcp.cleanup()
+    session_store.close()
+    shutdown_telemetry()
+
 
 @cl.on_chat_start
 async def on_chat_start():
-    session = SQLiteSession("conversation_history")
+    # One history per authenticated user and chat
+    user = cl.user_session.get("user")
+    session = session_store.session(
+        user.identifier if user else "anonymous", cl.context.session.thread_id, history_limit=None
+    )
+    # Only replay the recent turns, older ones are folded into a summary. The window
+    # bounds the history instead of history_limit, the summary needs all of it.
+    session = WindowedSession(
+        session,
+        max_turns=int(os.getenv("HISTORY_MAX_TURNS", 6)),
+        token_budget=int(os.getenv("HISTORY_TOKEN_BUDGET", 4000)),
+    )
     cl.user_session.set("agent_session", session)
-    # This is the only change in this file compared to the chatbot/agentic_chatbot.py file
+    # Only the first chat opens the connection, later chats reuse it
     await exa_search_mcp.connect()
 
 
+async def release_if_on_topic(verdict_task: asyncio.Task, stream: TokenStream, result) -> None:
+    """Show the speculative answer once the guardrail passed, cancel the run otherwise."""
+    if (await verdict_task).only_about_food:
+        await stream.release()
+    else:
+        result.cancel()
+
+
+async def stream_cached_answer(answer: str) -> None:
+    msg = cl.Message(content="")
+    stream = TokenStream(msg, echo=default_echo())
+    for token in re.split(r"(\s+)", answer):
+        await stream.write(token)
+    await stream.flush()
+    await msg.update()
+
+
+def passed_guardrails(result) -> bool:
+    """
+    Whether the input guardrails of a finished streamed run all completed without tripping.
+    A streamed run that finishes before its guardrails cancels them instead of waiting,
+    so a final output alone doesn't prove the question was checked.
+    """
+    return bool(result.input_guardrail_results) and not any(
+        guardrail.output.tripwire_triggered for guardrail in result.input_guardrail_results
+    )
+
+
 @cl.on_message
 async def on_message(message: cl.Message):
+    with timed("chat.turn", guardrail_mode=guardrail_mode) as attributes:
+        await answer_message(message, attributes)
+
+
+async def answer_message(message: cl.Message, attributes: dict) -> None:
+    started = time.perf_counter()
     session = cl.user_session.get("agent_session")
 
+    # Only questions without earlier context can be answered from the cache. Serving a
+    # cached answer skips the guardrail, which is safe because only answers to questions
+    # that passed it are ever put into the cache (see passed_guardrails)
+    use_answer_cache = answer_cache is not None and not await session.has_items()
+    if use_answer_cache:
+        answer = await asyncio.to_thread(answer_cache.get, message.content)
+        attributes["answer_cache_hit"] = answer is not None
+        if answer is not None:
+            await stream_cached_answer(answer)
+            await session.add_items(
+                [
+                    {"role": "user", "content": message.content},
+                    {"role": "assistant", "content": answer},
+                ]
+            )
+            await session.flush()
+            return
+
+    verdict_task = None
+    agent = nutrition_agent
+    if guardrail_mode == "speculative":
+        verdict_task = asyncio.create_task(check_food_topic(message.content))
+        agent = calorie_agent_with_search
+
     result = Runner.run_streamed(
-        nutrition_agent,
+        agent,
         message.content,
         session=session,
     )
 
     msg = cl.Message(content="")
-    async for event in result.stream_events():
-        # Stream final message text to screen
-        if event.type == "raw_response_event" and isinstance(
-            event.data, ResponseTextDeltaEvent
-        ):
-            await msg.stream_token(token=event.data.delta)
-            print(event.data.delta, end="", flush=True)
-
-        elif (
-            event.type == "raw_response_event"
-            and hasattr(event.data, "item")
-            and hasattr(event.data.item, "type")
-            and event.data.item.type == "function_call"
-            and len(event.data.item.arguments) > 0
+    # The speculative answer is held back until the guardrail check passed
+    stream = TokenStream(msg, echo=default_echo(), held=verdict_task is not None)
+    release_task = None
+    if verdict_task is not None:
+        release_task = asyncio.create_task(release_if_on_topic(verdict_task, stream, result))
+
+    try:
+        await stream.stream_events(result)
+        if stream.first_token_at is not None:
+            record_latency(
+                "chat.turn.time_to_first_token",
+                stream.first_token_at - started,
+                {"guardrail_mode": guardrail_mode},
+            )
+
+        on_topic = True
+        if release_task is not None:
+            await release_task
+            on_topic = verdict_task.result().only_about_food
+
+        if not on_topic:
+            # The speculative run was cancelled, it never showed a token
+            attributes["guardrail_tripped"] = True
+            stream.discard()
+            msg.content = NOT_ABOUT_FOOD_REPLY
+
+        # Only answers that passed the guardrail make it into the cache
+        elif use_answer_cache and result.final_output and (
+            verdict_task is not None or passed_guardrails(result)
         ):
-            with cl.Step(name=f"{event.data.item.name}", type="tool") as step:
-                step.input = event.data.item.arguments
-                print(
-                    f"\nTool call: {
-                        event.data.item.name} with args: {
-                        event.data.item.arguments}"
-                )
+            await asyncio.to_thread(answer_cache.put, message.content, str(result.final_output))
+
+    except InputGuardrailTripwireTriggered:
+        attributes["guardrail_tripped"] = True
+        stream.discard()
+        msg.content = NOT_ABOUT_FOOD_REPLY
+
+    except SchedulerOverloaded:
+        # The model calls were shed, answer right away instead of queueing the user
+        attributes["overloaded"] = True
+        stream.discard()
+        msg.content = BUSY_REPLY
+
+    finally:
+        # Write the items of this turn to the history in one go, even if the run failed
+        await session.flush()
 
     await msg.update()
 
@@ -0,0 +1,134 @@
+"""
+Semantic cache of whole agent answers to single-turn questions.
+
+Many questions are paraphrases of each other ("calories in a banana", "how many
+kcal does a banana have") and each one runs the full agent loop with its tool
+calls. The cache embeds the question with the same embedding function as
+nutrition_db and returns the answer of a past question that is close enough.
+
+Paraphrases about different foods ("calories in an apple") are close in
+embedding space too, so a question only matches past questions with the same
+fingerprint, e.g. the set of food names it mentions.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Hashable
+
+import numpy as np
+
+
+@dataclass
+class CachedAnswer:
+    question: str
+    answer: str
+    embedding: np.ndarray
+    fingerprint: Hashable
+    expires_at: float
+
+
+class SemanticAnswerCache:
+    """A size-bounded LRU cache of answers, looked up by the embedding of the question."""
+
+    def __init__(
+        self,
+        embed: Callable[[list[str]], list],
+        fingerprint: Callable[[str], Hashable] | None = None,
+        max_distance: float = 0.35,
+        maxsize: int = 1024,
+        ttl: float = 24 * 3600,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Args:
+            embed: Embeds a list of texts, e.g. the embedding function of nutrition_db.
+            fingerprint: Must be equal for a question and a cached question to match.
+            max_distance: The maximum squared L2 distance of the normalized embeddings.
+            maxsize: The maximum number of answers before the least recently used is evicted.
+            ttl: How many seconds an answer stays valid.
+            clock: The time source, in seconds.
+        """
+        self.embed = embed
+        self.fingerprint = fingerprint or (lambda question: None)
+        self.max_distance = max_distance
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _embed(self, question: str) -> np.ndarray:
+        embedding = np.asarray(self.embed([question])[0], dtype=np.float32)
+        return embedding / np.linalg.norm(embedding)
+
+    def get(self, question: str) -> str | None:
+        """Return the answer of the closest cached question, or None if none is close enough."""
+        embedding = self._embed(question)
+        fingerprint = self.fingerprint(question)
+
+        with self._lock:
+            now = self._clock()
+            expired = [key for key, entry in self._entries.items() if entry.expires_at <= now]
+            for key in expired:
+                del self._entries[key]
+            self.expirations += len(expired)
+
+            candidates = [
+                (key, entry)
+                for key, entry in self._entries.items()
+                if entry.fingerprint == fingerprint
+            ]
+            if candidates:
+                matrix = np.stack([entry.embedding for _, entry in candidates])
+                # For unit vectors the squared L2 distance is 2 - 2 * cosine similarity
+                distances = 2.0 - 2.0 * (matrix @ embedding)
+                best = int(np.argmin(distances))
+                if distances[best] <= self.max_distance:
+                    key, entry = candidates[best]
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry.answer
+
+            self.misses += 1
+            return None
+
+    def put(self, question: str, answer: str) -> None:
+        entry = CachedAnswer(
+            question=question,
+            answer=answer,
+            embedding=self._embed(question),
+            fingerprint=self.fingerprint(question),
+            expires_at=self._clock() + self.ttl,
+        )
+
+        with self._lock:
+            self._entries[self._next_id] = entry
+            self._next_id += 1
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
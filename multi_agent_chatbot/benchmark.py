@@ -0,0 +1,93 @@
+"""
+End-to-end benchmark of the nutrition agents.
+
+Runs a list of questions through an agent with streaming and reports the time
+to the first text delta, the total time, the model requests and the tool calls
+of every run. Combined with replay.py it runs offline and deterministically:
+
+    AGENT_REPLAY_MODE=record python benchmark.py
+    AGENT_REPLAY_MODE=replay python benchmark.py --repeat 5
+"""
+
+import argparse
+import asyncio
+import time
+
+import numpy as np
+from agents import Runner
+from openai.types.responses import ResponseTextDeltaEvent
+
+import nutrition_agent
+
+DEFAULT_QUESTIONS = [
+    "How many calories are in a banana?",
+    "How many calories are in overnight oats?",
+    "What are the calories of a caesar salad?",
+]
+
+
+async def run_question(agent, question: str) -> dict:
+    started = time.perf_counter()
+    first_token = None
+    tool_calls = 0
+
+    result = Runner.run_streamed(agent, question)
+    async for event in result.stream_events():
+        if event.type == "raw_response_event" and isinstance(
+            event.data, ResponseTextDeltaEvent
+        ):
+            if first_token is None:
+                first_token = time.perf_counter() - started
+        elif event.type == "run_item_stream_event" and event.name == "tool_called":
+            tool_calls += 1
+
+    return {
+        "question": question,
+        "first_token": first_token,
+        "total": time.perf_counter() - started,
+        "requests": result.context_wrapper.usage.requests,
+        "tool_calls": tool_calls,
+    }
+
+
+async def main(agent_name: str, questions: list[str], repeat: int, concurrency: int):
+    agent = getattr(nutrition_agent, agent_name)
+    await nutrition_agent.exa_search_mcp.connect()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(question: str) -> dict:
+        async with semaphore:
+            return await run_question(agent, question)
+
+    try:
+        runs = await asyncio.gather(*(run(q) for _ in range(repeat) for q in questions))
+    finally:
+        await nutrition_agent.exa_search_mcp.cleanup()
+
+    for run_stats in runs:
+        first_token = run_stats["first_token"]
+        print(
+            f"{run_stats['question'][:40]:<40} "
+            f"first token {first_token * 1000 if first_token else float('nan'):8.1f} ms, "
+            f"total {run_stats['total'] * 1000:8.1f} ms, "
+            f"{run_stats['requests']} requests, {run_stats['tool_calls']} tool calls"
+        )
+
+    totals = [run_stats["total"] for run_stats in runs]
+    print(
+        f"\n{len(runs)} runs: p50 {np.percentile(totals, 50) * 1000:.1f} ms, "
+        f"p99 {np.percentile(totals, 99) * 1000:.1f} ms"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--agent", default="nutrition_agent")
+    parser.add_argument("--question", action="append", dest="questions")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=1)
+    args = parser.parse_args()
+
+    asyncio.run(
+        main(args.agent, args.questions or DEFAULT_QUESTIONS, args.repeat, args.concurrency)
+    )
@@ -0,0 +1,361 @@
+"""
+Benchmarks of the retrieval, ingestion, session and streaming hot paths.
+
+Writes the results as JSON, tagged with the current commit, so that runs on
+different commits can be compared:
+
+    python benchmark_hot_paths.py --output ../benchmark_results/$(git rev-parse --short HEAD).json
+    python benchmark_hot_paths.py --compare ../benchmark_results/old.json ../benchmark_results/new.json
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+repo_path = Path(__file__).parent.parent
+sys.path.insert(0, str(repo_path / "rag_setup"))
+
+from create_calorie_database import create_calorie_text_database, ingest_calorie_database  # noqa: E402
+
+default_csv_path = repo_path / "data" / "calories.csv"
+
+
+def latency_stats(durations: list[float]) -> dict:
+    return {
+        "count": len(durations),
+        "p50_ms": float(np.percentile(durations, 50) * 1000),
+        "p99_ms": float(np.percentile(durations, 99) * 1000),
+        "qps": len(durations) / sum(durations) if sum(durations) else 0.0,
+    }
+
+
+def scaled_csv(csv_path: Path, scale: int, out_dir: Path) -> Path:
+    """Repeat the CSV `scale` times with numbered food names, so every row stays unique."""
+    if scale == 1:
+        return csv_path
+
+    df = pd.read_csv(csv_path)
+    copies = []
+    for i in range(scale):
+        copy = df.copy()
+        if i:
+            copy["FoodItem"] = copy["FoodItem"] + f" #{i}"
+        copies.append(copy)
+
+    out_path = out_dir / f"calories_x{scale}.csv"
+    pd.concat(copies, ignore_index=True).to_csv(out_path, index=False)
+    return out_path
+
+
+def benchmark_lookup(queries: int, max_results_values: list[int]) -> dict:
+    """
+    Latency of calorie_lookup_tool, cold and warm.
+
+    The queries are phrased like a user would, so that none is answered by the exact or
+    fuzzy name index. The cold pass starts with an empty lookup cache and an empty
+    embedding cache, so every query is embedded and searched; the warm pass repeats it.
+    """
+    import nutrition_agent
+    from agents.tool_context import ToolContext
+    from embedding_cache import CachedEmbeddingFunction, EmbeddingCache
+
+    food_index = nutrition_agent.get_food_index()
+    foods = [food["food_item"] for food in food_index.foods]
+    rng = np.random.default_rng(0)
+    phrasings = ["calories in {}s", "how many calories does {} have", "nutrition facts of {}"]
+    texts = [
+        rng.choice(phrasings).format(name)
+        for name in rng.choice(foods, size=min(len(foods), queries * 2), replace=False)
+    ]
+    # Only queries that miss the name index reach the embedding and the vector search
+    texts = [text for text in texts if food_index.lookup(text)[1] is None]
+    texts = texts[:queries]
+
+    async def call(query: str, max_results: int) -> float:
+        ctx = ToolContext(context=None, tool_name="calorie_lookup_tool", tool_call_id="benchmark")
+        arguments = json.dumps({"query": query, "max_results": max_results})
+        started = time.perf_counter()
+        await nutrition_agent.calorie_lookup_tool.on_invoke_tool(ctx, arguments)
+        return time.perf_counter() - started
+
+    async def run(tmp: Path) -> dict:
+        results = {}
+        embedding_function = nutrition_agent.embed_queries.embedding_function
+        for max_results in max_results_values:
+            nutrition_agent.lookup_cache.invalidate()
+            nutrition_agent.embed_queries = CachedEmbeddingFunction(
+                embedding_function,
+                EmbeddingCache(tmp / f"embeddings_{max_results}.sqlite3", "benchmark"),
+            )
+            cold = [await call(text, max_results) for text in texts]
+            warm = [await call(text, max_results) for text in texts]
+            results[f"max_results_{max_results}"] = {
+                "cold": latency_stats(cold),
+                "warm": latency_stats(warm),
+            }
+        return results
+
+    started = time.perf_counter()
+    nutrition_agent.warmup()
+    warmup_s = time.perf_counter() - started
+
+    embed_queries = nutrition_agent.embed_queries
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            results = asyncio.run(run(Path(tmp)))
+    finally:
+        nutrition_agent.embed_queries = embed_queries
+    results["warmup_s"] = warmup_s
+    results["lookup_stats"] = dict(nutrition_agent.lookup_stats)
+    return results
+
+
+def benchmark_ingestion(csv_path: Path, text_scales: list[int], build_scales: list[int]) -> dict:
+    """Time to write the text database and to build the collection from scratch."""
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        for scale in sorted(set(text_scales) | set(build_scales)):
+            scaled_path = scaled_csv(csv_path, scale, tmp)
+            results[f"x{scale}"] = {"rows": len(pd.read_csv(scaled_path))}
+
+            if scale in text_scales:
+                started = time.perf_counter()
+                create_calorie_text_database(str(scaled_path), str(tmp / f"text_x{scale}.txt"))
+                results[f"x{scale}"]["text_database_s"] = time.perf_counter() - started
+
+            if scale in build_scales:
+                chroma_path = tmp / f"chroma_x{scale}"
+                started = time.perf_counter()
+                ingest_calorie_database(str(scaled_path), str(chroma_path))
+                results[f"x{scale}"]["collection_build_s"] = time.perf_counter() - started
+
+                # A second run with an unchanged CSV only compares the row hashes
+                started = time.perf_counter()
+                ingest_calorie_database(str(scaled_path), str(chroma_path))
+                results[f"x{scale}"]["collection_resync_s"] = time.perf_counter() - started
+
+    return results
+
+
+def history_items(turn: int) -> list[dict]:
+    """The items of one turn with a tool call, about the size of a real calorie lookup."""
+    return [
+        {"role": "user", "content": f"How many calories are in meal {turn}?"},
+        {
+            "type": "function_call",
+            "call_id": f"call_{turn}",
+            "name": "calorie_lookup_tool",
+            "arguments": json.dumps({"query": f"meal {turn}", "max_results": 3}),
+        },
+        {"type": "function_call_output", "call_id": f"call_{turn}", "output": "x" * 600},
+        {"role": "assistant", "content": "y" * 400},
+    ]
+
+
+def benchmark_sessions(history_sizes: list[int], samples: int) -> dict:
+    """Cost of one turn's write and of reading the history, as the history grows."""
+    from agents import SQLiteSession
+    from session_store import SessionStore
+
+    async def measure(session, flush) -> dict:
+        results = {}
+        turn = 0
+        for size in history_sizes:
+            # Grow the history to `size` turns
+            while turn < size:
+                await session.add_items(history_items(turn))
+                await flush()
+                turn += 1
+
+            writes, reads, recent_reads = [], [], []
+            for _ in range(samples):
+                started = time.perf_counter()
+                await session.add_items(history_items(turn))
+                await flush()
+                writes.append(time.perf_counter() - started)
+                await session.pop_item()
+                await session.pop_item()
+                await session.pop_item()
+                await session.pop_item()
+
+                started = time.perf_counter()
+                await session.get_items()
+                reads.append(time.perf_counter() - started)
+
+                started = time.perf_counter()
+                await session.get_items(limit=20)
+                recent_reads.append(time.perf_counter() - started)
+
+            results[f"turns_{size}"] = {
+                "write_turn": latency_stats(writes),
+                "read_history": latency_stats(reads),
+                "read_recent_20": latency_stats(recent_reads),
+            }
+        return results
+
+    async def noop():
+        pass
+
+    async def run() -> dict:
+        with tempfile.TemporaryDirectory() as tmp:
+            sqlite_session = SQLiteSession("benchmark", str(Path(tmp) / "sqlite_session.db"))
+            store = SessionStore(Path(tmp) / "session_store.db")
+            user_session = store.session("benchmark", "benchmark", history_limit=None)
+            try:
+                return {
+                    "sqlite_session": await measure(sqlite_session, noop),
+                    "session_store": await measure(user_session, user_session.flush),
+                }
+            finally:
+                sqlite_session.close()
+                store.close()
+
+    return asyncio.run(run())
+
+
+def benchmark_streaming(tokens: int, emit_cost: float) -> dict:
+    """Overhead per token of streaming token by token versus in coalesced frames."""
+    from token_stream import TokenStream
+
+    class FakeMessage:
+        """Stands in for cl.Message, `emit_cost` seconds of CPU per websocket emit."""
+
+        def __init__(self):
+            self.content = ""
+            self.emits = 0
+
+        async def stream_token(self, token: str):
+            self.content += token
+            self.emits += 1
+            busy_until = time.perf_counter() + emit_cost
+            while time.perf_counter() < busy_until:
+                pass
+
+    deltas = [f"tok{i} " for i in range(tokens)]
+
+    async def per_token() -> FakeMessage:
+        msg = FakeMessage()
+        for delta in deltas:
+            await msg.stream_token(token=delta)
+        return msg
+
+    async def coalesced() -> FakeMessage:
+        msg = FakeMessage()
+        stream = TokenStream(msg)
+        for delta in deltas:
+            await stream.write(delta)
+        await stream.flush()
+        return msg
+
+    results = {}
+    for name, handler in [("per_token", per_token), ("coalesced", coalesced)]:
+        started = time.perf_counter()
+        msg = asyncio.run(handler())
+        duration = time.perf_counter() - started
+        results[name] = {
+            "tokens": tokens,
+            "emits": msg.emits,
+            "us_per_token": duration / tokens * 1e6,
+        }
+    return results
+
+
+def current_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=repo_path,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def flatten(results: dict, prefix: str = "") -> dict:
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def compare(old_path: str, new_path: str) -> None:
+    """Print every metric of two result files with its relative change."""
+    with open(old_path, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(new_path, encoding="utf-8") as f:
+        new = json.load(f)
+
+    print(f"{old.get('commit')} -> {new.get('commit')}")
+    old_flat, new_flat = flatten(old["results"]), flatten(new["results"])
+    for key in sorted(old_flat.keys() & new_flat.keys()):
+        before, after = old_flat[key], new_flat[key]
+        change = (after - before) / before * 100 if before else float("nan")
+        print(f"{key:<70} {before:12.3f} {after:12.3f} {change:+8.1f}%")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--only", nargs="+", choices=["lookup", "ingestion", "sessions", "streaming"]
+    )
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    parser.add_argument("--csv-path", default=str(default_csv_path))
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--max-results", type=int, nargs="+", default=[1, 3, 5, 10])
+    parser.add_argument("--text-scales", type=int, nargs="+", default=[1, 10, 100])
+    # Building the collection embeds every row, 100x takes a long time on a CPU
+    parser.add_argument("--build-scales", type=int, nargs="+", default=[1, 10])
+    parser.add_argument("--history-sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--session-samples", type=int, default=20)
+    parser.add_argument("--tokens", type=int, default=2000)
+    parser.add_argument("--emit-cost-us", type=float, default=50)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        sys.exit()
+
+    benchmarks = {
+        "lookup": lambda: benchmark_lookup(args.queries, args.max_results),
+        "ingestion": lambda: benchmark_ingestion(
+            Path(args.csv_path), args.text_scales, args.build_scales
+        ),
+        "sessions": lambda: benchmark_sessions(args.history_sizes, args.session_samples),
+        "streaming": lambda: benchmark_streaming(args.tokens, args.emit_cost_us / 1e6),
+    }
+
+    report = {
+        "commit": current_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": {},
+    }
+    for name in args.only or benchmarks:
+        print(f"Running the {name} benchmark")
+        report["results"][name] = benchmarks[name]()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(output, encoding="utf-8")
+        print(f"Wrote {args.output}")
+    else:
+        print(output)
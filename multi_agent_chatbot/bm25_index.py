@@ -0,0 +1,226 @@
+"""
+BM25 keyword search over the food names and categories of nutrition_db.
+
+Embedding search sometimes ranks a semantically close food above the one the
+user named word for word, e.g. a brand or a variety. The BM25 index scores the
+exact words instead, and `reciprocal_rank_fusion` merges both rankings. The
+index is built when the collection is ingested and stored as JSON next to the
+chroma/ directory, together with the version of the collection it was built from.
+"""
+
+import json
+import math
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+from collection_version import atomic_output
+from food_index import fold_food_name
+
+
+def default_bm25_path(chroma_path: str | Path) -> Path:
+    """The index file that belongs to a Chroma directory, e.g. chroma -> chroma_bm25.json."""
+    chroma_path = Path(chroma_path)
+    return chroma_path.with_name(chroma_path.name + "_bm25.json")
+
+
+# The postings as arrays, for memory-mapping: the words, and for the i-th word the
+# positions and weights at offsets[i]:offsets[i + 1]
+VOCABULARY_FILE = "bm25_vocabulary.json"
+OFFSETS_FILE = "bm25_offsets.npy"
+POSITIONS_FILE = "bm25_positions.npy"
+WEIGHTS_FILE = "bm25_weights.npy"
+
+
+def tokenize(text: str) -> list[str]:
+    return fold_food_name(text).split()
+
+
+def food_tokens(metadata: dict) -> list[str]:
+    """The words a food item is found by: its name and its category."""
+    return tokenize(metadata["food_item"]) + tokenize(metadata["food_category"])
+
+
+class BM25Index:
+    """Okapi BM25 over short documents, scored with NumPy."""
+
+    def __init__(
+        self,
+        ids: list[str],
+        metadatas: list[dict] | None,
+        k1: float = 1.2,
+        b: float = 0.75,
+        version: str | None = None,
+        postings: dict | None = None,
+    ):
+        """
+        Args:
+            ids: The ids of the food items in the collection.
+            metadatas: Their metadata, with at least "food_item" and "food_category".
+                Only needed to build the postings and for `search_many`.
+            k1: How quickly repeated words stop adding to the score.
+            b: How much the score is normalized by the document length.
+            version: The version of the collection the index was built from.
+            postings: The positions and weights of every word, as loaded by `load_arrays`,
+                instead of building them from the metadata.
+        """
+        self.ids = ids
+        self.metadatas = metadatas
+        self.version = version
+        if postings is not None:
+            self._postings = postings
+            return
+
+        documents = [food_tokens(metadata) for metadata in metadatas]
+        lengths = np.array([len(tokens) for tokens in documents], dtype=np.float32)
+        average_length = lengths.mean() if len(lengths) else 0.0
+        norms = k1 * (1 - b + b * lengths / max(average_length, 1e-9))
+
+        postings = defaultdict(lambda: defaultdict(int))
+        for position, tokens in enumerate(documents):
+            for token in tokens:
+                postings[token][position] += 1
+
+        # Precompute the BM25 weight of every (word, document) pair
+        self._postings = {}
+        for token, counts in postings.items():
+            positions = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+            tf = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+            idf = math.log(1 + (len(documents) - len(counts) + 0.5) / (len(counts) + 0.5))
+            weights = idf * tf * (k1 + 1) / (tf + norms[positions])
+            self._postings[token] = (positions, weights.astype(np.float32))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def save(self, path: str | Path) -> None:
+        """Write the index atomically, readers never see a half-written file."""
+        with atomic_output(path) as tmp, open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": self.version, "ids": self.ids, "metadatas": self.metadatas}, f)
+
+    @classmethod
+    def load(cls, path: str | Path) -> "BM25Index":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["ids"], data["metadatas"], version=data.get("version"))
+
+    def save_arrays(self, out_dir: str | Path) -> None:
+        """Write the postings as .npy arrays, which `load_arrays` memory-maps."""
+        out_dir = Path(out_dir)
+        tokens = sorted(self._postings)
+        lengths = [len(self._postings[token][0]) for token in tokens]
+        offsets = np.zeros(len(tokens) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        empty = [np.empty(0)]
+
+        arrays = {
+            OFFSETS_FILE: offsets,
+            POSITIONS_FILE: np.concatenate(
+                [self._postings[token][0] for token in tokens] or empty
+            ).astype(np.int32),
+            WEIGHTS_FILE: np.concatenate(
+                [self._postings[token][1] for token in tokens] or empty
+            ).astype(np.float32),
+        }
+        for file_name, array in arrays.items():
+            with atomic_output(out_dir / file_name) as tmp, open(tmp, "wb") as f:
+                np.save(f, array)
+        with atomic_output(out_dir / VOCABULARY_FILE) as tmp, open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": self.version, "tokens": tokens}, f)
+
+    @classmethod
+    def load_arrays(
+        cls, index_dir: str | Path, ids: list[str], metadatas: list[dict] | None = None
+    ) -> "BM25Index":
+        """
+        Memory-map the postings written by `save_arrays`, so that worker processes share
+        their pages. `ids` (and `metadatas`) must be in the order the index was built in.
+        """
+        index_dir = Path(index_dir)
+        with open(index_dir / VOCABULARY_FILE, encoding="utf-8") as f:
+            vocabulary = json.load(f)
+        offsets = np.load(index_dir / OFFSETS_FILE)
+        positions = np.load(index_dir / POSITIONS_FILE, mmap_mode="r")
+        weights = np.load(index_dir / WEIGHTS_FILE, mmap_mode="r")
+
+        # Views into the mapped arrays, nothing is copied
+        postings = {
+            token: (positions[start:end], weights[start:end])
+            for token, start, end in zip(vocabulary["tokens"], offsets[:-1], offsets[1:])
+        }
+        return cls(ids, metadatas, version=vocabulary["version"], postings=postings)
+
+    @classmethod
+    def from_collection(
+        cls, collection, batch_size: int = 1000, version: str | None = None
+    ) -> "BM25Index":
+        ids, metadatas = [], []
+        for offset in range(0, collection.count(), batch_size):
+            batch = collection.get(limit=batch_size, offset=offset, include=["metadatas"])
+            ids.extend(batch["ids"])
+            metadatas.extend(batch["metadatas"])
+        return cls(ids, metadatas, version=version)
+
+    @classmethod
+    def load_or_build(
+        cls,
+        collection,
+        path: str | Path,
+        version: str | None = None,
+    ) -> "BM25Index":
+        """
+        Load the index, building it from the collection first if there is none or if
+        it was built from another `version` of the collection.
+        """
+        path = Path(path)
+        if path.exists():
+            index = cls.load(path)
+            if version is None or index.version == version:
+                return index
+        index = cls.from_collection(collection, version=version)
+        index.save(path)
+        return index
+
+    def search(self, query: str, n_results: int = 10) -> list[int]:
+        """The positions of the best matching food items, best first. Only items sharing a word."""
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        for token in set(tokenize(query)):
+            if token in self._postings:
+                positions, weights = self._postings[token]
+                scores[positions] += weights
+
+        matched = np.flatnonzero(scores)
+        if len(matched) > n_results:
+            matched = matched[np.argpartition(-scores[matched], n_results - 1)[:n_results]]
+        return matched[np.argsort(-scores[matched], kind="stable")].tolist()
+
+    def search_many(self, queries: list[str], n_results: int = 10) -> dict:
+        """Like Collection.query: the ids and metadatas of the best matches of each query."""
+        results = {"ids": [], "metadatas": []}
+        for query in queries:
+            positions = self.search(query, n_results)
+            results["ids"].append([self.ids[i] for i in positions])
+            results["metadatas"].append([self.metadatas[i] for i in positions])
+        return results
+
+
+def reciprocal_rank_fusion(
+    rankings: list[list[str]], n_results: int, k: int = 60
+) -> list[str]:
+    """
+    Merge rankings of ids: every id scores 1 / (k + rank) in each ranking it appears in.
+
+    Args:
+        rankings: Lists of ids, best first.
+        n_results: How many ids to return.
+        k: Dampens the weight of the top ranks, 60 as in the original RRF paper.
+
+    Returns:
+        The ids with the highest fused score, best first.
+    """
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, id_ in enumerate(ranking, start=1):
+            scores[id_] += 1.0 / (k + rank)
+    # sorted() is stable, so ties keep the order of the first ranking
+    return sorted(scores, key=scores.get, reverse=True)[:n_results]
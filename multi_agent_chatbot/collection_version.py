@@ -0,0 +1,80 @@
+"""
+The version of the nutrition_db collection, recorded by ingestion.
+
+The files derived from the collection (the NumPy export, the BM25 index, the
+cached lookups) need to know when the collection changed. The mtime of
+chroma.sqlite3 can't tell: merely opening the collection with a
+PersistentClient touches it. Ingestion instead writes a digest of the ids and
+row hashes of all food items to chroma_version.txt, next to the chroma/
+directory, and only when the digest changed. The derived files store the
+version they were built from and are rebuilt when it differs.
+"""
+
+import hashlib
+import os
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+
+def default_version_path(chroma_path: str | Path) -> Path:
+    """The version file that belongs to a Chroma directory, e.g. chroma -> chroma_version.txt."""
+    chroma_path = Path(chroma_path)
+    return chroma_path.with_name(chroma_path.name + "_version.txt")
+
+
+def collection_version(ids: list[str], row_hashes: list[str | None]) -> str:
+    """A digest of the food items, independent of their order."""
+    digest = hashlib.sha256()
+    for id_, row_hash in sorted(zip(ids, row_hashes), key=lambda pair: pair[0]):
+        digest.update(f"{id_}:{row_hash or ''}\n".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def compute_version(collection, batch_size: int = 1000) -> str:
+    """The version of a collection computed from its stored row hashes."""
+    ids, row_hashes = [], []
+    for offset in range(0, collection.count(), batch_size):
+        batch = collection.get(limit=batch_size, offset=offset, include=["metadatas"])
+        ids.extend(batch["ids"])
+        row_hashes.extend((metadata or {}).get("row_hash") for metadata in batch["metadatas"])
+    return collection_version(ids, row_hashes)
+
+
+def read_version(path: str | Path) -> str | None:
+    """The version stored in a version file, or None if there is none."""
+    try:
+        return Path(path).read_text(encoding="utf-8").strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def write_version(path: str | Path, version: str) -> bool:
+    """
+    Write a version file, unless it already holds `version`, so that its mtime only
+    changes with the collection.
+
+    Returns:
+        Whether the file was written.
+    """
+    if read_version(path) == version:
+        return False
+    with atomic_output(path) as tmp:
+        tmp.write_text(version, encoding="utf-8")
+    return True
+
+
+@contextmanager
+def atomic_output(path: str | Path):
+    """
+    Yield a temporary path next to `path` and rename it over `path` once the block
+    succeeds. Readers see the old or the new file, never a half-written one, and
+    processes still memory-mapping the old file keep their (unlinked) copy.
+    """
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+    try:
+        yield tmp
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
@@ -0,0 +1,127 @@
+"""
+Disk-backed cache of query embeddings, shared by all worker processes.
+
+Embedding the query is the main CPU cost of a calorie lookup, and an in-memory
+cache is lost on every restart. The embeddings are stored in an SQLite table in
+WAL mode, so several processes can read it concurrently while one writes.
+"""
+
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+
+import numpy as np
+
+default_cache_path = Path(__file__).parent.parent / ".cache" / "embeddings.sqlite3"
+
+
+def embedding_key(model_name: str, text: str) -> str:
+    """The cache key of a text embedded with the given model."""
+    return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Persistent text -> embedding cache keyed by a hash of the model name and the text."""
+
+    def __init__(self, db_path: str | Path = default_cache_path, model_name: str = ""):
+        """
+        Args:
+            db_path: The SQLite database file, shared by all processes on the host.
+            model_name: The embedding model, part of the key so models never mix.
+        """
+        self.db_path = Path(db_path)
+        self.model_name = model_name
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    dim INTEGER NOT NULL,
+                    vector BLOB NOT NULL
+                )
+                """
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, texts: list[str]) -> list[np.ndarray | None]:
+        """Return the cached embedding of each text, or None where it isn't cached."""
+        keys = [embedding_key(self.model_name, text) for text in texts]
+        placeholders = ",".join("?" * len(keys))
+        rows = self._connection().execute(
+            f"SELECT key, dim, vector FROM embeddings WHERE key IN ({placeholders})",
+            keys,
+        )
+        found = {
+            key: np.frombuffer(vector, dtype=np.float32, count=dim)
+            for key, dim, vector in rows
+        }
+
+        vectors = [found.get(key) for key in keys]
+        hits = sum(vector is not None for vector in vectors)
+        self.hits += hits
+        self.misses += len(vectors) - hits
+        return vectors
+
+    def put_many(self, texts: list[str], vectors: list) -> None:
+        rows = []
+        for text, vector in zip(texts, vectors):
+            vector = np.asarray(vector, dtype=np.float32)
+            rows.append(
+                (
+                    embedding_key(self.model_name, text),
+                    self.model_name,
+                    vector.shape[0],
+                    vector.tobytes(),
+                )
+            )
+
+        with self._connection() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, dim, vector) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class CachedEmbeddingFunction:
+    """Wraps a Chroma embedding function, only embedding texts missing from the cache."""
+
+    def __init__(self, embedding_function, cache: EmbeddingCache):
+        self.embedding_function = embedding_function
+        self.cache = cache
+
+    def __call__(self, input: list[str]) -> list[np.ndarray]:
+        vectors = self.cache.get_many(input)
+
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            texts = [input[i] for i in missing]
+            computed = self.embedding_function(texts)
+            self.cache.put_many(texts, computed)
+            for i, vector in zip(missing, computed):
+                vectors[i] = np.asarray(vector, dtype=np.float32)
+
+        return vectors
@@ -0,0 +1,146 @@
+"""
+In-memory lexical index over data/calories.csv.
+
+Most calorie lookups name a food item that appears (nearly) word for word in
+the calorie table. The index answers those lookups from memory, so only the
+misses have to be embedded and searched in the nutrition_db vector database.
+"""
+
+import csv
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from pathlib import Path
+
+default_csv_path = Path(__file__).parent.parent / "data" / "calories.csv"
+
+
+def normalize_food_name(name: str) -> str:
+    """Lowercase, strip accents and punctuation and collapse whitespace."""
+    name = unicodedata.normalize("NFKD", name)
+    name = name.encode("ascii", "ignore").decode("ascii").lower()
+    name = re.sub(r"[^a-z0-9]+", " ", name)
+    return " ".join(name.split())
+
+
+def singularize(word: str) -> str:
+    """Fold a plural English word to its singular form, e.g. berries -> berry."""
+    if len(word) <= 3 or word.endswith("ss"):
+        return word
+    if word.endswith("ies"):
+        return word[:-3] + "y"
+    if word.endswith(("oes", "ches", "shes", "xes", "sses")):
+        return word[:-2]
+    if word.endswith("s"):
+        return word[:-1]
+    return word
+
+
+def fold_food_name(name: str) -> str:
+    """The key food names are matched on: normalized and singular."""
+    return " ".join(singularize(word) for word in normalize_food_name(name).split())
+
+
+def trigrams(text: str) -> set[str]:
+    """Character trigrams of every word, padded like PostgreSQL's pg_trgm."""
+    grams = set()
+    for word in text.split():
+        padded = f"  {word} "
+        grams.update(padded[i : i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class FoodIndex:
+    """Exact and trigram-fuzzy lookup of food items by name."""
+
+    def __init__(self, foods: list[dict], fuzzy_threshold: float = 0.6):
+        """
+        Args:
+            foods: Food metadata in the same shape as the nutrition_db metadata.
+            fuzzy_threshold: The minimum trigram similarity of a fuzzy match. Only
+                names with as many words as the query match fuzzily, so "cheese"
+                doesn't match "soy cheese" nor "bread" match "rye bread".
+        """
+        self.foods = foods
+        self.fuzzy_threshold = fuzzy_threshold
+        self._exact = defaultdict(list)
+        self._trigrams = []
+        self._word_counts = []
+        self._postings = defaultdict(list)
+
+        for position, food in enumerate(foods):
+            key = fold_food_name(food["food_item"])
+            self._exact[key].append(position)
+
+            grams = trigrams(key)
+            self._trigrams.append(grams)
+            self._word_counts.append(len(key.split()))
+            for gram in grams:
+                self._postings[gram].append(position)
+
+    @classmethod
+    def from_csv(cls, csv_path: str | Path = default_csv_path, **kwargs) -> "FoodIndex":
+        """Build the index from the calorie CSV."""
+        foods = []
+        with open(csv_path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                foods.append(
+                    {
+                        "food_item": row["FoodItem"].lower(),
+                        "food_category": row["FoodCategory"].lower(),
+                        "calories_per_100g": float(
+                            row["Cals_per100grams"].replace(" cal", "")
+                        ),
+                        "kj_per_100g": float(row["KJ_per100grams"].replace(" kJ", "")),
+                        "serving_info": row["per100grams"],
+                    }
+                )
+        return cls(foods, **kwargs)
+
+    def __len__(self) -> int:
+        return len(self.foods)
+
+    def lookup(self, query: str, max_results: int = 3) -> tuple[list[dict], str | None]:
+        """
+        Look up a food item by name.
+
+        Returns:
+            The matching food metadata and which match served it: "exact",
+            "fuzzy" or None if the index has no good enough match.
+        """
+        key = fold_food_name(query)
+        if not key:
+            return [], None
+
+        exact = self._exact.get(key)
+        if exact:
+            return [self.foods[i] for i in exact[:max_results]], "exact"
+
+        fuzzy = self._fuzzy_positions(key, max_results)
+        if fuzzy:
+            return [self.foods[i] for i in fuzzy], "fuzzy"
+
+        return [], None
+
+    def _fuzzy_positions(self, key: str, max_results: int) -> list[int]:
+        query_grams = trigrams(key)
+        word_count = len(key.split())
+
+        # Count shared trigrams only for the food items sharing at least one
+        shared = Counter()
+        for gram in query_grams:
+            shared.update(self._postings.get(gram, ()))
+
+        scored = []
+        for position, common in shared.items():
+            # A name with more or fewer words is another food, not a misspelling
+            if self._word_counts[position] != word_count:
+                continue
+            similarity = common / (
+                len(query_grams) + len(self._trigrams[position]) - common
+            )
+            if similarity >= self.fuzzy_threshold:
+                scored.append((-similarity, position))
+
+        scored.sort()
+        return [position for _, position in scored[:max_results]]
@@ -0,0 +1,184 @@
+"""
+Columnar in-memory table of data/calories.csv for structured nutrient queries.
+
+Questions like "which fruits have less than 50 calories per 100g" need filtering
+and sorting by numbers, which a semantic search can't do. The table parses the
+calories and kJ into NumPy arrays once at load time and indexes the rows by
+category, so a filter, sort or top-k query is a few vectorized operations.
+"""
+
+import csv
+import re
+from pathlib import Path
+
+import numpy as np
+from food_index import default_csv_path, fold_food_name
+
+
+def category_label(category: str) -> str:
+    """A readable category name, e.g. Tropical&ExoticFruits -> Tropical & Exotic Fruits."""
+    label = re.sub(r"(?<=[a-z)])(?=[A-Z(])", " ", category)
+    return " ".join(label.replace("&", " & ").replace(",", ", ").split())
+
+
+# Generic last words, the head noun of "Dairy Products" is "dairy"
+GENERIC_HEADS = {"product"}
+
+
+def head_nouns(label: str) -> set[str]:
+    """
+    The head nouns of a category label, the last word of each of its parts, e.g.
+    "Tropical & Exotic Fruits" -> {"tropical", "fruit"}. Qualifiers don't count:
+    "(Fruit) Juices" -> {"juice"}, "Vegetable Oils" -> {"oil"}.
+    """
+    heads = set()
+    for part in re.split(r"[&,]", label):
+        words = fold_food_name(part).split()
+        while len(words) > 1 and words[-1] in GENERIC_HEADS:
+            words.pop()
+        if words:
+            heads.add(words[-1])
+    return heads
+
+
+def parse_number(value: str) -> float:
+    """The number in a value like "62 cal" or "260 kJ", NaN if there is none."""
+    match = re.match(r"\s*([0-9]+(?:\.[0-9]+)?)", value)
+    return float(match.group(1)) if match else float("nan")
+
+
+class FoodTable:
+    """The food items as columns, with an index from category to rows."""
+
+    def __init__(
+        self,
+        food_items: list[str],
+        categories: list[str],
+        calories: list[float],
+        kj: list[float],
+        serving_info: list[str],
+    ):
+        """
+        Args:
+            food_items: The food names, one per row.
+            categories: The raw category of every row, e.g. "CannedFruit".
+            calories: Calories per 100g (or 100ml).
+            kj: Kilojoules per 100g (or 100ml).
+            serving_info: "100g" or "100ml".
+        """
+        self.food_items = np.array(food_items, dtype=object)
+        self.calories = np.array(calories, dtype=np.float32)
+        self.kj = np.array(kj, dtype=np.float32)
+        self.per_ml = np.array([info == "100ml" for info in serving_info], dtype=bool)
+
+        # Categories as integer codes, plus the rows of every category
+        self.category_names, self.category_codes = np.unique(
+            np.array(categories, dtype=object), return_inverse=True
+        )
+        self.category_labels = [category_label(name) for name in self.category_names]
+        self.category_keys = [fold_food_name(label) for label in self.category_labels]
+        self.category_heads = [head_nouns(label) for label in self.category_labels]
+        self._category_rows = [
+            np.flatnonzero(self.category_codes == code) for code in range(len(self.category_names))
+        ]
+
+    @classmethod
+    def from_csv(cls, csv_path: str | Path = default_csv_path) -> "FoodTable":
+        columns = {
+            name: []
+            for name in ["FoodItem", "FoodCategory", "Cals_per100grams", "KJ_per100grams", "per100grams"]
+        }
+        with open(csv_path, encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                for name, values in columns.items():
+                    values.append(row[name])
+
+        return cls(
+            food_items=columns["FoodItem"],
+            categories=columns["FoodCategory"],
+            calories=[parse_number(value) for value in columns["Cals_per100grams"]],
+            kj=[parse_number(value) for value in columns["KJ_per100grams"]],
+            serving_info=columns["per100grams"],
+        )
+
+    def __len__(self) -> int:
+        return len(self.food_items)
+
+    def match_categories(self, category: str) -> list[int]:
+        """
+        The category codes matching a name like "fruits" or "dairy".
+
+        A category matches when it contains all the words of the name and the head
+        noun of the name is one of its head nouns, e.g. "fruits" matches "Fruits",
+        "Canned Fruit" and "Tropical & Exotic Fruits", but not "(Fruit) Juices".
+        A category whose name matches exactly comes first.
+        """
+        key = fold_food_name(category_label(category))
+        words = set(key.split())
+        heads = head_nouns(category_label(category))
+        exact = [code for code, name in enumerate(self.category_keys) if name == key]
+        return exact + [
+            code
+            for code, name in enumerate(self.category_keys)
+            if name != key and words <= set(name.split()) and heads & self.category_heads[code]
+        ]
+
+    def query(
+        self,
+        categories: list[int] | None = None,
+        min_calories: float | None = None,
+        max_calories: float | None = None,
+        sort_by: str = "calories",
+        descending: bool = False,
+        limit: int = 10,
+    ) -> tuple[np.ndarray, int]:
+        """
+        Filter the rows and return the first `limit` in the requested order.
+
+        Args:
+            categories: Only rows of these category codes, all rows if None.
+            min_calories: The minimum calories per 100g, inclusive.
+            max_calories: The maximum calories per 100g, inclusive.
+            sort_by: "calories" or "name".
+            descending: Sort from the highest to the lowest.
+            limit: The maximum number of rows to return.
+
+        Returns:
+            The positions of the returned rows and the number of matching rows.
+        """
+        if categories is None:
+            rows = np.arange(len(self))
+        else:
+            rows = np.concatenate([self._category_rows[code] for code in categories] or [[]])
+            rows = rows.astype(np.int64)
+
+        calories = self.calories[rows]
+        mask = ~np.isnan(calories)
+        if min_calories is not None:
+            mask &= calories >= min_calories
+        if max_calories is not None:
+            mask &= calories <= max_calories
+        rows = rows[mask]
+        total = len(rows)
+
+        if sort_by == "name":
+            order = np.argsort(self.food_items[rows].astype(str), kind="stable")
+            if descending:
+                order = order[::-1]
+            return rows[order[:limit]], total
+
+        keys = -self.calories[rows] if descending else self.calories[rows]
+        # Partition out the top `limit` rows, then sort only those
+        if 0 < limit < total:
+            top = np.argpartition(keys, limit - 1)[:limit]
+            rows, keys = rows[top], keys[top]
+        return rows[np.argsort(keys, kind="stable")][:limit], total
+
+    def row(self, position: int) -> dict:
+        return {
+            "food_item": self.food_items[position],
+            "food_category": self.category_labels[self.category_codes[position]],
+            "calories": float(self.calories[position]),
+            "kj": float(self.kj[position]),
+            "serving_info": "100ml" if self.per_ml[position] else "100g",
+        }
@@ -0,0 +1,189 @@
+"""
+Immutable, versioned snapshots of the nutrition_db retrieval index.
+
+With several chainlit workers, every worker opening chroma/ loads its own copy
+of the HNSW index and contends for the SQLite locks of the Chroma store. An
+ingestion run can instead publish a read-only snapshot: the embeddings and
+metadata as written by `export_collection` plus the postings of the BM25
+keyword index as .npy arrays. The workers memory-map the embeddings and the
+postings, so the OS page cache holds a single copy for all of them, and switch
+to a newer snapshot as soon as one is published. Each worker still parses the
+(small) metadata columns and the BM25 vocabulary.
+
+    index_snapshots/
+        CURRENT                      the name of the live snapshot
+        20261018T120000Z-1a2b3c4d/   one published snapshot
+
+A snapshot is written to a temporary directory and renamed into place before
+CURRENT is replaced, so readers never see a half-written snapshot.
+"""
+
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable
+
+from bm25_index import BM25Index
+from vector_store import NumpyVectorStore, export_collection
+
+logger = logging.getLogger(__name__)
+
+default_snapshots_path = Path(__file__).parent.parent / "index_snapshots"
+
+CURRENT_FILE = "CURRENT"
+
+
+def current_version(snapshots_dir: str | Path) -> str | None:
+    """The name of the live snapshot, or None if none was published yet."""
+    try:
+        return (Path(snapshots_dir) / CURRENT_FILE).read_text(encoding="utf-8").strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def publish_snapshot(collection, snapshots_dir: str | Path, keep: int = 3) -> str:
+    """
+    Export the collection as a new snapshot and make it the live one.
+
+    Args:
+        collection: The nutrition_db collection.
+        snapshots_dir: The directory holding the snapshots.
+        keep: How many snapshots to keep, including the new one.
+
+    Returns:
+        The version of the new snapshot.
+    """
+    snapshots_dir = Path(snapshots_dir)
+    snapshots_dir.mkdir(parents=True, exist_ok=True)
+
+    version = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime()) + "-" + uuid.uuid4().hex[:8]
+    staging = snapshots_dir / f".{version}.tmp"
+    export_collection(collection, staging)
+    # Built from the export, so the postings refer to the rows of the exported embeddings
+    exported = NumpyVectorStore.load(staging)
+    BM25Index(
+        exported.ids, [exported.metadata(i) for i in range(len(exported))]
+    ).save_arrays(staging)
+    os.replace(staging, snapshots_dir / version)
+
+    # Replace the pointer atomically, readers see either the old or the new version
+    pointer = snapshots_dir / f".{CURRENT_FILE}.{version}.tmp"
+    pointer.write_text(version, encoding="utf-8")
+    os.replace(pointer, snapshots_dir / CURRENT_FILE)
+
+    prune_snapshots(snapshots_dir, keep)
+    return version
+
+
+def prune_snapshots(snapshots_dir: str | Path, keep: int = 3) -> list[str]:
+    """
+    Delete all but the `keep` newest snapshots, never the live one.
+    Workers still mapping a deleted snapshot keep reading it until they switch.
+
+    Returns:
+        The deleted versions.
+    """
+    snapshots_dir = Path(snapshots_dir)
+    live = current_version(snapshots_dir)
+    versions = sorted(
+        path.name
+        for path in snapshots_dir.iterdir()
+        if path.is_dir() and not path.name.startswith(".")
+    )
+    deleted = [version for version in versions[: max(len(versions) - keep, 0)] if version != live]
+    for version in deleted:
+        shutil.rmtree(snapshots_dir / version, ignore_errors=True)
+    return deleted
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    version: str
+    vector_store: NumpyVectorStore
+    keyword_index: BM25Index
+
+
+class SnapshotReader:
+    """
+    Serves vector and keyword searches from the live snapshot, switching to a newly
+    published one at most `check_interval` seconds after it appeared.
+    """
+
+    def __init__(
+        self,
+        snapshots_dir: str | Path = default_snapshots_path,
+        check_interval: float = 5.0,
+        clock: Callable[[], float] = time.monotonic,
+        **load_kwargs,
+    ):
+        """
+        Args:
+            snapshots_dir: The directory the snapshots are published to.
+            check_interval: Seconds between two checks of the CURRENT pointer.
+            clock: The time source, in seconds.
+            load_kwargs: Passed on to NumpyVectorStore.load, e.g. the quantization.
+        """
+        self.snapshots_dir = Path(snapshots_dir)
+        self.check_interval = check_interval
+        self.load_kwargs = load_kwargs
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._checked_at = None
+        self.swaps = 0
+
+    @property
+    def version(self) -> str:
+        return self.current().version
+
+    def current(self) -> Snapshot:
+        """The live snapshot, loading a newer one if it was published since the last check."""
+        now = self._clock()
+        if self._checked_at is not None and now - self._checked_at < self.check_interval:
+            return self._snapshot
+
+        with self._lock:
+            if self._checked_at is None or now - self._checked_at >= self.check_interval:
+                version = current_version(self.snapshots_dir)
+                if version is None:
+                    raise RuntimeError(
+                        f"No index snapshot was published to {self.snapshots_dir}. Publish one "
+                        "with rag_setup/create_calorie_database.py --publish-snapshot."
+                    )
+                if self._snapshot is None or version != self._snapshot.version:
+                    self._snapshot = self._load(version)
+                    self.swaps += 1
+                self._checked_at = now
+        return self._snapshot
+
+    def _load(self, version: str) -> Snapshot:
+        start = time.perf_counter()
+        snapshot_dir = self.snapshots_dir / version
+        vector_store = NumpyVectorStore.load(snapshot_dir, **self.load_kwargs)
+        keyword_index = BM25Index.load_arrays(snapshot_dir, vector_store.ids)
+        snapshot = Snapshot(version=version, vector_store=vector_store, keyword_index=keyword_index)
+        logger.info("Loaded index snapshot %s in %.3fs", version, time.perf_counter() - start)
+        # In-flight queries keep their reference to the previous snapshot, it's
+        # unmapped once they finish
+        return snapshot
+
+    def query(self, query_embeddings: list, n_results: int = 10) -> dict:
+        """The vector search of the live snapshot, see NumpyVectorStore.query."""
+        return self.current().vector_store.query(query_embeddings, n_results)
+
+    def search_many(self, queries: list[str], n_results: int = 10) -> dict:
+        """The keyword search of the live snapshot, see BM25Index.search_many."""
+        snapshot = self.current()
+        # The metadata comes from the columns of the vector store, the rows are the same
+        store = snapshot.vector_store
+        results = {"ids": [], "metadatas": []}
+        for query in queries:
+            positions = snapshot.keyword_index.search(query, n_results)
+            results["ids"].append([store.ids[i] for i in positions])
+            results["metadatas"].append([store.metadata(i) for i in positions])
+        return results
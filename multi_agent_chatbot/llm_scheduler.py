@@ -0,0 +1,342 @@
+"""
+A process-wide scheduler in front of every model call of the agents.
+
+Each chat turn fires several model calls (the guardrail agent, the main agent,
+agents used as tools, the per-meal sub-agents), and a burst of users turns
+into a burst of 429s and retries. LLMScheduler admits the calls through token
+buckets for requests and tokens per minute and a limit on the calls in flight.
+Waiting calls are served by priority: the interactive turn of a user before
+the sub-agent work it started. When the queue is full, or a call waited too
+long, it fails fast with SchedulerOverloaded instead of piling up.
+
+The scheduler wraps the agents' models, so it works the same against the
+OpenAI API, a local fake endpoint (OPENAI_BASE_URL) or the replayed models.
+"""
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import json
+import time
+from collections import Counter
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Callable
+
+from agents import Agent, Handoff, ModelSettings, Tool
+from agents.agent_output import AgentOutputSchemaBase
+from agents.items import ModelResponse, TResponseInputItem, TResponseStreamEvent
+from agents.models.interface import Model, ModelTracing
+from agents.models.openai_provider import OpenAIProvider
+from telemetry import record_latency
+
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+# The priority of the model calls made in the current task and the tasks it starts
+current_priority = contextvars.ContextVar("llm_priority", default=INTERACTIVE)
+
+
+class SchedulerOverloaded(RuntimeError):
+    """Raised when a model call is shed because the scheduler's queue is full or too slow."""
+
+
+@contextmanager
+def priority(level: int):
+    """Run the model calls made in the block with the given priority."""
+    token = current_priority.set(level)
+    try:
+        yield
+    finally:
+        current_priority.reset(token)
+
+
+def background_agent_tool(tool):
+    """Schedule the model calls of an agent used as a tool (Agent.as_tool) as background work."""
+    on_invoke_tool = tool.on_invoke_tool
+
+    async def background_on_invoke_tool(ctx, input: str):
+        with priority(BACKGROUND):
+            return await on_invoke_tool(ctx, input)
+
+    tool.on_invoke_tool = background_on_invoke_tool
+    return tool
+
+
+class TokenBucket:
+    """Refills at `per_minute / 60` per second up to `capacity`. Can go into debt."""
+
+    def __init__(
+        self,
+        per_minute: float,
+        capacity: float | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self.level = self.capacity
+        self._clock = clock
+        self._updated = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` can be taken, 0 if it can be taken now."""
+        self._refill()
+        # A request larger than the bucket only has to wait for a full bucket
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.level) / self.rate)
+
+    def take(self, amount: float) -> None:
+        """Take `amount`, or give it back if it's negative."""
+        self._refill()
+        self.level = min(self.capacity, self.level - amount)
+
+
+class LLMScheduler:
+    """Admits model calls by priority, within rate limits and a concurrency limit."""
+
+    def __init__(
+        self,
+        max_concurrent: int = 16,
+        requests_per_minute: float = 500,
+        tokens_per_minute: float = 200_000,
+        max_queue: int = 64,
+        max_queue_wait: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Args:
+            max_concurrent: The maximum number of model calls in flight.
+            requests_per_minute: The request rate limit.
+            tokens_per_minute: The token rate limit, for the estimated input and output tokens.
+            max_queue: Calls arriving when this many are waiting are shed right away.
+            max_queue_wait: Calls waiting longer than this many seconds are shed.
+            clock: The time source, in seconds.
+        """
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_queue_wait = max_queue_wait
+        self._requests = TokenBucket(requests_per_minute, clock=clock)
+        self._tokens = TokenBucket(tokens_per_minute, clock=clock)
+        self._clock = clock
+        self._queue = []
+        self._sequence = itertools.count()
+        self._active = 0
+        self._timer = None
+
+        # "admitted", "shed", "timed_out", per priority: "admitted.interactive", ...
+        self.stats = Counter()
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def queued(self) -> int:
+        return sum(not waiter.done() for _, _, _, waiter in self._queue)
+
+    async def acquire(self, estimated_tokens: int) -> None:
+        """Wait for a slot for a call of about `estimated_tokens` tokens."""
+        level = current_priority.get()
+        name = PRIORITY_NAMES.get(level, str(level))
+        if self.queued >= self.max_queue:
+            self.stats["shed"] += 1
+            self.stats[f"shed.{name}"] += 1
+            raise SchedulerOverloaded(f"{self.queued} model calls are already waiting")
+
+        started = self._clock()
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (level, next(self._sequence), estimated_tokens, waiter))
+        self._dispatch()
+
+        try:
+            async with asyncio.timeout(self.max_queue_wait):
+                await waiter
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was granted just as we gave up on it
+                self.release()
+            else:
+                waiter.cancel()
+                self._dispatch()
+            if isinstance(e, TimeoutError):
+                self.stats["timed_out"] += 1
+                self.stats[f"timed_out.{name}"] += 1
+                raise SchedulerOverloaded(
+                    f"A model call waited more than {self.max_queue_wait}s"
+                ) from None
+            raise
+
+        self.stats["admitted"] += 1
+        self.stats[f"admitted.{name}"] += 1
+        record_latency("llm.queue_wait", self._clock() - started, {"priority": name})
+
+    def release(self) -> None:
+        self._active -= 1
+        self._dispatch()
+
+    def settle(self, estimated_tokens: int, actual_tokens: int) -> None:
+        """Correct the token bucket once the real usage of a call is known."""
+        self._tokens.take(actual_tokens - estimated_tokens)
+
+    @asynccontextmanager
+    async def slot(self, estimated_tokens: int):
+        await self.acquire(estimated_tokens)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def _dispatch(self) -> None:
+        """Admit waiting calls in priority order, as far as the limits allow."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        while self._queue:
+            _, _, tokens, waiter = self._queue[0]
+            if waiter.done():
+                heapq.heappop(self._queue)
+                continue
+            if self._active >= self.max_concurrent:
+                # release() dispatches again
+                return
+
+            wait = max(self._requests.wait_time(1), self._tokens.wait_time(tokens))
+            if wait > 0:
+                self._timer = asyncio.get_running_loop().call_later(wait, self._dispatch)
+                return
+
+            heapq.heappop(self._queue)
+            self._requests.take(1)
+            self._tokens.take(tokens)
+            self._active += 1
+            waiter.set_result(None)
+
+
+def estimate_tokens(
+    system_instructions: str | None,
+    input: str | list[TResponseInputItem],
+    model_settings: ModelSettings,
+    default_output_tokens: int = 512,
+) -> int:
+    """A rough token count of a call: about 4 characters per input token plus the output."""
+    text = input if isinstance(input, str) else json.dumps(input, default=str)
+    input_tokens = (len(system_instructions or "") + len(text)) // 4
+    return input_tokens + (model_settings.max_tokens or default_output_tokens)
+
+
+class ScheduledModel(Model):
+    """Runs the calls of a model through the scheduler."""
+
+    def __init__(
+        self,
+        model: Model | str | None,
+        scheduler: LLMScheduler,
+        provider: OpenAIProvider | None = None,
+    ):
+        """
+        Args:
+            model: The model, or the name of the model (None for the default) to get from
+                the provider on the first call, so that importing needs no API key.
+            scheduler: The scheduler the calls go through.
+            provider: Resolves a model name, an OpenAIProvider by default.
+        """
+        self._model = model
+        self.scheduler = scheduler
+        self.provider = provider
+
+    @property
+    def model(self) -> Model:
+        if not isinstance(self._model, Model):
+            self._model = (self.provider or OpenAIProvider()).get_model(self._model)
+        return self._model
+
+    @model.setter
+    def model(self, model: Model) -> None:
+        self._model = model
+
+    async def get_response(
+        self,
+        system_instructions: str | None,
+        input: str | list[TResponseInputItem],
+        model_settings: ModelSettings,
+        tools: list[Tool],
+        output_schema: AgentOutputSchemaBase | None,
+        handoffs: list[Handoff],
+        tracing: ModelTracing,
+        *,
+        previous_response_id: str | None,
+        conversation_id: str | None,
+        prompt: Any | None,
+    ) -> ModelResponse:
+        tokens = estimate_tokens(system_instructions, input, model_settings)
+        async with self.scheduler.slot(tokens):
+            response = await self.model.get_response(
+                system_instructions,
+                input,
+                model_settings,
+                tools,
+                output_schema,
+                handoffs,
+                tracing,
+                previous_response_id=previous_response_id,
+                conversation_id=conversation_id,
+                prompt=prompt,
+            )
+        if response.usage.total_tokens:
+            self.scheduler.settle(tokens, response.usage.total_tokens)
+        return response
+
+    async def stream_response(
+        self,
+        system_instructions: str | None,
+        input: str | list[TResponseInputItem],
+        model_settings: ModelSettings,
+        tools: list[Tool],
+        output_schema: AgentOutputSchemaBase | None,
+        handoffs: list[Handoff],
+        tracing: ModelTracing,
+        *,
+        previous_response_id: str | None,
+        conversation_id: str | None,
+        prompt: Any | None,
+    ) -> AsyncIterator[TResponseStreamEvent]:
+        tokens = estimate_tokens(system_instructions, input, model_settings)
+        total_tokens = None
+        # The slot is held until the stream is finished
+        async with self.scheduler.slot(tokens):
+            async for event in self.model.stream_response(
+                system_instructions,
+                input,
+                model_settings,
+                tools,
+                output_schema,
+                handoffs,
+                tracing,
+                previous_response_id=previous_response_id,
+                conversation_id=conversation_id,
+                prompt=prompt,
+            ):
+                if event.type == "response.completed" and event.response.usage:
+                    total_tokens = event.response.usage.total_tokens
+                yield event
+        if total_tokens:
+            self.scheduler.settle(tokens, total_tokens)
+
+
+def use_scheduled_models(agents: list[Agent], scheduler: LLMScheduler) -> None:
+    """
+    Route the model calls of every agent through the scheduler.
+
+    Like the record/replay models, the model is set on the agents themselves, because
+    agents used as tools run without the RunConfig of the outer run.
+    """
+    provider = OpenAIProvider()
+    for agent in agents:
+        agent.model = ScheduledModel(agent.model, scheduler, provider)
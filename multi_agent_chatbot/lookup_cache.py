@@ -0,0 +1,154 @@
+"""
+Process-wide LRU cache with a time-to-live for calorie lookup results.
+
+The same foods ("banana", "egg", "oats") get looked up over and over across
+chainlit sessions. The cache answers repeated lookups without touching
+nutrition_db and drops everything when the collection is rebuilt.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+def file_generation(path: str | Path) -> Callable[[], int]:
+    """
+    A generation token that changes whenever the file is written.
+
+    Pointed at the collection's version file (see collection_version.py), which
+    ingestion only rewrites when the food items changed, it invalidates the
+    cached lookups exactly when the collection was updated. chroma.sqlite3 would
+    not do: opening the collection already touches it.
+    """
+    path = Path(path)
+
+    def generation() -> int:
+        try:
+            return path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    return generation
+
+
+def rebuilt_on_change(build: Callable[[], T], generation: Callable[[], Hashable]) -> Callable[[], T]:
+    """
+    A getter of what `build()` returns, built on first use and built again whenever
+    `generation()` changed, e.g. the in-memory indexes of the calorie table after an
+    ingestion run. Concurrent callers wait for a single build.
+    """
+    lock = threading.Lock()
+    # The generation and the value built for it, replaced together
+    built = (object(), None)
+
+    def getter() -> T:
+        nonlocal built
+        current = generation()
+        if built[0] != current:
+            with lock:
+                if built[0] != current:
+                    built = (current, build())
+        return built[1]
+
+    return getter
+
+
+class LookupCache:
+    """A thread-safe, size-bounded LRU cache whose entries expire after `ttl` seconds."""
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        ttl: float = 3600.0,
+        generation: Callable[[], Hashable] | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Args:
+            maxsize: The maximum number of entries before the least recently used is evicted.
+            ttl: How many seconds an entry stays valid.
+            generation: Returns a token of the underlying data; the cache is cleared when it changes.
+            clock: The time source, in seconds.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._generation = generation
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._current_generation = generation() if generation else None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable) -> Any | None:
+        """Return the cached value or None on a miss."""
+        with self._lock:
+            self._check_generation()
+
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, value = entry
+            if expires_at <= self._clock():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._check_generation()
+
+            self._entries[key] = (self._clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self) -> None:
+        """Drop all entries, e.g. after the collection was rebuilt."""
+        with self._lock:
+            self._clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _check_generation(self) -> None:
+        if self._generation is None:
+            return
+
+        generation = self._generation()
+        if generation != self._current_generation:
+            self._current_generation = generation
+            self._clear()
+
+    def _clear(self) -> None:
+        self._entries.clear()
+        self.invalidations += 1
@@ -0,0 +1,202 @@
+"""
+A process-wide MCP connection shared by all chats.
+
+Connecting to the Exa MCP server on every new chat costs a handshake and makes
+the chats race on the state of one MCPServer object. ManagedMCPServer connects
+once, lets any number of chats and agents call tools over the same connection
+(at most `max_concurrent_calls` at a time), pings the server in the background
+and reconnects with exponential backoff when the connection breaks.
+
+The connection is opened, checked and closed by a single background task,
+because the MCP client transports must be closed by the task that opened them.
+"""
+
+import asyncio
+import logging
+from collections import Counter
+from typing import Any, Callable
+
+from agents import AgentBase, RunContextWrapper
+from agents.mcp import MCPServer
+from mcp import Tool as MCPTool
+from mcp.types import CallToolResult, GetPromptResult, ListPromptsResult
+from telemetry import timed
+
+logger = logging.getLogger(__name__)
+
+
+class MCPConnectionError(RuntimeError):
+    """Raised when the MCP server can't be reached."""
+
+
+class ManagedMCPServer(MCPServer):
+    """Wraps an MCP server, sharing one health-checked connection across the process."""
+
+    def __init__(
+        self,
+        server_factory: Callable[[], MCPServer],
+        max_concurrent_calls: int = 8,
+        connect_timeout: float = 30,
+        health_check_interval: float = 30,
+        health_check_timeout: float = 10,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60,
+    ):
+        """
+        Args:
+            server_factory: Creates a new, unconnected MCP server for every (re)connect.
+            max_concurrent_calls: The maximum number of tool calls in flight at the same time.
+            connect_timeout: How long a call waits for the connection before it fails.
+            health_check_interval: Seconds between two pings of the server.
+            health_check_timeout: Seconds after which a ping counts as failed.
+            backoff_base: The delay before the first reconnect attempt, doubled on every failure.
+            backoff_max: The maximum delay between two reconnect attempts.
+        """
+        super().__init__()
+        self.server_factory = server_factory
+        self.connect_timeout = connect_timeout
+        self.health_check_interval = health_check_interval
+        self.health_check_timeout = health_check_timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._server = server_factory()
+        self._name = self._server.name
+        self._calls = asyncio.Semaphore(max_concurrent_calls)
+        self._connected = asyncio.Event()
+        self._check_now = asyncio.Event()
+        self._task = None
+        self._last_error = None
+
+        # "connects", "connect_failures", "health_check_failures", "calls", "call_failures"
+        self.stats = Counter()
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def connected(self) -> bool:
+        return self._connected.is_set()
+
+    async def connect(self):
+        """
+        Start the background connection, or wait for it if it's already running.
+        Safe to call from every chat: only the first call opens a connection.
+        """
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._maintain_connection())
+        await self._wait_connected()
+
+    async def _wait_connected(self) -> MCPServer:
+        if not self._connected.is_set():
+            if self._task is None or self._task.done():
+                raise MCPConnectionError(f"{self.name} is not connected, call connect() first")
+            try:
+                await asyncio.wait_for(self._connected.wait(), self.connect_timeout)
+            except asyncio.TimeoutError:
+                raise MCPConnectionError(
+                    f"Could not connect to {self.name}: {self._last_error}"
+                ) from None
+        return self._server
+
+    async def _maintain_connection(self):
+        """Connect, ping the server periodically and reconnect with backoff until cancelled."""
+        failures = 0
+        try:
+            while True:
+                try:
+                    await self._server.connect()
+                except Exception as e:
+                    self._last_error = e
+                    self.stats["connect_failures"] += 1
+                    failures += 1
+                    delay = min(self.backoff_max, self.backoff_base * 2 ** (failures - 1))
+                    logger.warning(
+                        "Connecting to %s failed (%s), retrying in %.1fs", self.name, e, delay
+                    )
+                    await self._server.cleanup()
+                    self._server = self.server_factory()
+                    await asyncio.sleep(delay)
+                    continue
+
+                failures = 0
+                self.stats["connects"] += 1
+                self._connected.set()
+                logger.info("Connected to %s", self.name)
+
+                await self._health_check_loop()
+
+                # The connection broke, open a new one
+                self._connected.clear()
+                self.stats["health_check_failures"] += 1
+                await self._server.cleanup()
+                self._server = self.server_factory()
+        finally:
+            self._connected.clear()
+            await self._server.cleanup()
+
+    async def _health_check_loop(self):
+        """Return as soon as a ping fails."""
+        while True:
+            try:
+                await asyncio.wait_for(self._check_now.wait(), self.health_check_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._check_now.clear()
+
+            try:
+                await asyncio.wait_for(self._ping(), self.health_check_timeout)
+            except Exception as e:
+                self._last_error = e
+                logger.warning("Health check of %s failed: %s", self.name, e)
+                return
+
+    async def _ping(self):
+        session = getattr(self._server, "session", None)
+        if session is not None:
+            await session.send_ping()
+        else:
+            await self._server.list_prompts()
+
+    async def cleanup(self):
+        """Stop the background task and close the connection."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def list_tools(
+        self,
+        run_context: RunContextWrapper[Any] | None = None,
+        agent: AgentBase | None = None,
+    ) -> list[MCPTool]:
+        server = await self._wait_connected()
+        return await server.list_tools(run_context, agent)
+
+    async def call_tool(self, tool_name: str, arguments: dict[str, Any] | None) -> CallToolResult:
+        with timed("mcp.call_tool", server=self.name, tool=tool_name) as attributes:
+            server = await self._wait_connected()
+            async with self._calls:
+                self.stats["calls"] += 1
+                try:
+                    return await server.call_tool(tool_name, arguments)
+                except Exception:
+                    self.stats["call_failures"] += 1
+                    attributes["error"] = True
+                    # Check the connection right away instead of at the next interval
+                    self._check_now.set()
+                    raise
+
+    async def list_prompts(self) -> ListPromptsResult:
+        server = await self._wait_connected()
+        return await server.list_prompts()
+
+    async def get_prompt(
+        self, name: str, arguments: dict[str, Any] | None = None
+    ) -> GetPromptResult:
+        server = await self._wait_connected()
+        return await server.get_prompt(name, arguments)
@@ -0,0 +1,236 @@
+"""
+Deterministic calorie totals for a meal from its ingredients and quantities.
+
+The calorie table gives calories per 100g (or per 100ml for drinks, milk and
+oils). The calculator converts every quantity to grams or milliliters with a
+table of units, densities and typical portion weights, then multiplies the
+amounts by the calories of the matched foods, so the agent doesn't have to do
+the arithmetic itself.
+"""
+
+import re
+
+import numpy as np
+from food_index import fold_food_name
+
+# Grams per unit of weight
+MASS_UNITS = {
+    "g": 1.0, "gram": 1.0, "mg": 0.001, "kg": 1000.0, "oz": 28.3495, "ounce": 28.3495,
+    "lb": 453.592, "pound": 453.592,
+}
+
+# Milliliters per unit of volume
+VOLUME_UNITS = {
+    "ml": 1.0, "milliliter": 1.0, "l": 1000.0, "liter": 1000.0, "litre": 1000.0,
+    "dl": 100.0, "cl": 10.0, "cup": 240.0, "tbsp": 15.0, "tablespoon": 15.0,
+    "tsp": 5.0, "teaspoon": 5.0, "fl oz": 29.5735, "glass": 250.0,
+}
+
+PIECE_UNITS = {"piece", "pc", "whole", "item", "slice", "medium", "large", "small", "serving"}
+
+# Size factors for "small" and "large" pieces, relative to a medium one
+PIECE_SIZE_FACTORS = {"small": 0.7, "large": 1.3}
+
+# Grams per milliliter, matched on the words of the (folded) food name
+DENSITIES = {
+    "oil": 0.92, "butter": 0.91, "honey": 1.42, "syrup": 1.33, "milk": 1.03,
+    "cream": 1.0, "yogurt": 1.05, "flour": 0.53, "sugar": 0.85, "oat": 0.41,
+    "rice": 0.85, "muesli": 0.45, "granola": 0.45, "cereal": 0.3, "nut": 0.6,
+    "seed": 0.6, "peanut": 0.6, "berry": 0.6, "cheese": 0.45, "salt": 1.2,
+    "cocoa": 0.5, "juice": 1.04, "water": 1.0,
+}
+DEFAULT_DENSITY = 1.0
+
+# Grams of one medium piece (or slice), matched on the words of the (folded) food name
+PORTION_WEIGHTS = {
+    "egg": 50, "banana": 118, "apple": 182, "orange": 131, "pear": 178, "peach": 150,
+    "kiwi": 75, "avocado": 150, "tomato": 123, "potato": 173, "onion": 110,
+    "carrot": 61, "bread": 30, "toast": 30, "bagel": 105, "croissant": 57,
+    "muffin": 113, "pancake": 77, "waffle": 75, "tortilla": 45, "bacon": 8,
+    "sausage": 75, "cheese": 20, "ham": 28, "strawberry": 12, "date": 8,
+    "cookie": 15, "donut": 60, "pizza": 107, "chicken": 174,
+}
+DEFAULT_PORTION_WEIGHT = 100
+
+NUMBER_WORDS = {
+    "one", "two", "three", "four", "five", "six", "seven", "eight", "nine", "ten",
+    "eleven", "twelve", "dozen", "half", "quarter", "double", "twice", "triple",
+}
+
+
+# Other spellings and abbreviations of the units above
+UNIT_ALIASES = {
+    "gr": "g", "grm": "g", "gramme": "gram", "kilo": "kg", "kilogram": "kg", "kilogramme": "kg",
+    "milligram": "mg", "millilitre": "milliliter", "ltr": "l", "deciliter": "dl",
+    "decilitre": "dl", "centiliter": "cl", "centilitre": "cl", "c": "cup", "tbs": "tbsp",
+    "tbl": "tbsp", "tb": "tbsp", "tblsp": "tbsp", "fluid ounce": "fl oz", "floz": "fl oz",
+    "fl. oz": "fl oz", "med": "medium", "lg": "large", "sm": "small", "portion": "serving",
+}
+
+
+def known_unit(unit: str) -> bool:
+    return unit in MASS_UNITS or unit in VOLUME_UNITS or unit in PIECE_UNITS
+
+
+def normalize_unit(unit: str) -> str:
+    """The unit as a key of the unit tables, e.g. "Tablespoons" -> "tablespoon", "glasses" -> "glass"."""
+    unit = " ".join(unit.strip().lower().rstrip(".").split())
+    candidates = [unit]
+    # glasses -> glass, then cups -> cup, slices -> slice
+    if unit.endswith("es"):
+        candidates.append(unit[:-2])
+    if unit.endswith("s"):
+        candidates.append(unit[:-1])
+
+    for candidate in candidates:
+        candidate = UNIT_ALIASES.get(candidate, candidate)
+        if known_unit(candidate):
+            return candidate
+    return unit
+
+
+def canonical_unit(unit: str) -> str | None:
+    """A unit in a form equal for all its spellings, e.g. "grams" and "g" -> "1g", or None."""
+    unit = normalize_unit(unit)
+    if unit in MASS_UNITS:
+        return f"{MASS_UNITS[unit]:g}g"
+    if unit in VOLUME_UNITS:
+        return f"{VOLUME_UNITS[unit]:g}ml"
+    return unit if unit in PIECE_UNITS else None
+
+
+def quantities(text: str) -> frozenset[str]:
+    """The numbers, number words and units in a text, e.g. "2 cups of milk" -> {"2", "240ml"}."""
+    found = set()
+    previous = ""
+    # Split "100g" into "100" and "g"
+    for token in re.findall(r"\d+(?:\.\d+)?|[a-z]+", text.lower()):
+        if token[0].isdigit():
+            found.add(f"{float(token):g}")
+        elif token in NUMBER_WORDS:
+            found.add(token)
+        # Single letters only count as units right after a number, "100 g" but not "vitamin c"
+        elif len(token) > 1 or previous[:1].isdigit():
+            unit = canonical_unit(token)
+            if unit is not None:
+                found.add(unit)
+        previous = token
+    return frozenset(found)
+
+
+def match_word_table(food_name: str, table: dict, default):
+    """
+    The value of the last word of the food name found in the table. The last word
+    is usually the head noun, e.g. "peanut butter" is a butter, not a peanut.
+    """
+    for word in reversed(fold_food_name(food_name).split()):
+        if word in table:
+            return table[word]
+    return default
+
+
+def ingredient_amounts(
+    quantities: list[float], units: list[str], food_names: list[str], per_ml: list[bool]
+) -> tuple[np.ndarray, list[str]]:
+    """
+    Convert the quantities to the base amount of the calorie table, grams or milliliters.
+
+    Returns:
+        The base amounts and, for each ingredient, the assumption that was made (or "").
+    """
+    amounts = np.zeros(len(quantities))
+    notes = []
+    for i, (quantity, unit, name, is_ml) in enumerate(zip(quantities, units, food_names, per_ml)):
+        unit = normalize_unit(unit)
+        density = match_word_table(name, DENSITIES, DEFAULT_DENSITY)
+        note = ""
+
+        if unit in MASS_UNITS:
+            grams = quantity * MASS_UNITS[unit]
+            amounts[i] = grams / density if is_ml else grams
+        elif unit in VOLUME_UNITS:
+            ml = quantity * VOLUME_UNITS[unit]
+            amounts[i] = ml if is_ml else ml * density
+        else:
+            weight = match_word_table(name, PORTION_WEIGHTS, None)
+            if weight is None:
+                weight = DEFAULT_PORTION_WEIGHT
+                note = f"assumed {DEFAULT_PORTION_WEIGHT}g per {unit or 'piece'}"
+            if unit not in PIECE_UNITS and not note:
+                note = f"unknown unit '{unit}', counted as pieces"
+            grams = quantity * weight * PIECE_SIZE_FACTORS.get(unit, 1.0)
+            amounts[i] = grams / density if is_ml else grams
+
+        notes.append(note)
+
+    return amounts, notes
+
+
+def calculate_meal(ingredients: list[dict], matches: list[dict | None]) -> dict:
+    """
+    Compute the calories of each ingredient and the total.
+
+    Args:
+        ingredients: Dicts with "ingredient", "quantity" and "unit".
+        matches: The calorie table entry of each ingredient, or None if it wasn't found.
+
+    Returns:
+        The "rows" with the matched food, amount and calories of each ingredient,
+        and the "total_calories" of the ingredients that were found.
+    """
+    found = np.array([match is not None for match in matches], dtype=bool)
+    per_ml = [bool(match) and match.get("serving_info") == "100ml" for match in matches]
+    calories_per_100 = np.array(
+        [float(match.get("calories_per_100g", 0.0)) if match else 0.0 for match in matches]
+    )
+
+    amounts, notes = ingredient_amounts(
+        [float(ingredient["quantity"]) for ingredient in ingredients],
+        [ingredient["unit"] for ingredient in ingredients],
+        [
+            match["food_item"] if match else ingredient["ingredient"]
+            for ingredient, match in zip(ingredients, matches)
+        ],
+        per_ml,
+    )
+    calories = np.where(found, amounts * calories_per_100 / 100.0, 0.0)
+
+    rows = []
+    for i, ingredient in enumerate(ingredients):
+        rows.append(
+            {
+                "ingredient": ingredient["ingredient"],
+                "quantity": ingredient["quantity"],
+                "unit": ingredient["unit"],
+                "matched_food": matches[i]["food_item"] if found[i] else None,
+                "amount": round(float(amounts[i]), 1),
+                "base_unit": "ml" if per_ml[i] else "g",
+                "calories": round(float(calories[i]), 1),
+                "note": notes[i],
+            }
+        )
+
+    return {"rows": rows, "total_calories": round(float(calories.sum()), 1)}
+
+
+def format_meal(result: dict) -> str:
+    lines = []
+    for row in result["rows"]:
+        if row["matched_food"] is None:
+            lines.append(
+                f"- {row['quantity']} {row['unit']} {row['ingredient']}: "
+                "not found in the calorie database, not counted"
+            )
+            continue
+
+        line = (
+            f"- {row['quantity']} {row['unit']} {row['ingredient']} "
+            f"(matched: {row['matched_food']}, {row['amount']}{row['base_unit']}): "
+            f"{row['calories']} kcal"
+        )
+        if row["note"]:
+            line += f" ({row['note']})"
+        lines.append(line)
+
+    lines.append(f"Total: {result['total_calories']} kcal")
+    return "\n".join(lines)
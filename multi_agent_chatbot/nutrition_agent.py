@@ -1,5 +1,15 @@
+import asyncio
+import contextvars
+import functools
+import logging
+import math
 import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Literal
 
 import chromadb
 from agents import (
@@ -10,20 +20,347 @@ from agents import (
     TResponseInputItem,
     function_tool,
     input_guardrail,
+    set_tracing_disabled,
 )
 from agents.mcp import MCPServerStreamableHttp
+from bm25_index import BM25Index, default_bm25_path, reciprocal_rank_fusion, tokenize
+from chromadb.errors import NotFoundError
+from chromadb.utils.embedding_functions import ONNXMiniLM_L6_V2
+from collection_version import compute_version, default_version_path, read_version
+from embedding_cache import CachedEmbeddingFunction, EmbeddingCache, default_cache_path
+from food_index import FoodIndex, fold_food_name, normalize_food_name
+from food_table import FoodTable
+from index_snapshot import CURRENT_FILE, SnapshotReader, default_snapshots_path
+from llm_scheduler import BACKGROUND, LLMScheduler, background_agent_tool, priority, use_scheduled_models
+from lookup_cache import LookupCache, file_generation, rebuilt_on_change
+from mcp_connection import ManagedMCPServer
+from meal_calculator import calculate_meal, format_meal
 from pydantic import BaseModel
+from replay import RecordReplayMCPServer, ReplayStore, default_replay_path, use_record_replay_models
+from search_cache import CachedMCPServer, SearchCache
+from search_cache import default_cache_path as default_search_cache_path
+from session_window import history_summarizer_agent
+from telemetry import record_latency, timed, traced_agent_tool, up_down_counter
+from topic_classifier import TopicClassifier
+from vector_store import NumpyVectorStore, default_index_path
+
+logger = logging.getLogger(__name__)
+setup_started = time.perf_counter()
 
 # This is the same code as in the rag.ipynb notebook
 
 
 chroma_path = Path(__file__).parent.parent / "chroma"
-chroma_client = chromadb.PersistentClient(path=str(chroma_path))
-nutrition_db = chroma_client.get_collection(name="nutrition_db")
+
+# Written by rag_setup/create_calorie_database.py whenever the collection changed
+version_path = default_version_path(chroma_path)
+
+# "chroma" searches nutrition_db through its HNSW index, "numpy" runs an exact
+# brute-force search over a memory-mapped export of the same collection, "snapshot"
+# serves read-only from the snapshot an ingestion run published last, without ever
+# opening chroma/ (for several workers sharing one machine)
+retrieval_backend = os.environ.get("NUTRITION_BACKEND", "chroma")
+snapshot_path = Path(os.environ.get("INDEX_SNAPSHOT_PATH", default_snapshots_path))
+
+# The numpy backend can search "float16" or "int8" embeddings instead, 2x or 4x smaller,
+# and re-rank NUMPY_RERANK_FACTOR candidates per result exactly (0 turns re-ranking off)
+numpy_quantization = os.environ.get("NUMPY_QUANTIZATION") or None
+numpy_rerank_factor = int(os.environ.get("NUMPY_RERANK_FACTOR", 4))
+
+# "hybrid" fuses the vector search with a BM25 keyword search over the food names and
+# categories, "vector" only runs the vector search
+retrieval_mode = os.environ.get("NUTRITION_RETRIEVAL", "hybrid")
+
+# How many candidates each leg of a hybrid lookup contributes to the rank fusion
+hybrid_candidates = int(os.environ.get("NUTRITION_HYBRID_CANDIDATES", 10))
+
+# Set once the first real vector search ran, so its (cold start) duration gets logged
+_first_query_logged = False
+
+# Reentrant, because the getters below call each other
+_init_lock = threading.RLock()
+
+
+def init_once(getter):
+    """
+    Cache the result of a getter like functools.cache, but let concurrent first calls
+    (from the lookup threads) wait for a single initialization instead of each opening
+    the collection or loading an index of their own.
+    """
+    cached = functools.cache(getter)
+
+    @functools.wraps(getter)
+    def wrapper():
+        if cached.cache_info().currsize:
+            return cached()
+        with _init_lock:
+            return cached()
+
+    wrapper.cache_clear = cached.cache_clear
+    wrapper.cache_info = cached.cache_info
+    return wrapper
+
+
+@init_once
+def get_nutrition_db() -> chromadb.Collection:
+    """Open the shared ChromaDB client and the nutrition_db collection on first use."""
+    start = time.perf_counter()
+    chroma_client = chromadb.PersistentClient(path=str(chroma_path))
+    try:
+        nutrition_db = chroma_client.get_collection(name="nutrition_db")
+    except NotFoundError as e:
+        raise RuntimeError(
+            f"The nutrition_db collection does not exist in {chroma_path}. "
+            "Create it with rag_setup/create_calorie_database.py."
+        ) from e
+
+    logger.info("Opened nutrition_db in %.3fs", time.perf_counter() - start)
+    return nutrition_db
+
+
+def nutrition_db_version() -> str:
+    """The version of nutrition_db recorded at ingestion, computed from the collection if there's none."""
+    return read_version(version_path) or compute_version(get_nutrition_db())
+
+
+@init_once
+def get_snapshot_reader() -> SnapshotReader:
+    return SnapshotReader(
+        snapshot_path,
+        check_interval=float(os.environ.get("INDEX_SNAPSHOT_CHECK_SECONDS", 5)),
+        quantization=numpy_quantization,
+        rerank_factor=numpy_rerank_factor,
+    )
+
+
+@init_once
+def get_vector_search():
+    """The vector search backend selected with NUTRITION_BACKEND, created on first use."""
+    if retrieval_backend == "snapshot":
+        return get_snapshot_reader()
+    if retrieval_backend == "numpy":
+        return NumpyVectorStore.load_or_export(
+            get_nutrition_db(),
+            os.environ.get("NUMPY_INDEX_PATH", default_index_path),
+            version=nutrition_db_version(),
+            quantization=numpy_quantization,
+            rerank_factor=numpy_rerank_factor,
+        )
+    return get_nutrition_db()
+
+
+@init_once
+def get_keyword_search() -> BM25Index | SnapshotReader:
+    """
+    The BM25 index written at ingestion, rebuilt from nutrition_db if it's missing or stale.
+    The snapshot backend serves it from the live snapshot instead.
+    """
+    if retrieval_backend == "snapshot":
+        return get_snapshot_reader()
+    return BM25Index.load_or_build(
+        get_nutrition_db(),
+        os.environ.get("BM25_INDEX_PATH", default_bm25_path(chroma_path)),
+        version=nutrition_db_version(),
+    )
+
+
+# Runs the keyword leg of a hybrid lookup while the vector leg embeds and searches
+keyword_search_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="keyword_search")
+
+# Query embeddings survive restarts and are shared by all worker processes
+embedding_cache = EmbeddingCache(
+    os.environ.get("EMBEDDING_CACHE_PATH", default_cache_path),
+    model_name=ONNXMiniLM_L6_V2.MODEL_NAME,
+)
+embed_queries = CachedEmbeddingFunction(ONNXMiniLM_L6_V2(), embedding_cache)
+
+# Changes when the collection is rebuilt (or a new snapshot is published)
+data_generation = file_generation(
+    snapshot_path / CURRENT_FILE if retrieval_backend == "snapshot" else version_path
+)
+
+# Exact and fuzzy name matches are answered from memory, only misses go to nutrition_db.
+# Rebuilt from the CSV after an ingestion run, like the lookup cache is cleared.
+get_food_index = rebuilt_on_change(FoodIndex.from_csv, data_generation)
+
+# Filter, sort and top-k queries by category and calories, answered from NumPy columns
+get_food_table = rebuilt_on_change(FoodTable.from_csv, data_generation)
+
+# Vector search results shared by all sessions, cleared when the collection is rebuilt
+lookup_cache = LookupCache(
+    maxsize=int(os.environ.get("LOOKUP_CACHE_SIZE", 4096)),
+    ttl=float(os.environ.get("LOOKUP_CACHE_TTL_SECONDS", 3600)),
+    generation=data_generation,
+)
+
+# How many lookups were served by each path: "exact", "fuzzy", "cache", "vector" or "hybrid"
+lookup_stats = Counter()
+
+
+def format_nutrition_results(metadatas: list[dict]) -> list[str]:
+    """Format the metadata of the matched food items as lines for the agent."""
+    formatted_results = []
+    for metadata in metadatas:
+        food_item = metadata["food_item"].title()
+        calories = metadata["calories_per_100g"]
+        category = metadata["food_category"].title()
+
+        formatted_results.append(
+            f"{food_item} ({category}): {calories} calories per 100g"
+        )
+
+    return formatted_results
+
+
+def log_first_query(duration: float) -> None:
+    global _first_query_logged
+
+    if not _first_query_logged:
+        _first_query_logged = True
+        logger.info("First vector search took %.3fs", duration)
+
+
+def warmup() -> None:
+    """
+    Open nutrition_db, load the embedding model, run a dummy query and build the
+    in-memory food indexes. Call it before the app reports ready, so the first user doesn't pay for the cold start.
+    """
+    start = time.perf_counter()
+    # Skip the embedding cache, it would spare loading the model
+    query_embeddings = embed_queries.embedding_function(["banana"])
+    get_vector_search().query(query_embeddings=query_embeddings, n_results=1)
+    if retrieval_mode == "hybrid":
+        get_keyword_search()
+    get_food_table()
+    get_topic_classifier()
+    log_first_query(time.perf_counter() - start)
+    logger.info("Warmed up the calorie lookup in %.3fs", time.perf_counter() - start)
+
+
+def keyword_search(texts: list[str], n_results: int) -> dict:
+    with timed("calorie_lookup.keyword_search"):
+        return get_keyword_search().search_many(texts, n_results)
+
+
+def lookup_foods(
+    foods: list[str], max_results: int, max_distance: float | None = None
+) -> list[list[dict]]:
+    """
+    Look up the nutrition metadata of each food item.
+
+    Food items found in the in-memory food index or the lookup cache skip the vector
+    search, the remaining ones are embedded and searched with a single query. In hybrid
+    mode a BM25 keyword search runs in a thread at the same time, and both rankings are
+    merged with reciprocal rank fusion.
+
+    With `max_distance`, searched matches farther than that from the food item (squared
+    L2 distance of the embeddings) are dropped, so an unknown food gets no match rather
+    than the nearest unrelated one. Exact and fuzzy name matches, and keyword matches whose
+    whole name is in the food item, are always kept.
+    """
+    results = [[] for _ in foods]
+    misses = []
+
+    food_index = get_food_index()
+    for i, food in enumerate(foods):
+        metadatas, source = food_index.lookup(food, max_results)
+        if source is None:
+            metadatas = lookup_cache.get((fold_food_name(food), max_results, max_distance))
+            source = "cache" if metadatas is not None else None
+
+        if source is None:
+            misses.append(i)
+            continue
+
+        results[i] = metadatas
+        lookup_stats[source] += 1
+        logger.info("calorie lookup for %r served by %s", food, source)
+
+    if misses:
+        texts = [foods[i] for i in misses]
+        hybrid = retrieval_mode == "hybrid"
+        n_results = max(max_results, hybrid_candidates) if hybrid else max_results
+
+        if hybrid:
+            # Copy the context, so the keyword search span nests under the lookup span
+            keyword_future = keyword_search_executor.submit(
+                contextvars.copy_context().run, keyword_search, texts, n_results
+            )
+
+        # A single query embeds and searches all the missed food items in one go
+        start = time.perf_counter()
+        with timed("calorie_lookup.embedding"):
+            query_embeddings = embed_queries(texts)
+        with timed("calorie_lookup.search", backend=retrieval_backend):
+            query_results = get_vector_search().query(
+                query_embeddings=query_embeddings,
+                n_results=n_results,
+            )
+        log_first_query(time.perf_counter() - start)
+
+        if hybrid:
+            keyword_results = keyword_future.result()
+
+        source = "hybrid" if hybrid else "vector"
+        for j, i in enumerate(misses):
+            ids = query_results["ids"][j]
+            by_id = dict(zip(ids, query_results["metadatas"][j]))
+            if hybrid:
+                by_id.update(zip(keyword_results["ids"][j], keyword_results["metadatas"][j]))
+                ids = reciprocal_rank_fusion([ids, keyword_results["ids"][j]], n_results)
+            if max_distance is not None:
+                # A keyword match without a close embedding only counts if the food item
+                # names nothing but words of the query, e.g. "apple" for "granny smith apple"
+                distances = dict(zip(query_results["ids"][j], query_results["distances"][j]))
+                query_words = set(tokenize(foods[i]))
+                ids = [
+                    id_
+                    for id_ in ids
+                    if distances.get(id_, math.inf) <= max_distance
+                    or set(tokenize(by_id[id_]["food_item"])) <= query_words
+                ]
+            metadatas = [by_id[id_] for id_ in ids[:max_results]]
+
+            results[i] = metadatas
+            lookup_cache.put((fold_food_name(foods[i]), max_results, max_distance), metadatas)
+            lookup_stats[source] += 1
+            logger.info("calorie lookup for %r served by %s", foods[i], source)
+
+    return results
+
+
+# Lookups run in a bounded thread pool, so the ONNX embedding and the vector search
+# never block the event loop that streams the answers of all the other chats
+lookup_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("LOOKUP_WORKERS", 4)), thread_name_prefix="calorie_lookup"
+)
+# How many lookups are waiting for a thread of the pool
+lookup_queue_depth = up_down_counter("calorie_lookup.queue_depth")
+
+
+async def lookup_foods_async(
+    foods: list[str], max_results: int, max_distance: float | None = None
+) -> list[list[dict]]:
+    """lookup_foods in the lookup thread pool, recording the queue wait and execution time."""
+    submitted = time.perf_counter()
+    lookup_queue_depth.add(1)
+
+    def run() -> list[list[dict]]:
+        started = time.perf_counter()
+        lookup_queue_depth.add(-1)
+        record_latency("calorie_lookup.queue_wait", started - submitted)
+        try:
+            return lookup_foods(foods, max_results, max_distance)
+        finally:
+            record_latency("calorie_lookup.execution", time.perf_counter() - started)
+
+    # Copy the context, so the lookup spans nest under the tool's span
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(lookup_executor, context.run, run)
 
 
 @function_tool
-def calorie_lookup_tool(query: str, max_results: int = 3) -> str:
+async def calorie_lookup_tool(query: str, max_results: int = 3) -> str:
     """
     Tool function for a RAG database to look up calorie information for specific food items, but not for meals.
 
@@ -35,36 +372,206 @@ def calorie_lookup_tool(query: str, max_results: int = 3) -> str:
         A string containing the nutrition information.
     """
 
-    results = nutrition_db.query(query_texts=[query], n_results=max_results)
+    with timed("calorie_lookup", tool="calorie_lookup_tool"):
+        metadatas = (await lookup_foods_async([query], max_results))[0]
 
-    if not results["documents"][0]:
+    if not metadatas:
         return f"No nutrition information found for: {query}"
 
     # Format results for the agent
-    formatted_results = []
-    for i, doc in enumerate(results["documents"][0]):
-        metadata = results["metadatas"][0][i]
-        food_item = metadata["food_item"].title()
-        calories = metadata["calories_per_100g"]
-        category = metadata["food_category"].title()
+    formatted_results = format_nutrition_results(metadatas)
 
-        formatted_results.append(
-            f"{food_item} ({category}): {calories} calories per 100g"
+    return "Nutrition Information:\n" + "\n".join(formatted_results)
+
+
+@function_tool
+async def calorie_lookup_batch_tool(foods: list[str], max_results: int = 3) -> str:
+    """
+    Tool function for a RAG database to look up calorie information for several food items at once, but not for meals.
+    Prefer this tool over calorie_lookup_tool when you need the calories of more than one ingredient.
+
+    Args:
+        foods: The food items to look up, one entry per food item.
+        max_results: The maximum number of results to return per food item.
+
+    Returns:
+        A string containing the nutrition information grouped per food item.
+    """
+
+    if not foods:
+        return "No food items were given to look up."
+
+    sections = []
+    with timed("calorie_lookup", tool="calorie_lookup_batch_tool"):
+        results = await lookup_foods_async(foods, max_results)
+
+    for food, metadatas in zip(foods, results):
+        if not metadatas:
+            sections.append(f"No nutrition information found for: {food}")
+            continue
+
+        formatted_results = format_nutrition_results(metadatas)
+        sections.append(
+            f"Nutrition Information for {food}:\n" + "\n".join(formatted_results)
         )
 
-    return "Nutrition Information:\n" + "\n".join(formatted_results)
+    return "\n\n".join(sections)
+
+
+# Ingredients whose nearest food is farther than this (squared L2 distance) count as not
+# found instead of adding the calories of an unrelated food. Foods in the table score
+# about 0.3 to 1.0 against their own name, unrelated text 1.1 and more.
+meal_match_max_distance = float(os.environ.get("MEAL_MATCH_MAX_DISTANCE", 1.05))
+
+
+class MealIngredient(BaseModel):
+    ingredient: str
+    quantity: float
+    unit: str
+
+
+@function_tool
+async def meal_calorie_calculator_tool(ingredients: list[MealIngredient]) -> str:
+    """
+    Tool function to calculate the calories of a meal from its ingredients and their quantities.
+    It looks up every ingredient and does the unit conversion and the arithmetic, so use it
+    instead of adding up the calories yourself.
+
+    Args:
+        ingredients: The ingredients of one serving, each with its quantity and unit
+            (g, kg, oz, lb, ml, l, cup, tbsp, tsp, or piece / slice / small / medium / large).
+
+    Returns:
+        A string with the calories of each ingredient and the total calories.
+    """
+
+    if not ingredients:
+        return "No ingredients were given."
+
+    invalid = [item for item in ingredients if not item.quantity > 0]
+    if invalid:
+        return "The quantities must be greater than zero, fix these ingredients: " + ", ".join(
+            f"{item.ingredient} ({item.quantity:g} {item.unit})" for item in invalid
+        )
+
+    with timed("calorie_lookup", tool="meal_calorie_calculator_tool"):
+        results = await lookup_foods_async(
+            [item.ingredient for item in ingredients], 1, meal_match_max_distance
+        )
+
+    meal = calculate_meal(
+        [item.model_dump() for item in ingredients],
+        [metadatas[0] if metadatas else None for metadatas in results],
+    )
+    return format_meal(meal)
+
+
+@function_tool
+def food_table_query_tool(
+    category: str | None = None,
+    min_calories: float | None = None,
+    max_calories: float | None = None,
+    sort_by: Literal["calories", "name"] = "calories",
+    descending: bool = False,
+    limit: int = 10,
+) -> str:
+    """
+    Tool function to find food items by category and calorie range, e.g. "fruits under 50 calories
+    per 100g" or "the 5 cheeses with the most calories". Use it for questions that filter, sort or
+    rank foods by their calories, not to look up a specific food.
+
+    Args:
+        category: The food category, e.g. "fruits", "cheese", "poultry", or None for all foods.
+        min_calories: The minimum calories per 100g, inclusive.
+        max_calories: The maximum calories per 100g, inclusive.
+        sort_by: Sort the foods by "calories" or by "name".
+        descending: Sort from the highest to the lowest calories (or from Z to A).
+        limit: The maximum number of foods to return.
+
+    Returns:
+        A string listing the matching food items with their calories.
+    """
+
+    food_table = get_food_table()
+    with timed("food_table.query"):
+        categories = None
+        if category:
+            categories = food_table.match_categories(category)
+            if not categories:
+                return f"No food category matches {category!r}. The categories are: " + ", ".join(
+                    food_table.category_labels
+                )
+
+        rows, total = food_table.query(
+            categories, min_calories, max_calories, sort_by, descending, max(limit, 0)
+        )
+
+    if total == 0:
+        return "No food items match these criteria."
+
+    lines = []
+    for position in rows:
+        row = food_table.row(position)
+        lines.append(
+            f"{row['food_item']} ({row['food_category']}): "
+            f"{row['calories']:g} calories per {row['serving_info']}"
+        )
+    return f"{total} food items match, showing {len(lines)}:\n" + "\n".join(lines)
 
 
 # EXA Search MCP setup
-exa_search_mcp = MCPServerStreamableHttp(
-    name="Exa Search MCP",
-    params={
-        "url": f"https://mcp.exa.ai/mcp?{os.environ.get('EXA_API_KEY')}",
-        "timeout": 30,
-    },
-    client_session_timeout_seconds=30,
-    cache_tools_list=True,
-    max_retry_attempts=1,
+def create_exa_search_mcp() -> MCPServerStreamableHttp:
+    return MCPServerStreamableHttp(
+        name="Exa Search MCP",
+        params={
+            "url": f"https://mcp.exa.ai/mcp?{os.environ.get('EXA_API_KEY')}",
+            "timeout": 30,
+        },
+        client_session_timeout_seconds=30,
+        cache_tools_list=True,
+        max_retry_attempts=1,
+    )
+
+
+# One connection for the whole process, shared by all chats and reconnected when it breaks
+exa_search_mcp = ManagedMCPServer(
+    create_exa_search_mcp,
+    max_concurrent_calls=int(os.environ.get("EXA_MCP_MAX_CONCURRENT_CALLS", 8)),
+    health_check_interval=float(os.environ.get("EXA_MCP_HEALTH_CHECK_SECONDS", 30)),
+)
+
+# Offline benchmarking: "record" saves the model responses and web searches, "replay" serves them
+replay_mode = os.environ.get("AGENT_REPLAY_MODE")
+if replay_mode:
+    replay_store = ReplayStore(os.environ.get("AGENT_REPLAY_PATH", default_replay_path))
+    exa_search_mcp = RecordReplayMCPServer(
+        replay_store,
+        replay_mode,
+        server=exa_search_mcp if replay_mode == "record" else None,
+        name="Exa Search MCP",
+        latency=float(os.environ.get("REPLAY_MCP_LATENCY_SECONDS", 0)),
+    )
+
+# Cache the web searches on disk: recipes rarely change, prices do
+search_cache = SearchCache(os.environ.get("EXA_SEARCH_CACHE_PATH", default_search_cache_path))
+recipe_cache_ttl = float(os.environ.get("EXA_RECIPE_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+price_cache_ttl = float(os.environ.get("EXA_PRICE_CACHE_TTL_SECONDS", 6 * 3600))
+if replay_mode:
+    # Recordings must contain every search, so don't cache while recording or replaying
+    recipe_cache_ttl = price_cache_ttl = 0
+
+recipe_search_mcp = CachedMCPServer(
+    exa_search_mcp,
+    search_cache,
+    namespace="recipes",
+    default_ttl=recipe_cache_ttl,
+)
+
+price_search_mcp = CachedMCPServer(
+    exa_search_mcp,
+    search_cache,
+    namespace="prices",
+    default_ttl=price_cache_ttl,
 )
 
 # 1st Agent: Our "Calorie Agent"
@@ -80,12 +587,19 @@ calorie_agent_with_search = Agent(
         information of the ingredients to make sure the information you provide is consistent.
         2) Then, if necessary, use the calorie_lookup_tool to get the calorie information of the ingredients.
     * Even if you know the recipe of the meal, always use Exa Search to find the exact recipe and ingredients.
-    * Once you know the ingredients, use the calorie_lookup_tool to get the calorie information of the individual ingredients.
+    * Once you know the ingredients and their quantities, use the meal_calorie_calculator_tool in a single call to get the calories of each ingredient and the total. Don't do the arithmetic yourself.
+    * If you only need the calorie information of several ingredients, use the calorie_lookup_batch_tool in a single call.
+    * For questions that filter or rank foods by category or calories (e.g. "which fruits have under 50 calories per 100g"), use the food_table_query_tool in a single call instead of looking up foods one by one.
     * If the query is about the meal, in your final output give a list of ingredients with their quantities and calories for a single serving. Also display the total calories.
     * Don't use the calorie_lookup_tool more than 10 times.
     """,
-    tools=[calorie_lookup_tool],
-    mcp_servers=[exa_search_mcp],
+    tools=[
+        calorie_lookup_tool,
+        calorie_lookup_batch_tool,
+        meal_calorie_calculator_tool,
+        food_table_query_tool,
+    ],
+    mcp_servers=[recipe_search_mcp],
 )
 
 # 2nd Agent: Our Healthy Breakfast Plan Advisor
@@ -100,14 +614,22 @@ healthy_breakfast_planner_agent = Agent(
 )
 
 # Convert agents to tools
-calorie_calculator_tool = calorie_agent_with_search.as_tool(
-    tool_name="calorie-calculator",
-    tool_description="Use this tool to calculate the calories of a meal and it's ingredients",
+calorie_calculator_tool = traced_agent_tool(
+    background_agent_tool(
+        calorie_agent_with_search.as_tool(
+            tool_name="calorie-calculator",
+            tool_description="Use this tool to calculate the calories of a meal and it's ingredients",
+        )
+    )
 )
 
-breakfast_planner_tool = healthy_breakfast_planner_agent.as_tool(
-    tool_name="breakfast-planner",
-    tool_description="Use this tool to plan a a number of healthy breakfast options",
+breakfast_planner_tool = traced_agent_tool(
+    background_agent_tool(
+        healthy_breakfast_planner_agent.as_tool(
+            tool_name="breakfast-planner",
+            tool_description="Use this tool to plan a a number of healthy breakfast options",
+        )
+    )
 )
 
 # 3rd Agent: Breakfast Price Checker
@@ -119,7 +641,7 @@ breakfast_price_checker_agent = Agent(
     * In your final output prove the meal name, ingredients with calories and price for each meal.
     * Use markdown and be as concise as possible.
     """,
-    mcp_servers=[exa_search_mcp],
+    mcp_servers=[price_search_mcp],
 )
 
 # 4th Agent: Main Breakfast Advisor that glues everything together
@@ -145,6 +667,98 @@ breakfast_advisor = Agent(
 )
 
 
+# Parallel breakfast advisor: the per-meal sub-agents run concurrently
+meal_concurrency = int(os.environ.get("MEAL_CONCURRENCY", 4))
+
+
+async def run_per_meal(agent: Agent, meals: list[str], context=None) -> list[str]:
+    """
+    Run the agent once for every meal, at most `meal_concurrency` at a time.
+
+    Returns:
+        The final output for each meal, in the order of the meals.
+    """
+    semaphore = asyncio.Semaphore(meal_concurrency)
+
+    async def run(meal: str) -> str:
+        async with semaphore:
+            with timed("agent.tool_run", agent=agent.name), priority(BACKGROUND):
+                result = await Runner.run(agent, meal, context=context)
+            return str(result.final_output)
+
+    outputs = await asyncio.gather(*(run(meal) for meal in meals), return_exceptions=True)
+
+    # Cancellation (e.g. the turn was cancelled) isn't a failure of one meal, pass it on
+    for output in outputs:
+        if isinstance(output, BaseException) and not isinstance(output, Exception):
+            raise output
+
+    # One failing meal shouldn't take the others down
+    return [
+        f"Could not process this meal: {output}" if isinstance(output, Exception) else output
+        for output in outputs
+    ]
+
+
+def format_meal_outputs(meals: list[str], outputs: list[str]) -> str:
+    return "\n\n".join(
+        f"## Meal {i}: {meal}\n{output}"
+        for i, (meal, output) in enumerate(zip(meals, outputs), start=1)
+    )
+
+
+@function_tool
+async def calorie_calculator_batch_tool(ctx: RunContextWrapper, meals: list[str]) -> str:
+    """
+    Calculate the calories of several meals and their ingredients at once.
+    Use this tool instead of calculating the meals one by one.
+
+    Args:
+        meals: The meals, each given as its name and, if known, its ingredients.
+
+    Returns:
+        The ingredients with calories of each meal, in the given order.
+    """
+    outputs = await run_per_meal(calorie_agent_with_search, meals, ctx.context)
+    return format_meal_outputs(meals, outputs)
+
+
+@function_tool
+async def breakfast_price_checker_batch_tool(ctx: RunContextWrapper, meals: list[str]) -> str:
+    """
+    Check the prices of the ingredients of several meals at once.
+
+    Args:
+        meals: The meals, each given as its name with its ingredients and calories.
+
+    Returns:
+        The ingredients with calories and prices of each meal, in the given order.
+    """
+    outputs = await run_per_meal(breakfast_price_checker_agent, meals, ctx.context)
+    return format_meal_outputs(meals, outputs)
+
+
+breakfast_advisor_parallel = Agent(
+    name="Breakfast Advisor",
+    instructions="""
+    * You are a breakfast advisor. You come up with meal plans for the user based on their preferences.
+    * You also calculate the calories and the prices for the meals and their ingredients.
+    * Create a meal plan for the user. For each meal, give a name, the ingredients, the calories and the prices.
+
+    Follow this workflow carefully:
+    1) Use the breakfast-planner tool to plan a a number of healthy breakfast options.
+    2) Use the calorie_calculator_batch_tool ONCE with all the meals to calculate the calories for the meals and their ingredients.
+    3) Use the breakfast_price_checker_batch_tool ONCE with all the meals, their ingredients and calories to add the prices.
+    4) Create a concise breakfast recommendation from the results. Use Markdown format.
+    """,
+    tools=[
+        breakfast_planner_tool,
+        calorie_calculator_batch_tool,
+        breakfast_price_checker_batch_tool,
+    ],
+)
+
+
 # Guardrails functionality
 class NotAboutFood(BaseModel):
     only_about_food: bool
@@ -157,15 +771,96 @@ guardrail_agent = Agent(
 )
 
 
+def nearest_food_distance(text: str) -> float:
+    """The vector distance of the text to the closest food item in nutrition_db."""
+    results = get_vector_search().query(
+        query_embeddings=embed_queries([text]), n_results=1
+    )
+    return results["distances"][0][0] if results["distances"][0] else float("inf")
+
+
+# Settles obviously on- and off-topic messages locally, the rest goes to the guardrail agent.
+# Its food vocabulary comes from the food index, so it's rebuilt along with it.
+get_topic_classifier = rebuilt_on_change(
+    lambda: TopicClassifier(get_food_index(), nearest_food_distance=nearest_food_distance),
+    data_generation,
+)
+
+# Guardrail verdicts per normalized message
+guardrail_cache = LookupCache(
+    maxsize=int(os.environ.get("GUARDRAIL_CACHE_SIZE", 4096)),
+    ttl=float(os.environ.get("GUARDRAIL_CACHE_TTL_SECONDS", 3600)),
+)
+
+# How many guardrail checks were settled by each stage: "cache", "local" or "llm"
+guardrail_stats = Counter()
+
+
+def latest_user_message(input: str | list[TResponseInputItem]) -> str:
+    """
+    The text of the newest user message.
+    Earlier messages of the conversation were checked when they were sent.
+    """
+    if isinstance(input, str):
+        return input
+
+    for item in reversed(input):
+        if item.get("role") == "user":
+            content = item.get("content", "")
+            if isinstance(content, str):
+                return content
+            return " ".join(
+                part.get("text", "") for part in content if isinstance(part, dict)
+            )
+
+    return ""
+
+
+async def check_food_topic(
+    input: str | list[TResponseInputItem], context=None
+) -> NotAboutFood:
+    """
+    Decide if the newest message is about food: from the cache, locally or by the guardrail agent.
+
+    Unlike the original guardrail, which sent the whole input to the guardrail agent, only
+    the newest user message is checked: the earlier ones were checked when they were sent,
+    and the verdict of a message can be cached independently of the conversation.
+    """
+    message = latest_user_message(input)
+    key = normalize_food_name(message)
+
+    with timed("guardrail.check") as attributes:
+        verdict = guardrail_cache.get(key)
+        if verdict is not None:
+            stage = "cache"
+        else:
+            # The local check may embed the message, keep that off the event loop
+            only_about_food = await asyncio.to_thread(get_topic_classifier().classify, message)
+            if only_about_food is not None:
+                verdict = NotAboutFood(only_about_food=only_about_food)
+                stage = "local"
+            else:
+                result = await Runner.run(guardrail_agent, message, context=context)
+                verdict = result.final_output
+                stage = "llm"
+            guardrail_cache.put(key, verdict)
+
+        guardrail_stats[stage] += 1
+        attributes["stage"] = stage
+        attributes["only_about_food"] = verdict.only_about_food
+
+    return verdict
+
+
 @input_guardrail
 async def food_topic_guardrail(
     ctx: RunContextWrapper[None], agent: Agent, input: str | list[TResponseInputItem]
 ) -> GuardrailFunctionOutput:
-    result = await Runner.run(guardrail_agent, input, context=ctx.context)
+    verdict = await check_food_topic(input, context=ctx.context)
 
     return GuardrailFunctionOutput(
-        output_info=result.final_output,
-        tripwire_triggered=(not result.final_output.only_about_food),
+        output_info=verdict,
+        tripwire_triggered=(not verdict.only_about_food),
     )
 
 
@@ -182,13 +877,20 @@ calorie_agent_with_search_guarded = Agent(
         information of the ingredients to make sure the information you provide is consistent.
         2) Then, if necessary, use the calorie_lookup_tool to get the calorie information of the ingredients.
     * Even if you know the recipe of the meal, always use Exa Search to find the exact recipe and ingredients.
-    * Once you know the ingredients, use the calorie_lookup_tool to get the calorie information of the individual ingredients.
+    * Once you know the ingredients and their quantities, use the meal_calorie_calculator_tool in a single call to get the calories of each ingredient and the total. Don't do the arithmetic yourself.
+    * If you only need the calorie information of several ingredients, use the calorie_lookup_batch_tool in a single call.
+    * For questions that filter or rank foods by category or calories (e.g. "which fruits have under 50 calories per 100g"), use the food_table_query_tool in a single call instead of looking up foods one by one.
     * If the query is about the meal, in your final output give a list of ingredients with their quantities and calories for a single serving. Also display the total calories.
     * Don't use the calorie_lookup_tool more than 10 times.
     * You only answer questions about food.
     """,
-    tools=[calorie_lookup_tool],
-    mcp_servers=[exa_search_mcp],
+    tools=[
+        calorie_lookup_tool,
+        calorie_lookup_batch_tool,
+        meal_calorie_calculator_tool,
+        food_table_query_tool,
+    ],
+    mcp_servers=[recipe_search_mcp],
     input_guardrails=[food_topic_guardrail],
 )
 
@@ -215,5 +917,44 @@ breakfast_advisor_guarded = Agent(
     input_guardrails=[food_topic_guardrail],
 )
 
+breakfast_advisor_parallel_guarded = breakfast_advisor_parallel.clone(
+    instructions=breakfast_advisor_parallel.instructions
+    + "* You only answer questions about food.\n",
+    input_guardrails=[food_topic_guardrail],
+)
+
 # Main nutrition agent (keeping original for backwards compatibility, but now with guardrails)
 nutrition_agent = calorie_agent_with_search_guarded
+
+all_agents = [
+    calorie_agent_with_search,
+    healthy_breakfast_planner_agent,
+    breakfast_price_checker_agent,
+    breakfast_advisor,
+    breakfast_advisor_parallel,
+    guardrail_agent,
+    calorie_agent_with_search_guarded,
+    breakfast_advisor_guarded,
+    breakfast_advisor_parallel_guarded,
+    # Summarizes the turns that leave the window of agentic_chatbot's WindowedSession
+    history_summarizer_agent,
+]
+
+if replay_mode:
+    set_tracing_disabled(True)
+    use_record_replay_models(all_agents, replay_store, replay_mode)
+
+# All model calls of the agents go through one scheduler with rate limits, a concurrency
+# limit and a bounded queue; the user's own turn is served before sub-agent work
+llm_scheduler = None
+if os.environ.get("LLM_SCHEDULER", "1") == "1":
+    llm_scheduler = LLMScheduler(
+        max_concurrent=int(os.environ.get("LLM_MAX_CONCURRENT_REQUESTS", 16)),
+        requests_per_minute=float(os.environ.get("LLM_REQUESTS_PER_MINUTE", 500)),
+        tokens_per_minute=float(os.environ.get("LLM_TOKENS_PER_MINUTE", 200_000)),
+        max_queue=int(os.environ.get("LLM_MAX_QUEUE", 64)),
+        max_queue_wait=float(os.environ.get("LLM_MAX_QUEUE_WAIT_SECONDS", 30)),
+    )
+    use_scheduled_models(all_agents, llm_scheduler)
+
+logger.info("Set up nutrition_agent in %.3fs", time.perf_counter() - setup_started)
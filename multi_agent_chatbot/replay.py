@@ -0,0 +1,363 @@
+"""
+Record and replay the model responses and MCP tool results of the agents.
+
+Benchmarks against the live OpenAI and Exa APIs are noisy and need network
+access and API keys. In "record" mode the agents run against the real services
+and every model response and MCP tool result is saved, keyed by a fingerprint
+of the request. In "replay" mode the saved results are served by a local model
+and a local MCP stand-in, with a configurable injected latency, so the agent
+orchestration, the local tools and the streaming can be measured
+deterministically on an offline machine.
+
+    AGENT_REPLAY_MODE=record python benchmark.py
+    AGENT_REPLAY_MODE=replay REPLAY_MODEL_LATENCY_SECONDS=0.5 python benchmark.py
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, AsyncIterator
+
+from agents import Agent, AgentBase, Handoff, ModelSettings, RunContextWrapper, Tool
+from agents.agent_output import AgentOutputSchemaBase
+from agents.items import ModelResponse, TResponseInputItem, TResponseStreamEvent
+from agents.mcp import MCPServer
+from agents.models.interface import Model, ModelTracing
+from agents.models.openai_provider import OpenAIProvider
+from agents.usage import Usage
+from mcp import Tool as MCPTool
+from mcp.types import CallToolResult, GetPromptResult, ListPromptsResult
+from openai.types.responses import ResponseOutputItem, ResponseStreamEvent
+from openai.types.responses.response_usage import InputTokensDetails, OutputTokensDetails
+from pydantic import TypeAdapter
+
+default_replay_path = Path(__file__).parent.parent / "recordings" / "agents.jsonl"
+
+output_item_adapter = TypeAdapter(ResponseOutputItem)
+stream_event_adapter = TypeAdapter(ResponseStreamEvent)
+
+
+def fingerprint(*parts: Any) -> str:
+    """A stable hash of JSON-serializable request parts."""
+    return hashlib.sha256(
+        json.dumps(parts, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+class ReplayStore:
+    """
+    The recorded results by kind and fingerprint, in a JSON Lines file with one
+    line per result. Recording appends a line, so its cost doesn't grow with the
+    size of the recording.
+
+    A fingerprint can have several results (the same request made twice),
+    they are replayed in order and the last one is repeated.
+    """
+
+    def __init__(self, path: str | Path = default_replay_path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._records = {}
+        if self.path.exists():
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        self._add(record["kind"], record["key"], record["value"])
+        self._replayed = defaultdict(int)
+        self.misses = 0
+
+    def _add(self, kind: str, key: str, value: Any) -> None:
+        self._records.setdefault(kind, {}).setdefault(key, []).append(value)
+
+    def record(self, kind: str, key: str, value: Any) -> None:
+        line = json.dumps({"kind": kind, "key": key, "value": value})
+        with self._lock:
+            self._add(kind, key, value)
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def replay(self, kind: str, key: str) -> Any:
+        with self._lock:
+            values = self._records.get(kind, {}).get(key)
+            if not values:
+                self.misses += 1
+                raise KeyError(
+                    f"No recorded {kind} for this request in {self.path}, record it first"
+                )
+            position = self._replayed[kind, key]
+            self._replayed[kind, key] += 1
+            return values[min(position, len(values) - 1)]
+
+
+def request_fingerprint(
+    system_instructions: str | None,
+    input: str | list[TResponseInputItem],
+    tools: list[Tool],
+    output_schema: AgentOutputSchemaBase | None,
+    handoffs: list[Handoff],
+) -> str:
+    return fingerprint(
+        system_instructions,
+        input,
+        sorted(tool.name for tool in tools),
+        output_schema.name() if output_schema else None,
+        sorted(handoff.tool_name for handoff in handoffs),
+    )
+
+
+def usage_to_dict(usage: Usage) -> dict:
+    return {
+        "requests": usage.requests,
+        "input_tokens": usage.input_tokens,
+        "output_tokens": usage.output_tokens,
+        "total_tokens": usage.total_tokens,
+        "cached_tokens": usage.input_tokens_details.cached_tokens,
+        "reasoning_tokens": usage.output_tokens_details.reasoning_tokens,
+    }
+
+
+def usage_from_dict(usage: dict) -> Usage:
+    return Usage(
+        requests=usage["requests"],
+        input_tokens=usage["input_tokens"],
+        output_tokens=usage["output_tokens"],
+        total_tokens=usage["total_tokens"],
+        input_tokens_details=InputTokensDetails(cached_tokens=usage["cached_tokens"]),
+        output_tokens_details=OutputTokensDetails(reasoning_tokens=usage["reasoning_tokens"]),
+    )
+
+
+class RecordReplayModel(Model):
+    """Records the responses of a real model, or replays them without one."""
+
+    def __init__(
+        self,
+        store: ReplayStore,
+        mode: str,
+        model: Model | None = None,
+        latency: float = 0.0,
+        event_interval: float = 0.0,
+    ):
+        """
+        Args:
+            store: Where the responses are recorded to and replayed from.
+            mode: "record" or "replay".
+            model: The real model, required for recording.
+            latency: Seconds before a replayed response (or its first stream event) arrives.
+            event_interval: Seconds between two replayed stream events.
+        """
+        if mode == "record" and model is None:
+            raise ValueError("Recording needs the real model")
+        self.store = store
+        self.mode = mode
+        self.model = model
+        self.latency = latency
+        self.event_interval = event_interval
+
+    async def get_response(
+        self,
+        system_instructions: str | None,
+        input: str | list[TResponseInputItem],
+        model_settings: ModelSettings,
+        tools: list[Tool],
+        output_schema: AgentOutputSchemaBase | None,
+        handoffs: list[Handoff],
+        tracing: ModelTracing,
+        *,
+        previous_response_id: str | None,
+        conversation_id: str | None,
+        prompt: Any | None,
+    ) -> ModelResponse:
+        key = request_fingerprint(system_instructions, input, tools, output_schema, handoffs)
+
+        if self.mode == "replay":
+            recorded = self.store.replay("response", key)
+            await asyncio.sleep(self.latency)
+            return ModelResponse(
+                output=[output_item_adapter.validate_python(item) for item in recorded["output"]],
+                usage=usage_from_dict(recorded["usage"]),
+                response_id=recorded["response_id"],
+            )
+
+        response = await self.model.get_response(
+            system_instructions,
+            input,
+            model_settings,
+            tools,
+            output_schema,
+            handoffs,
+            tracing,
+            previous_response_id=previous_response_id,
+            conversation_id=conversation_id,
+            prompt=prompt,
+        )
+        self.store.record(
+            "response",
+            key,
+            {
+                "output": [item.model_dump(mode="json") for item in response.output],
+                "usage": usage_to_dict(response.usage),
+                "response_id": response.response_id,
+            },
+        )
+        return response
+
+    async def stream_response(
+        self,
+        system_instructions: str | None,
+        input: str | list[TResponseInputItem],
+        model_settings: ModelSettings,
+        tools: list[Tool],
+        output_schema: AgentOutputSchemaBase | None,
+        handoffs: list[Handoff],
+        tracing: ModelTracing,
+        *,
+        previous_response_id: str | None,
+        conversation_id: str | None,
+        prompt: Any | None,
+    ) -> AsyncIterator[TResponseStreamEvent]:
+        key = request_fingerprint(system_instructions, input, tools, output_schema, handoffs)
+
+        if self.mode == "replay":
+            recorded = self.store.replay("stream", key)
+            await asyncio.sleep(self.latency)
+            for i, event in enumerate(recorded):
+                if i and self.event_interval:
+                    await asyncio.sleep(self.event_interval)
+                yield stream_event_adapter.validate_python(event)
+            return
+
+        events = []
+        async for event in self.model.stream_response(
+            system_instructions,
+            input,
+            model_settings,
+            tools,
+            output_schema,
+            handoffs,
+            tracing,
+            previous_response_id=previous_response_id,
+            conversation_id=conversation_id,
+            prompt=prompt,
+        ):
+            events.append(event.model_dump(mode="json"))
+            yield event
+        self.store.record("stream", key, events)
+
+
+class RecordReplayMCPServer(MCPServer):
+    """Records the tool lists and results of a real MCP server, or replays them without one."""
+
+    def __init__(
+        self,
+        store: ReplayStore,
+        mode: str,
+        server: MCPServer | None = None,
+        name: str = "Replayed MCP",
+        latency: float = 0.0,
+    ):
+        """
+        Args:
+            store: Where the results are recorded to and replayed from.
+            mode: "record" or "replay".
+            server: The real MCP server, required for recording.
+            name: The server name used in replay mode.
+            latency: Seconds a replayed tool call takes.
+        """
+        if mode == "record" and server is None:
+            raise ValueError("Recording needs the real MCP server")
+        super().__init__()
+        self.store = store
+        self.mode = mode
+        self.server = server
+        self._name = server.name if server is not None else name
+        self.latency = latency
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    async def connect(self):
+        if self.mode == "record":
+            await self.server.connect()
+
+    async def cleanup(self):
+        if self.mode == "record":
+            await self.server.cleanup()
+
+    async def list_tools(
+        self,
+        run_context: RunContextWrapper[Any] | None = None,
+        agent: AgentBase | None = None,
+    ) -> list[MCPTool]:
+        key = fingerprint(self.name)
+        if self.mode == "replay":
+            return [MCPTool.model_validate(tool) for tool in self.store.replay("mcp_tools", key)]
+
+        tools = await self.server.list_tools(run_context, agent)
+        self.store.record("mcp_tools", key, [tool.model_dump(mode="json") for tool in tools])
+        return tools
+
+    async def call_tool(self, tool_name: str, arguments: dict[str, Any] | None) -> CallToolResult:
+        key = fingerprint(self.name, tool_name, arguments or {})
+        if self.mode == "replay":
+            recorded = self.store.replay("mcp_call", key)
+            await asyncio.sleep(self.latency)
+            return CallToolResult.model_validate(recorded)
+
+        result = await self.server.call_tool(tool_name, arguments)
+        self.store.record("mcp_call", key, result.model_dump(mode="json"))
+        return result
+
+    async def list_prompts(self) -> ListPromptsResult:
+        if self.mode == "replay":
+            return ListPromptsResult(prompts=[])
+        return await self.server.list_prompts()
+
+    async def get_prompt(
+        self, name: str, arguments: dict[str, Any] | None = None
+    ) -> GetPromptResult:
+        if self.mode == "replay":
+            raise KeyError(f"Prompts are not replayed: {name}")
+        return await self.server.get_prompt(name, arguments)
+
+
+def use_record_replay_models(
+    agents: list[Agent],
+    store: ReplayStore,
+    mode: str,
+    latency: float | None = None,
+    event_interval: float | None = None,
+) -> None:
+    """
+    Give every agent a recording or replaying model.
+
+    The model is set on the agents themselves rather than passed in a RunConfig,
+    because agents used as tools run without the RunConfig of the outer run.
+
+    Args:
+        latency: Seconds before a replayed response arrives
+            (REPLAY_MODEL_LATENCY_SECONDS, 0 by default).
+        event_interval: Seconds between two replayed stream events
+            (REPLAY_EVENT_INTERVAL_SECONDS, 0 by default).
+    """
+    if latency is None:
+        latency = float(os.environ.get("REPLAY_MODEL_LATENCY_SECONDS", 0))
+    if event_interval is None:
+        event_interval = float(os.environ.get("REPLAY_EVENT_INTERVAL_SECONDS", 0))
+    provider = OpenAIProvider() if mode == "record" else None
+    for agent in agents:
+        model_name = agent.model if isinstance(agent.model, str) else None
+        agent.model = RecordReplayModel(
+            store,
+            mode,
+            model=provider.get_model(model_name) if provider else None,
+            latency=latency,
+            event_interval=event_interval,
+        )
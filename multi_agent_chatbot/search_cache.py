@@ -0,0 +1,249 @@
+"""
+Disk-backed cache of Exa web search results, shared by all worker processes.
+
+Popular meals ("overnight oats") make the agents search the web for the same
+recipes and prices over and over, each search adding latency and cost. The
+results are stored in SQLite keyed by the tool name and its normalized
+arguments, and expire after a time-to-live that depends on the tool and on what
+the results are used for: recipes rarely change, prices do.
+"""
+
+import asyncio
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Callable
+
+from agents import AgentBase, RunContextWrapper
+from agents.mcp import MCPServer
+from mcp import Tool as MCPTool
+from mcp.types import CallToolResult, GetPromptResult, ListPromptsResult
+
+default_cache_path = Path(__file__).parent.parent / ".cache" / "search_results.sqlite3"
+
+
+# The free-text arguments of the Exa tools, where case and spacing don't change the search.
+# Others, like the url of crawling_exa or the taskId of deep_researcher_check, are kept as is.
+TEXT_ARGUMENTS = {"query", "companyName"}
+
+
+def normalize_text(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def normalize_arguments(value: Any) -> Any:
+    """Fold the free-text arguments, so equal searches share a key."""
+    if isinstance(value, dict):
+        return {
+            key: normalize_text(item)
+            if key in TEXT_ARGUMENTS and isinstance(item, str)
+            else normalize_arguments(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [normalize_arguments(item) for item in value]
+    return value
+
+
+def search_key(namespace: str, tool_name: str, arguments: dict[str, Any] | None) -> str:
+    """The cache key of a tool call."""
+    normalized = json.dumps(normalize_arguments(arguments or {}), sort_keys=True)
+    return hashlib.sha256(f"{namespace}\0{tool_name}\0{normalized}".encode("utf-8")).hexdigest()
+
+
+class SearchCache:
+    """Persistent tool call -> result cache with an expiry time per entry."""
+
+    def __init__(
+        self,
+        db_path: str | Path = default_cache_path,
+        clock: Callable[[], float] = time.time,
+    ):
+        """
+        Args:
+            db_path: The SQLite database file, shared by all processes on the host.
+            clock: The time source, in seconds since the epoch.
+        """
+        self.db_path = Path(db_path)
+        self._clock = clock
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # Per tool name: "hits", "misses" and "expired"
+        self.tool_stats = {}
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS search_results (
+                    key TEXT PRIMARY KEY,
+                    tool TEXT NOT NULL,
+                    arguments TEXT NOT NULL,
+                    result TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+                """
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, tool_name: str, outcome: str) -> None:
+        with self._lock:
+            self.tool_stats.setdefault(tool_name, Counter())[outcome] += 1
+
+    def get(self, namespace: str, tool_name: str, arguments: dict[str, Any] | None) -> str | None:
+        """Return the cached result or None if it is missing or expired."""
+        row = self._connection().execute(
+            "SELECT result, expires_at FROM search_results WHERE key = ?",
+            (search_key(namespace, tool_name, arguments),),
+        ).fetchone()
+
+        if row is None:
+            self._count(tool_name, "misses")
+            return None
+
+        result, expires_at = row
+        if expires_at <= self._clock():
+            self._count(tool_name, "expired")
+            self._count(tool_name, "misses")
+            return None
+
+        self._count(tool_name, "hits")
+        return result
+
+    def put(
+        self,
+        namespace: str,
+        tool_name: str,
+        arguments: dict[str, Any] | None,
+        result: str,
+        ttl: float,
+    ) -> None:
+        with self._connection() as conn:
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO search_results (key, tool, arguments, result, expires_at)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                (
+                    search_key(namespace, tool_name, arguments),
+                    tool_name,
+                    json.dumps(arguments or {}, sort_keys=True),
+                    result,
+                    self._clock() + ttl,
+                ),
+            )
+
+    def purge_expired(self) -> int:
+        """Delete the expired results. Returns the number of deleted rows."""
+        with self._connection() as conn:
+            cursor = conn.execute(
+                "DELETE FROM search_results WHERE expires_at <= ?", (self._clock(),)
+            )
+        return cursor.rowcount
+
+    def stats(self) -> dict:
+        with self._lock:
+            tools = {tool: dict(counts) for tool, counts in self.tool_stats.items()}
+
+        hits = sum(counts.get("hits", 0) for counts in tools.values())
+        misses = sum(counts.get("misses", 0) for counts in tools.values())
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "tools": tools,
+        }
+
+
+class CachedMCPServer(MCPServer):
+    """
+    Wraps an MCP server, answering repeated tool calls from a SearchCache.
+
+    Several wrappers can share one connection and one cache, each with its own
+    namespace and time-to-live, e.g. one for recipe searches and one for prices.
+    """
+
+    def __init__(
+        self,
+        server: MCPServer,
+        cache: SearchCache,
+        namespace: str,
+        default_ttl: float,
+        tool_ttls: dict[str, float] | None = None,
+    ):
+        """
+        Args:
+            server: The MCP server that answers cache misses.
+            cache: The cache of tool results.
+            namespace: Keeps the results of this wrapper apart from other wrappers.
+            default_ttl: How many seconds a result stays valid.
+            tool_ttls: Overrides of the time-to-live per tool name.
+        """
+        super().__init__(use_structured_content=server.use_structured_content)
+        self.server = server
+        self.cache = cache
+        self.namespace = namespace
+        self.default_ttl = default_ttl
+        self.tool_ttls = tool_ttls or {}
+
+    @property
+    def name(self) -> str:
+        return self.server.name
+
+    async def connect(self):
+        await self.server.connect()
+
+    async def cleanup(self):
+        # The wrapped connection may be shared, it is closed by its owner
+        pass
+
+    async def list_tools(
+        self,
+        run_context: RunContextWrapper[Any] | None = None,
+        agent: AgentBase | None = None,
+    ) -> list[MCPTool]:
+        return await self.server.list_tools(run_context, agent)
+
+    async def call_tool(self, tool_name: str, arguments: dict[str, Any] | None) -> CallToolResult:
+        ttl = self.tool_ttls.get(tool_name, self.default_ttl)
+        if ttl <= 0:
+            return await self.server.call_tool(tool_name, arguments)
+
+        cached = await asyncio.to_thread(self.cache.get, self.namespace, tool_name, arguments)
+        if cached is not None:
+            return CallToolResult.model_validate_json(cached)
+
+        result = await self.server.call_tool(tool_name, arguments)
+        # Don't keep failed searches around
+        if not result.isError:
+            await asyncio.to_thread(
+                self.cache.put,
+                self.namespace,
+                tool_name,
+                arguments,
+                result.model_dump_json(),
+                ttl,
+            )
+        return result
+
+    async def list_prompts(self) -> ListPromptsResult:
+        return await self.server.list_prompts()
+
+    async def get_prompt(
+        self, name: str, arguments: dict[str, Any] | None = None
+    ) -> GetPromptResult:
+        return await self.server.get_prompt(name, arguments)
@@ -0,0 +1,235 @@
+"""
+Durable conversation history for the chainlit app, one session per user and chat.
+
+The history lives in a file-backed SQLite database in WAL mode, so it survives
+restarts and readers never block the writer. All sessions share a small pool of
+connections. The items of a turn are buffered and written in one transaction
+when the turn ends, and reads only fetch the most recent items through an index.
+"""
+
+import asyncio
+import json
+import queue
+import sqlite3
+from contextlib import contextmanager
+from pathlib import Path
+
+from agents import TResponseInputItem
+from agents.memory import SessionABC
+from telemetry import timed
+
+default_db_path = Path(__file__).parent / "conversation_history.db"
+
+
+def session_key(user_id: str, chat_id: str) -> str:
+    """
+    The session_id of a user's chat, "user_id:chat_id" with the colons and backslashes
+    in the ids escaped, so that ("a:b", "c") and ("a", "b:c") don't share a history.
+    """
+
+    def escape(value: str) -> str:
+        return value.replace("\\", "\\\\").replace(":", "\\:")
+
+    return f"{escape(user_id)}:{escape(chat_id)}"
+
+
+class SessionStore:
+    """The SQLite database and connection pool shared by all user sessions."""
+
+    def __init__(self, db_path: str | Path = default_db_path, pool_size: int = 4):
+        """
+        Args:
+            db_path: Path to the SQLite database file.
+            pool_size: The maximum number of open connections.
+        """
+        self.db_path = Path(db_path)
+        self._pool = queue.LifoQueue()
+        self._all_connections = []
+        for _ in range(pool_size):
+            self._pool.put(None)
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self.connection() as conn:
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS chat_sessions (
+                    session_id TEXT PRIMARY KEY,
+                    user_id TEXT NOT NULL,
+                    chat_id TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+                CREATE INDEX IF NOT EXISTS idx_chat_sessions_user_id
+                    ON chat_sessions (user_id, updated_at);
+
+                CREATE TABLE IF NOT EXISTS chat_messages (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    session_id TEXT NOT NULL,
+                    message_data TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+                CREATE INDEX IF NOT EXISTS idx_chat_messages_session_id
+                    ON chat_messages (session_id, id);
+                """
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        self._all_connections.append(conn)
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection from the pool, waiting if all of them are in use."""
+        conn = self._pool.get()
+        try:
+            if conn is None:
+                conn = self._connect()
+            with conn:
+                yield conn
+        finally:
+            self._pool.put(conn)
+
+    def session(
+        self, user_id: str, chat_id: str, history_limit: int | None = 200
+    ) -> "UserSession":
+        """The session of one chat of an authenticated user."""
+        return UserSession(self, user_id, chat_id, history_limit=history_limit)
+
+    def close(self) -> None:
+        for conn in self._all_connections:
+            conn.close()
+        self._all_connections.clear()
+
+
+class UserSession(SessionABC):
+    """
+    The conversation history of one chat, stored in a SessionStore.
+
+    New items are kept in memory until `flush()` is called at the end of the turn.
+    """
+
+    def __init__(
+        self,
+        store: SessionStore,
+        user_id: str,
+        chat_id: str,
+        history_limit: int | None = 200,
+    ):
+        """
+        Args:
+            store: The store holding the history.
+            user_id: The identifier of the authenticated user.
+            chat_id: The identifier of the chat (chainlit thread).
+            history_limit: The maximum number of recent items loaded when no limit is given.
+        """
+        self.store = store
+        self.user_id = user_id
+        self.chat_id = chat_id
+        self.session_id = session_key(user_id, chat_id)
+        self.history_limit = history_limit
+        self._pending = []
+
+    async def get_items(self, limit: int | None = None) -> list[TResponseInputItem]:
+        limit = limit if limit is not None else self.history_limit
+        with timed("session.load"):
+            persisted = await asyncio.to_thread(self._get_items_sync, limit)
+        items = persisted + self._pending
+
+        # The history was cut off if the limit was reached
+        if limit is not None and (len(persisted) == limit or len(items) > limit):
+            items = items[-limit:]
+            # Don't start the history in the middle of a turn, e.g. at a tool call output
+            while items and items[0].get("role") != "user":
+                items = items[1:]
+
+        return items
+
+    def _get_items_sync(self, limit: int | None) -> list[TResponseInputItem]:
+        with self.store.connection() as conn:
+            if limit is None:
+                rows = conn.execute(
+                    "SELECT message_data FROM chat_messages WHERE session_id = ? ORDER BY id",
+                    (self.session_id,),
+                ).fetchall()
+            else:
+                # Read the latest items backwards along the index, then restore the order
+                rows = conn.execute(
+                    """
+                    SELECT message_data FROM chat_messages WHERE session_id = ?
+                    ORDER BY id DESC LIMIT ?
+                    """,
+                    (self.session_id, limit),
+                ).fetchall()
+                rows.reverse()
+
+        return [json.loads(message_data) for (message_data,) in rows]
+
+    async def has_items(self) -> bool:
+        """Whether the chat has any history, a cheap check that loads no items."""
+        if self._pending:
+            return True
+        return await asyncio.to_thread(self._has_items_sync)
+
+    def _has_items_sync(self) -> bool:
+        with self.store.connection() as conn:
+            row = conn.execute(
+                "SELECT 1 FROM chat_messages WHERE session_id = ? LIMIT 1", (self.session_id,)
+            ).fetchone()
+        return row is not None
+
+    async def add_items(self, items: list[TResponseInputItem]) -> None:
+        self._pending.extend(items)
+
+    async def flush(self) -> None:
+        """Write the items of the finished turn in a single transaction."""
+        if not self._pending:
+            return
+
+        items, self._pending = self._pending, []
+        with timed("session.save"):
+            await asyncio.to_thread(self._write_items_sync, items)
+
+    def _write_items_sync(self, items: list[TResponseInputItem]) -> None:
+        with self.store.connection() as conn:
+            conn.execute(
+                """
+                INSERT INTO chat_sessions (session_id, user_id, chat_id) VALUES (?, ?, ?)
+                ON CONFLICT (session_id) DO UPDATE SET updated_at = CURRENT_TIMESTAMP
+                """,
+                (self.session_id, self.user_id, self.chat_id),
+            )
+            conn.executemany(
+                "INSERT INTO chat_messages (session_id, message_data) VALUES (?, ?)",
+                [(self.session_id, json.dumps(item)) for item in items],
+            )
+
+    async def pop_item(self) -> TResponseInputItem | None:
+        if self._pending:
+            return self._pending.pop()
+        return await asyncio.to_thread(self._pop_item_sync)
+
+    def _pop_item_sync(self) -> TResponseInputItem | None:
+        with self.store.connection() as conn:
+            row = conn.execute(
+                """
+                DELETE FROM chat_messages WHERE id = (
+                    SELECT id FROM chat_messages WHERE session_id = ? ORDER BY id DESC LIMIT 1
+                )
+                RETURNING message_data
+                """,
+                (self.session_id,),
+            ).fetchone()
+
+        return json.loads(row[0]) if row else None
+
+    async def clear_session(self) -> None:
+        self._pending = []
+        await asyncio.to_thread(self._clear_session_sync)
+
+    def _clear_session_sync(self) -> None:
+        with self.store.connection() as conn:
+            conn.execute("DELETE FROM chat_messages WHERE session_id = ?", (self.session_id,))
+            conn.execute("DELETE FROM chat_sessions WHERE session_id = ?", (self.session_id,))
@@ -0,0 +1,184 @@
+"""
+Token-bounded view of a session's history with a rolling summary of older turns.
+
+Replaying the whole conversation on every turn makes the input tokens and the
+latency grow with the length of the chat. WindowedSession keeps the last turns
+verbatim within a token budget and folds everything older into a summary. The
+summary is cached and only extended when turns slide out of the window.
+"""
+
+import hashlib
+import json
+from typing import Awaitable, Callable
+
+from agents import Agent, Runner, TResponseInputItem
+from agents.memory import SessionABC
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+history_summarizer_agent = Agent(
+    name="History Summarizer",
+    instructions="""
+    * You summarize a conversation between a user and a nutrition assistant.
+    * Keep the facts the assistant will need later: the user's preferences, the foods and meals discussed, and the calories and prices that were found.
+    * Extend the previous summary, if there is one, with the new part of the conversation.
+    * Be concise and only answer with the summary.
+    """,
+)
+
+
+def estimate_tokens(item: TResponseInputItem) -> int:
+    """A rough token count, about four characters per token."""
+    return len(json.dumps(item)) // 4 + 1
+
+
+def item_to_text(item: TResponseInputItem, max_chars: int = 1000) -> str:
+    """Render a history item as a line of text for the summarizer."""
+    if item.get("type") == "function_call":
+        return f"Tool call {item.get('name')}: {item.get('arguments', '')[:max_chars]}"
+    if item.get("type") == "function_call_output":
+        return f"Tool result: {str(item.get('output', ''))[:max_chars]}"
+
+    content = item.get("content", "")
+    if isinstance(content, list):
+        content = " ".join(
+            part.get("text", "") for part in content if isinstance(part, dict)
+        )
+    return f"{item.get('role', item.get('type', 'item'))}: {str(content)[:max_chars]}"
+
+
+async def summarize_with_agent(
+    previous_summary: str | None, items: list[TResponseInputItem]
+) -> str:
+    """Extend the previous summary with the given items using the summarizer agent."""
+    conversation = "\n".join(item_to_text(item) for item in items)
+    prompt = (
+        f"Previous summary:\n{previous_summary or '(none)'}\n\n"
+        f"New part of the conversation:\n{conversation}"
+    )
+    result = await Runner.run(history_summarizer_agent, prompt)
+    return result.final_output
+
+
+def items_digest(items: list[TResponseInputItem]) -> str:
+    """A digest of history items, to notice when they were changed."""
+    digest = hashlib.sha256()
+    for item in items:
+        digest.update(json.dumps(item, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def split_turns(items: list[TResponseInputItem]) -> list[list[TResponseInputItem]]:
+    """Split the history into turns, each starting with a user message."""
+    turns = []
+    for item in items:
+        if item.get("role") == "user" or not turns:
+            turns.append([])
+        turns[-1].append(item)
+    return turns
+
+
+class WindowedSession(SessionABC):
+    """
+    Wraps a session, replaying only the recent turns plus a summary of the older ones.
+
+    The wrapped session must return the whole history from `get_items(limit=None)`,
+    e.g. a UserSession with `history_limit=None`: the summary tracks how many items
+    from the start of the history it covers.
+    """
+
+    def __init__(
+        self,
+        session: SessionABC,
+        max_turns: int = 6,
+        token_budget: int = 4000,
+        summarizer: Callable[
+            [str | None, list[TResponseInputItem]], Awaitable[str]
+        ] = summarize_with_agent,
+    ):
+        """
+        Args:
+            session: The session holding the full history.
+            max_turns: The maximum number of recent turns replayed verbatim.
+            token_budget: The maximum (estimated) tokens of the verbatim turns.
+            summarizer: Extends a summary (or None) with a list of history items.
+        """
+        self.session = session
+        self.max_turns = max_turns
+        self.token_budget = token_budget
+        self.summarizer = summarizer
+        self._summary = None
+        # How many items from the start of the history the summary covers, and their
+        # digest, to notice when the history was changed underneath
+        self._summarized_count = 0
+        self._summarized_digest = None
+        self.summaries_computed = 0
+
+    async def get_items(self, limit: int | None = None) -> list[TResponseInputItem]:
+        items = await self.session.get_items(limit=None)
+        turns = split_turns(items)
+
+        # Take whole turns from the end while they fit, but always the latest one
+        window = []
+        tokens = 0
+        for turn in reversed(turns):
+            turn_tokens = sum(estimate_tokens(item) for item in turn)
+            if window and (
+                len(window) >= self.max_turns or tokens + turn_tokens > self.token_budget
+            ):
+                break
+            window.insert(0, turn)
+            tokens += turn_tokens
+
+        older = items[: len(items) - sum(len(turn) for turn in window)]
+        window_items = [item for turn in window for item in turn]
+
+        if older:
+            summary = await self._summarize(older)
+            window_items.insert(0, {"role": "system", "content": SUMMARY_PREFIX + summary})
+
+        return window_items[-limit:] if limit is not None else window_items
+
+    async def _summarize(self, older: list[TResponseInputItem]) -> str:
+        """Fold the items that left the window since the last call into the summary."""
+        count = self._summarized_count
+        if count and (
+            count > len(older) or items_digest(older[:count]) != self._summarized_digest
+        ):
+            # The history changed under us (e.g. it was cleared), start over
+            self._summary = None
+            count = 0
+
+        new_items = older[count:]
+        if new_items:
+            self._summary = await self.summarizer(self._summary, new_items)
+            self._summarized_count = len(older)
+            self._summarized_digest = items_digest(older)
+            self.summaries_computed += 1
+
+        return self._summary
+
+    async def has_items(self) -> bool:
+        """Whether the history holds any item, without loading or summarizing it."""
+        has_items = getattr(self.session, "has_items", None)
+        if has_items is not None:
+            return await has_items()
+        return bool(await self.session.get_items(limit=1))
+
+    async def add_items(self, items: list[TResponseInputItem]) -> None:
+        await self.session.add_items(items)
+
+    async def pop_item(self) -> TResponseInputItem | None:
+        return await self.session.pop_item()
+
+    async def clear_session(self) -> None:
+        self._summary = None
+        self._summarized_count = 0
+        self._summarized_digest = None
+        await self.session.clear_session()
+
+    async def flush(self) -> None:
+        """Flush the wrapped session, if it buffers writes."""
+        flush = getattr(self.session, "flush", None)
+        if flush is not None:
+            await flush()
@@ -0,0 +1,167 @@
+"""
+OpenTelemetry spans and latency histograms for the chatbot hot paths.
+
+`timed(name)` opens a span and records its duration in a histogram of the same
+name, in milliseconds. Without `setup_telemetry()` both are no-ops. The
+exporter is chosen with TELEMETRY_EXPORTER:
+
+    otlp     to an OTLP/HTTP collector, configured with the standard
+             OTEL_EXPORTER_OTLP_ENDPOINT (default http://localhost:4318)
+    file     JSON lines to TELEMETRY_FILE_PATH (default telemetry.jsonl)
+    console  to stdout
+
+The installed OpenAI Agents, Chroma and MCP instrumentations are enabled too.
+"""
+
+import functools
+import json
+import logging
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+from opentelemetry import metrics, trace
+
+logger = logging.getLogger(__name__)
+
+tracer = trace.get_tracer("nutrition_chatbot")
+meter = metrics.get_meter("nutrition_chatbot")
+
+_providers = []
+
+
+@functools.cache
+def histogram(name: str):
+    return meter.create_histogram(name, unit="ms")
+
+
+@functools.cache
+def up_down_counter(name: str):
+    """A counter that goes up and down, e.g. the depth of a queue."""
+    return meter.create_up_down_counter(name)
+
+
+def record_latency(name: str, seconds: float, attributes: dict | None = None) -> None:
+    histogram(name).record(seconds * 1000, attributes or {})
+
+
+@contextmanager
+def timed(name: str, **attributes):
+    """
+    Trace the block as a span and record its duration in the `name` histogram.
+
+    Yields the attributes, so the block can add some (keep them low-cardinality,
+    they are also histogram dimensions).
+    """
+    attributes = dict(attributes)
+    started = time.perf_counter()
+    with tracer.start_as_current_span(name) as span:
+        try:
+            yield attributes
+        finally:
+            span.set_attributes(attributes)
+            record_latency(name, time.perf_counter() - started, attributes)
+
+
+def traced_agent_tool(tool):
+    """Record the runs of an agent used as a tool (Agent.as_tool) as `agent.tool_run`."""
+    on_invoke_tool = tool.on_invoke_tool
+
+    async def traced_on_invoke_tool(ctx, input: str):
+        with timed("agent.tool_run", agent=tool.name):
+            return await on_invoke_tool(ctx, input)
+
+    tool.on_invoke_tool = traced_on_invoke_tool
+    return tool
+
+
+def instrument_libraries() -> None:
+    """Enable the OpenTelemetry instrumentations from requirements.txt that are installed."""
+    instrumentors = [
+        ("opentelemetry.instrumentation.openai_agents", "OpenAIAgentsInstrumentor"),
+        ("opentelemetry.instrumentation.chromadb", "ChromaInstrumentor"),
+        ("opentelemetry.instrumentation.mcp", "McpInstrumentor"),
+    ]
+    for module_name, class_name in instrumentors:
+        try:
+            module = __import__(module_name, fromlist=[class_name])
+        except ImportError:
+            continue
+        instrumentor = getattr(module, class_name)()
+        if not instrumentor.is_instrumented_by_opentelemetry:
+            instrumentor.instrument()
+
+
+def setup_telemetry(exporter: str | None = None) -> bool:
+    """
+    Install the tracer and meter providers with the configured exporter.
+
+    Returns:
+        Whether telemetry is enabled.
+    """
+    exporter = exporter or os.environ.get("TELEMETRY_EXPORTER", "")
+    if not exporter or _providers:
+        return bool(_providers)
+
+    from opentelemetry.sdk.metrics import MeterProvider
+    from opentelemetry.sdk.metrics.export import (
+        ConsoleMetricExporter,
+        PeriodicExportingMetricReader,
+    )
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+
+    if exporter == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.metric_exporter import OTLPMetricExporter
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+
+        span_exporter = OTLPSpanExporter()
+        metric_exporter = OTLPMetricExporter()
+    elif exporter in ("file", "console"):
+        out = sys.stdout
+        if exporter == "file":
+            file_path = os.environ.get("TELEMETRY_FILE_PATH", "telemetry.jsonl")
+            out = open(file_path, "a", encoding="utf-8")
+        span_exporter = ConsoleSpanExporter(
+            out=out,
+            formatter=lambda span: span.to_json(indent=None) + "\n",
+        )
+        metric_exporter = ConsoleMetricExporter(
+            out=out,
+            formatter=lambda data: json.dumps(json.loads(data.to_json())) + "\n",
+        )
+    else:
+        raise ValueError(f"Unknown TELEMETRY_EXPORTER: {exporter}")
+
+    resource = Resource.create(
+        {"service.name": os.environ.get("OTEL_SERVICE_NAME", "nutrition-chatbot")}
+    )
+    tracer_provider = TracerProvider(resource=resource)
+    tracer_provider.add_span_processor(BatchSpanProcessor(span_exporter))
+    meter_provider = MeterProvider(
+        resource=resource,
+        metric_readers=[
+            PeriodicExportingMetricReader(
+                metric_exporter,
+                export_interval_millis=int(
+                    os.environ.get("TELEMETRY_METRICS_INTERVAL_MS", 10000)
+                ),
+            )
+        ],
+    )
+    trace.set_tracer_provider(tracer_provider)
+    metrics.set_meter_provider(meter_provider)
+    _providers.extend([tracer_provider, meter_provider])
+
+    instrument_libraries()
+    logger.info("Exporting telemetry to %s", exporter)
+    return True
+
+
+def shutdown_telemetry() -> None:
+    """Flush and stop the exporters."""
+    for provider in _providers:
+        provider.shutdown()
+    _providers.clear()
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The chatbot modules import each other as top-level modules, like when run with chainlit
+sys.path.insert(0, str(Path(__file__).parent.parent))
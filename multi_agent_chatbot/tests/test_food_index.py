@@ -0,0 +1,31 @@
+import pytest
+from food_index import FoodIndex
+
+
+@pytest.fixture(scope="module")
+def food_index() -> FoodIndex:
+    return FoodIndex.from_csv()
+
+
+@pytest.mark.parametrize("query", ["cheese", "bread"])
+def test_short_names_do_not_match_longer_foods(food_index, query):
+    # "cheese" used to return Soy Cheese, "bread" Beer, Brown and Rye Bread
+    assert food_index.lookup(query) == ([], None)
+
+
+@pytest.mark.parametrize(
+    "query, food_item",
+    [("brocoli", "broccoli"), ("chiken breast", "chicken breast"), ("peanut buter", "peanut butter")],
+)
+def test_misspelled_names_match_fuzzily(food_index, query, food_item):
+    foods, source = food_index.lookup(query, max_results=1)
+
+    assert source == "fuzzy"
+    assert foods[0]["food_item"] == food_item
+
+
+def test_exact_match_folds_plurals(food_index):
+    foods, source = food_index.lookup("Bananas")
+
+    assert source == "exact"
+    assert {food["food_item"] for food in foods} == {"banana"}
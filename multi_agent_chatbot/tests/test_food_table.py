@@ -0,0 +1,50 @@
+from food_table import FoodTable, head_nouns
+
+
+def table() -> FoodTable:
+    return FoodTable(
+        food_items=["Apple", "Watermelon", "Chamomile Tea", "Tomato Juice", "Peaches (canned)", "Carrot", "Olive Oil"],
+        categories=["Fruits", "Fruits", "(Fruit)Juices", "(Fruit)Juices", "CannedFruit", "Vegetables", "VegetableOils"],
+        calories=[52, 30, 0, 17, 44, 41, 884],
+        kj=[218, 126, 0, 71, 184, 172, 3699],
+        serving_info=["100g", "100g", "100ml", "100ml", "100g", "100g", "100ml"],
+    )
+
+
+def test_head_nouns_skip_qualifiers():
+    assert head_nouns("(Fruit) Juices") == {"juice"}
+    assert head_nouns("Vegetable Oils") == {"oil"}
+    assert head_nouns("Tropical & Exotic Fruits") == {"tropical", "fruit"}
+    assert head_nouns("Milk & Dairy Products") == {"milk", "dairy"}
+
+
+def test_fruits_under_50_calories_has_no_juice_or_tea():
+    food_table = table()
+    categories = food_table.match_categories("fruits")
+    rows, total = food_table.query(categories, max_calories=50, limit=5)
+    foods = [food_table.row(position)["food_item"] for position in rows]
+
+    assert [food_table.category_labels[code] for code in categories] == ["Fruits", "Canned Fruit"]
+    assert foods == ["Watermelon", "Peaches (canned)"]
+    assert total == 2
+
+
+def test_vegetables_do_not_match_vegetable_oils():
+    food_table = table()
+
+    assert [food_table.category_labels[code] for code in food_table.match_categories("vegetables")] == [
+        "Vegetables"
+    ]
+    assert [food_table.category_labels[code] for code in food_table.match_categories("oils")] == [
+        "Vegetable Oils"
+    ]
+
+
+def test_fruits_under_50_calories_in_the_csv():
+    food_table = FoodTable.from_csv()
+    rows, total = food_table.query(food_table.match_categories("fruits"), max_calories=50, limit=5)
+    rows = [food_table.row(position) for position in rows]
+
+    assert len(rows) == 5
+    assert not any("Juice" in row["food_category"] for row in rows)
+    assert not any(word in row["food_item"] for row in rows for word in ["Tea", "Juice"])
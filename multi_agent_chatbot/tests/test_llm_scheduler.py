@@ -0,0 +1,251 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from agents import ModelSettings
+from agents.items import ModelResponse
+from agents.models.interface import Model, ModelTracing
+from agents.usage import Usage
+from llm_scheduler import (
+    BACKGROUND,
+    INTERACTIVE,
+    LLMScheduler,
+    ScheduledModel,
+    SchedulerOverloaded,
+    TokenBucket,
+    priority,
+)
+
+
+class StubModel(Model):
+    """Answers every call once `release` is set, reporting `total_tokens` of usage."""
+
+    def __init__(self, total_tokens: int = 100):
+        self.total_tokens = total_tokens
+        self.release = asyncio.Event()
+        self.calls = []
+
+    async def get_response(self, system_instructions, input, *args, **kwargs):
+        self.calls.append(input)
+        await self.release.wait()
+        return ModelResponse(
+            output=[], usage=Usage(total_tokens=self.total_tokens), response_id=None
+        )
+
+    async def stream_response(self, system_instructions, input, *args, **kwargs):
+        response = await self.get_response(system_instructions, input, *args, **kwargs)
+        # Only the last event of a real stream, the one carrying the usage
+        yield SimpleNamespace(type="response.completed", response=response)
+
+
+class StubProvider:
+    def __init__(self, model: Model):
+        self.model = model
+        self.requested = []
+
+    def get_model(self, model_name):
+        self.requested.append(model_name)
+        return self.model
+
+
+async def call(model: Model, input: str, level: int = INTERACTIVE) -> ModelResponse:
+    with priority(level):
+        return await model.get_response(
+            None,
+            input,
+            ModelSettings(max_tokens=10),
+            [],
+            None,
+            [],
+            ModelTracing.DISABLED,
+            previous_response_id=None,
+            conversation_id=None,
+            prompt=None,
+        )
+
+
+async def stream(model: Model, input: str) -> list:
+    events = []
+    async for event in model.stream_response(
+        None,
+        input,
+        ModelSettings(max_tokens=10),
+        [],
+        None,
+        [],
+        ModelTracing.DISABLED,
+        previous_response_id=None,
+        conversation_id=None,
+        prompt=None,
+    ):
+        events.append(event)
+    return events
+
+
+async def settle():
+    """Let the started tasks run until they block."""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_interactive_calls_are_admitted_before_background_calls():
+    async def run():
+        scheduler = LLMScheduler(max_concurrent=1)
+        admitted = []
+
+        async def acquire(name, level):
+            with priority(level):
+                await scheduler.acquire(10)
+            admitted.append(name)
+
+        await scheduler.acquire(10)
+        tasks = [
+            asyncio.create_task(acquire("background 1", BACKGROUND)),
+            asyncio.create_task(acquire("background 2", BACKGROUND)),
+            asyncio.create_task(acquire("interactive", INTERACTIVE)),
+        ]
+        await settle()
+        assert admitted == [] and scheduler.queued == 3
+
+        for _ in tasks:
+            scheduler.release()
+            await settle()
+        await asyncio.gather(*tasks)
+        return scheduler, admitted
+
+    scheduler, admitted = asyncio.run(run())
+
+    assert admitted == ["interactive", "background 1", "background 2"]
+    assert scheduler.stats["admitted.interactive"] == 2
+    assert scheduler.stats["admitted.background"] == 2
+
+
+def test_calls_are_shed_when_the_queue_is_full():
+    async def run():
+        scheduler = LLMScheduler(max_concurrent=1, max_queue=1)
+        await scheduler.acquire(10)
+        waiting = asyncio.create_task(scheduler.acquire(10))
+        await settle()
+
+        with pytest.raises(SchedulerOverloaded):
+            await scheduler.acquire(10)
+
+        scheduler.release()
+        await waiting
+        return scheduler
+
+    scheduler = asyncio.run(run())
+
+    assert scheduler.stats["shed"] == 1
+    assert scheduler.stats["shed.interactive"] == 1
+    assert scheduler.stats["admitted"] == 2
+
+
+def test_calls_waiting_too_long_time_out():
+    async def run():
+        scheduler = LLMScheduler(max_concurrent=1, max_queue_wait=0.02)
+        await scheduler.acquire(10)
+
+        with priority(BACKGROUND), pytest.raises(SchedulerOverloaded):
+            await scheduler.acquire(10)
+        assert scheduler.queued == 0
+
+        # The timed out call gave up its place, the next one gets the slot
+        scheduler.release()
+        await scheduler.acquire(10)
+        return scheduler
+
+    scheduler = asyncio.run(run())
+
+    assert scheduler.stats["timed_out"] == 1
+    assert scheduler.stats["timed_out.background"] == 1
+    assert scheduler.active == 1
+
+
+def test_token_rate_limit_delays_calls():
+    now = [0.0]
+    bucket = TokenBucket(per_minute=600, clock=lambda: now[0])
+
+    assert bucket.wait_time(600) == 0
+    bucket.take(600)
+    assert bucket.wait_time(100) == pytest.approx(10.0)
+
+    now[0] = 10.0
+    assert bucket.wait_time(100) == 0
+
+    # Returning unused tokens never fills the bucket beyond its capacity
+    bucket.take(-10_000)
+    assert bucket.level == 600
+
+
+def test_scheduled_model_limits_concurrent_calls():
+    async def run():
+        stub = StubModel()
+        scheduler = LLMScheduler(max_concurrent=2)
+        model = ScheduledModel(stub, scheduler)
+
+        tasks = [asyncio.create_task(call(model, f"question {i}")) for i in range(3)]
+        await settle()
+        assert stub.calls == ["question 0", "question 1"]
+        assert scheduler.active == 2 and scheduler.queued == 1
+
+        stub.release.set()
+        responses = await asyncio.gather(*tasks)
+        return stub, scheduler, responses
+
+    stub, scheduler, responses = asyncio.run(run())
+
+    assert stub.calls == ["question 0", "question 1", "question 2"]
+    assert all(response.usage.total_tokens == 100 for response in responses)
+    assert scheduler.active == 0
+    assert scheduler.stats["admitted"] == 3
+
+
+def test_scheduled_model_settles_the_token_estimate():
+    async def run():
+        stub = StubModel(total_tokens=1000)
+        stub.release.set()
+        scheduler = LLMScheduler(tokens_per_minute=10_000)
+        await call(ScheduledModel(stub, scheduler), "hello")
+        return scheduler
+
+    scheduler = asyncio.run(run())
+
+    # The estimate (10 output tokens plus a token for "hello") is replaced by the real usage
+    assert scheduler._tokens.level == pytest.approx(9000, abs=1)
+
+
+def test_scheduled_model_resolves_a_model_name_on_the_first_call():
+    async def run():
+        stub = StubModel()
+        stub.release.set()
+        provider = StubProvider(stub)
+        model = ScheduledModel("gpt-4o-mini", LLMScheduler(), provider)
+        assert provider.requested == []
+
+        await call(model, "hello")
+        await call(model, "hello again")
+        return provider
+
+    provider = asyncio.run(run())
+
+    assert provider.requested == ["gpt-4o-mini"]
+
+
+def test_scheduled_model_holds_the_slot_while_streaming():
+    async def run():
+        stub = StubModel(total_tokens=1000)
+        scheduler = LLMScheduler(max_concurrent=1, tokens_per_minute=10_000)
+        task = asyncio.create_task(stream(ScheduledModel(stub, scheduler), "hello"))
+        await settle()
+        assert scheduler.active == 1
+
+        stub.release.set()
+        events = await task
+        return scheduler, events
+
+    scheduler, events = asyncio.run(run())
+
+    assert [event.type for event in events] == ["response.completed"]
+    assert scheduler.active == 0
+    assert scheduler._tokens.level == pytest.approx(9000, abs=1)
@@ -0,0 +1,20 @@
+from lookup_cache import file_generation, rebuilt_on_change
+
+
+def test_value_is_rebuilt_when_the_generation_changes(tmp_path):
+    version_file = tmp_path / "chroma_version.txt"
+    builds = []
+
+    def build():
+        builds.append(version_file.read_text() if version_file.exists() else None)
+        return len(builds)
+
+    get_value = rebuilt_on_change(build, file_generation(version_file))
+
+    assert get_value() == 1
+    assert get_value() == 1
+
+    version_file.write_text("v2")
+    assert get_value() == 2
+    assert get_value() == 2
+    assert builds == [None, "v2"]
@@ -0,0 +1,178 @@
+import asyncio
+
+import pytest
+from mcp_connection import ManagedMCPServer, MCPConnectionError
+
+
+class StubServer:
+    """An MCP server whose connect, ping and tool calls fail as scripted."""
+
+    def __init__(self, number: int, fail_connect: bool = False, fail_ping: bool = False):
+        self.number = number
+        self.name = "stub"
+        self.session = None
+        self.fail_connect = fail_connect
+        self.fail_ping = fail_ping
+        self.fail_call = False
+        self.pings = 0
+        self.cleaned_up = False
+
+    async def connect(self):
+        if self.fail_connect:
+            raise ConnectionError(f"server {self.number} is down")
+
+    async def cleanup(self):
+        self.cleaned_up = True
+
+    async def list_prompts(self):
+        # ManagedMCPServer pings with list_prompts when there's no session
+        self.pings += 1
+        if self.fail_ping:
+            raise ConnectionError(f"server {self.number} stopped answering")
+        return []
+
+    async def call_tool(self, tool_name, arguments):
+        if self.fail_call:
+            raise ConnectionError(f"server {self.number} dropped the call")
+        return f"{tool_name} on server {self.number}"
+
+
+class StubFactory:
+    """Creates the StubServers of the given (fail_connect, fail_ping) scripts in order."""
+
+    def __init__(self, scripts: list[tuple[bool, bool]]):
+        self.scripts = scripts
+        self.servers = []
+
+    def __call__(self) -> StubServer:
+        fail_connect, fail_ping = self.scripts[min(len(self.servers), len(self.scripts) - 1)]
+        server = StubServer(len(self.servers), fail_connect, fail_ping)
+        self.servers.append(server)
+        return server
+
+
+async def wait_until(condition, timeout: float = 2.0):
+    async with asyncio.timeout(timeout):
+        while not condition():
+            await asyncio.sleep(0.001)
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Record the backoff delays instead of waiting them out."""
+    delays = []
+    sleep = asyncio.sleep
+
+    async def fake_sleep(delay, *args, **kwargs):
+        delays.append(delay)
+        await sleep(0)
+
+    monkeypatch.setattr("mcp_connection.asyncio.sleep", fake_sleep)
+    return delays
+
+
+def test_reconnects_with_exponential_backoff(sleeps):
+    factory = StubFactory([(True, False)] * 3 + [(False, False)])
+
+    async def run():
+        server = ManagedMCPServer(factory, backoff_base=1.0, backoff_max=60)
+        await server.connect()
+        result = await server.call_tool("search", {})
+        await server.cleanup()
+        return server, result
+
+    server, result = asyncio.run(run())
+
+    assert result == "search on server 3"
+    assert sleeps == [1.0, 2.0, 4.0]
+    assert server.stats["connect_failures"] == 3
+    assert server.stats["connects"] == 1
+    assert all(stub.cleaned_up for stub in factory.servers)
+
+
+def test_backoff_is_capped(sleeps):
+    factory = StubFactory([(True, False)] * 6 + [(False, False)])
+
+    async def run():
+        server = ManagedMCPServer(factory, backoff_base=1.0, backoff_max=5)
+        await server.connect()
+        await server.cleanup()
+
+    asyncio.run(run())
+
+    assert sleeps == [1.0, 2.0, 4.0, 5, 5, 5]
+
+
+def test_reconnects_after_a_failed_health_check():
+    # The first connection stops answering pings, the second one stays healthy
+    factory = StubFactory([(False, True), (False, False)])
+
+    async def run():
+        server = ManagedMCPServer(factory, health_check_interval=0.01, health_check_timeout=1)
+        await server.connect()
+        await wait_until(lambda: server.stats["connects"] == 2)
+        result = await server.call_tool("search", {})
+        await server.cleanup()
+        return server, result
+
+    server, result = asyncio.run(run())
+
+    assert result == "search on server 1"
+    assert server.stats["health_check_failures"] == 1
+    assert factory.servers[0].pings == 1
+    assert factory.servers[0].cleaned_up
+
+
+def test_failed_call_checks_the_connection_right_away():
+    factory = StubFactory([(False, True), (False, False)])
+
+    async def run():
+        # No ping would be due before the test times out
+        server = ManagedMCPServer(factory, health_check_interval=60, health_check_timeout=1)
+        await server.connect()
+        factory.servers[0].fail_call = True
+        with pytest.raises(ConnectionError):
+            await server.call_tool("search", {})
+        await wait_until(lambda: server.stats["connects"] == 2)
+        result = await server.call_tool("search", {})
+        await server.cleanup()
+        return server, result
+
+    server, result = asyncio.run(run())
+
+    assert result == "search on server 1"
+    assert server.stats["call_failures"] == 1
+    assert server.stats["health_check_failures"] == 1
+
+
+def test_calls_fail_when_the_server_cannot_be_reached():
+    factory = StubFactory([(True, False)])
+
+    async def run():
+        server = ManagedMCPServer(factory, connect_timeout=0.05, backoff_base=0.01)
+        with pytest.raises(MCPConnectionError, match="is down"):
+            await server.connect()
+        await server.cleanup()
+        return server
+
+    server = asyncio.run(run())
+
+    assert not server.connected
+    assert server.stats["connects"] == 0
+    assert server.stats["connect_failures"] > 0
+
+
+def test_cleanup_closes_the_connection():
+    factory = StubFactory([(False, False)])
+
+    async def run():
+        server = ManagedMCPServer(factory)
+        await server.connect()
+        assert server.connected
+        await server.cleanup()
+        return server
+
+    server = asyncio.run(run())
+
+    assert not server.connected
+    assert factory.servers[0].cleaned_up
@@ -0,0 +1,18 @@
+from meal_calculator import DENSITIES, PORTION_WEIGHTS, calculate_meal, match_word_table
+
+
+def test_word_tables_match_the_head_noun():
+    assert match_word_table("peanut butter", DENSITIES, None) == DENSITIES["butter"]
+    assert match_word_table("oat milk", DENSITIES, None) == DENSITIES["milk"]
+    assert match_word_table("banana bread", PORTION_WEIGHTS, None) == PORTION_WEIGHTS["bread"]
+    assert match_word_table("tofu", DENSITIES, None) is None
+
+
+def test_cup_of_peanut_butter_uses_the_density_of_butter():
+    meal = calculate_meal(
+        [{"ingredient": "peanut butter", "quantity": 1, "unit": "cup"}],
+        [{"food_item": "peanut butter", "calories_per_100g": 588.0, "serving_info": "100g"}],
+    )
+
+    assert meal["rows"][0]["amount"] == 218.4
+    assert meal["total_calories"] == round(240 * 0.91 * 5.88, 1)
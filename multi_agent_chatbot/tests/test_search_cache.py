@@ -0,0 +1,16 @@
+from search_cache import search_key
+
+
+def test_queries_are_folded():
+    assert search_key("exa", "web_search_exa", {"query": "Overnight  Oats ", "numResults": 5}) == (
+        search_key("exa", "web_search_exa", {"query": "overnight oats", "numResults": 5})
+    )
+
+
+def test_urls_and_ids_are_kept_as_is():
+    assert search_key("exa", "crawling_exa", {"url": "https://example.com/Recipe"}) != (
+        search_key("exa", "crawling_exa", {"url": "https://example.com/recipe"})
+    )
+    assert search_key("exa", "deep_researcher_check", {"taskId": "AbC"}) != (
+        search_key("exa", "deep_researcher_check", {"taskId": "abc"})
+    )
@@ -0,0 +1,35 @@
+import asyncio
+
+from session_store import SessionStore
+
+
+def test_ids_with_colons_do_not_share_a_history(tmp_path):
+    async def run():
+        store = SessionStore(tmp_path / "history.db")
+        first = store.session("a:b", "c")
+        second = store.session("a", "b:c")
+        await first.add_items([{"role": "user", "content": "first"}])
+        await first.flush()
+        items = await second.get_items()
+        store.close()
+        return first, second, items
+
+    first, second, items = asyncio.run(run())
+
+    assert first.session_id != second.session_id
+    assert items == []
+
+
+def test_has_items_sees_pending_and_stored_items(tmp_path):
+    async def run():
+        store = SessionStore(tmp_path / "history.db")
+        session = store.session("user", "chat")
+        checks = [await session.has_items()]
+        await session.add_items([{"role": "user", "content": "hello"}])
+        checks.append(await session.has_items())
+        await session.flush()
+        checks.append(await store.session("user", "chat").has_items())
+        store.close()
+        return checks
+
+    assert asyncio.run(run()) == [False, True, True]
@@ -0,0 +1,81 @@
+import asyncio
+
+from session_store import SessionStore
+from session_window import WindowedSession
+
+
+class StubSummarizer:
+    """Joins the contents of the summarized items, recording the calls."""
+
+    def __init__(self):
+        self.calls = []
+
+    async def __call__(self, previous_summary, items):
+        self.calls.append((previous_summary, items))
+        contents = [item["content"] for item in items]
+        return " ".join(([previous_summary] if previous_summary else []) + contents)
+
+
+def turn(number: int) -> list[dict]:
+    return [
+        {"role": "user", "content": f"question {number}"},
+        {"role": "assistant", "content": f"answer {number}"},
+    ]
+
+
+def test_summary_is_extended_when_the_history_is_longer_than_history_limit(tmp_path):
+    async def run():
+        store = SessionStore(tmp_path / "history.db")
+        summarizer = StubSummarizer()
+        session = WindowedSession(
+            store.session("user", "chat", history_limit=None),
+            max_turns=2,
+            token_budget=10_000,
+            summarizer=summarizer,
+        )
+        # 150 turns are 300 items, more than the default history_limit of 200
+        for number in range(150):
+            await session.add_items(turn(number))
+            await session.flush()
+            items = await session.get_items()
+        store.close()
+        return summarizer, items
+
+    summarizer, items = asyncio.run(run())
+
+    # Every turn that left the window was summarized once, without starting over
+    assert len(summarizer.calls) == 148
+    assert all(previous is not None for previous, _ in summarizer.calls[1:])
+    assert [len(new_items) for _, new_items in summarizer.calls] == [2] * 148
+    assert items[0]["content"].endswith("question 0 answer 0 " + " ".join(
+        f"question {number} answer {number}" for number in range(1, 148)
+    ))
+    assert [item["content"] for item in items[1:]] == [
+        "question 148", "answer 148", "question 149", "answer 149"
+    ]
+
+
+def test_summary_starts_over_when_the_history_is_rewritten(tmp_path):
+    async def run():
+        store = SessionStore(tmp_path / "history.db")
+        user_session = store.session("user", "chat", history_limit=None)
+        summarizer = StubSummarizer()
+        session = WindowedSession(user_session, max_turns=1, summarizer=summarizer)
+        for number in range(3):
+            await session.add_items(turn(number))
+        await session.flush()
+        await session.get_items()
+
+        # Replace the first answer behind the window's back, the last summarized item stays equal
+        await user_session.clear_session()
+        await user_session.add_items(turn(0)[:1] + [{"role": "assistant", "content": "changed"}])
+        await user_session.add_items(turn(1) + turn(2))
+        await user_session.flush()
+        items = await session.get_items()
+        store.close()
+        return summarizer, items
+
+    summarizer, items = asyncio.run(run())
+
+    assert summarizer.calls[-1][0] is None
+    assert items[0]["content"].endswith("question 0 changed question 1 answer 1")
@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+import token_stream
+from token_stream import TokenStream
+
+
+class FakeMessage:
+    def __init__(self, shown: list):
+        self.shown = shown
+
+    async def stream_token(self, token: str):
+        self.shown.append(("text", token))
+
+
+@pytest.fixture
+def shown(monkeypatch):
+    """What was shown, the streamed text frames and the tool steps in order."""
+    shown = []
+
+    class FakeStep:
+        def __init__(self, name, type):
+            self.name = name
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc_info):
+            shown.append(("step", self.name, self.input))
+
+    monkeypatch.setattr(token_stream.cl, "Step", FakeStep)
+    return shown
+
+
+def test_held_tool_calls_are_shown_on_release_in_order(shown):
+    async def run():
+        stream = TokenStream(FakeMessage(shown), interval=60, held=True)
+        await stream.write("Let me look that up. ")
+        await stream.tool_call("calorie_lookup_tool", '{"query": "banana"}')
+        await stream.write("A banana has 89 calories.")
+        assert shown == []
+
+        await stream.release()
+
+    asyncio.run(run())
+
+    assert shown == [
+        ("text", "Let me look that up. "),
+        ("step", "calorie_lookup_tool", '{"query": "banana"}'),
+        ("text", "A banana has 89 calories."),
+    ]
+
+
+def test_discard_drops_the_held_tool_calls(shown):
+    async def run():
+        stream = TokenStream(FakeMessage(shown), interval=60, held=True)
+        await stream.write("Sure, ")
+        await stream.tool_call("exa_search", '{"query": "off topic"}')
+        stream.discard()
+        await stream.flush()
+
+    asyncio.run(run())
+
+    assert shown == []
@@ -0,0 +1,180 @@
+"""
+Coalesced streaming of agent output to a chainlit message.
+
+Sending every text delta with its own `msg.stream_token` call means one
+websocket emit per token, and echoing it with `print(..., flush=True)` one
+syscall per token. TokenStream collects the deltas and sends them in frames,
+at most every `interval` seconds or when `max_chars` characters are buffered.
+The console echo is optional and only goes through a buffered text stream.
+"""
+
+import asyncio
+import os
+import sys
+import time
+from typing import TextIO
+
+import chainlit as cl
+from openai.types.responses import ResponseTextDeltaEvent
+
+
+def default_echo() -> TextIO | None:
+    """Echo the streamed text to stdout if STREAM_ECHO=1 is set."""
+    return sys.stdout if os.getenv("STREAM_ECHO", "0") == "1" else None
+
+
+class TokenStream:
+    """Buffers text deltas and streams them to a chainlit message in frames."""
+
+    def __init__(
+        self,
+        msg: cl.Message,
+        interval: float | None = None,
+        max_chars: int | None = None,
+        echo: TextIO | None = None,
+        held: bool = False,
+    ):
+        """
+        Args:
+            msg: The message the text is streamed to.
+            interval: The maximum time text waits in the buffer, in seconds
+                (STREAM_FRAME_SECONDS, 0.04 by default).
+            max_chars: Send a frame as soon as this many characters are buffered
+                (STREAM_FRAME_CHARS, 256 by default).
+            echo: A text stream the text and tool calls are echoed to, e.g. sys.stdout.
+            held: Buffer everything, text and tool calls, until `release()` is called.
+        """
+        self.msg = msg
+        self.interval = (
+            interval if interval is not None else float(os.getenv("STREAM_FRAME_SECONDS", 0.04))
+        )
+        self.max_chars = (
+            max_chars if max_chars is not None else int(os.getenv("STREAM_FRAME_CHARS", 256))
+        )
+        self.echo = echo
+        self.held = held
+        self.frames = 0
+        # When the first text arrived, in time.perf_counter() seconds
+        self.first_token_at = None
+        self._buffer = []
+        self._size = 0
+        # The tool calls made while held, each with the text that came before it
+        self._held_tool_calls = []
+        # The task sending the next frame after `interval`, and whether it's already sending
+        self._timer = None
+        self._timer_sending = False
+        self._lock = asyncio.Lock()
+
+    async def write(self, delta: str) -> None:
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        self._buffer.append(delta)
+        self._size += len(delta)
+        if self.held:
+            return
+
+        if self._size >= self.max_chars:
+            await self.flush()
+        elif self._timer is None or self._timer.done():
+            # Collect the timer of the last frame first, so its errors aren't lost
+            await self._stop_timer()
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.interval)
+        # From here on flush() waits for this frame instead of cancelling it halfway
+        self._timer_sending = True
+        try:
+            await self._send()
+        finally:
+            self._timer_sending = False
+
+    async def _stop_timer(self) -> None:
+        """Cancel the timer while it's waiting, or wait until it sent its frame."""
+        timer, self._timer = self._timer, None
+        if timer is None:
+            return
+        if not self._timer_sending:
+            timer.cancel()
+        await asyncio.wait([timer])
+        if not timer.cancelled():
+            # Raises the error of a frame the timer failed to send
+            timer.result()
+
+    async def flush(self) -> None:
+        """Send the buffered text as one frame."""
+        await self._stop_timer()
+        await self._send()
+
+    async def _send(self) -> None:
+        async with self._lock:
+            if self.held or not self._buffer:
+                return
+
+            await self._stream(self._take_buffer())
+
+    def _take_buffer(self) -> str:
+        text = "".join(self._buffer)
+        self._buffer.clear()
+        self._size = 0
+        return text
+
+    async def _stream(self, text: str) -> None:
+        await self.msg.stream_token(token=text)
+        self.frames += 1
+        if self.echo is not None:
+            self.echo.write(text)
+
+    def _show_tool_call(self, name: str, arguments: str) -> None:
+        with cl.Step(name=name, type="tool") as step:
+            step.input = arguments
+        if self.echo is not None:
+            self.echo.write(f"\nTool call: {name} with args: {arguments}\n")
+
+    async def release(self) -> None:
+        """Stop holding back, send the buffered text and show the held tool calls in order."""
+        self.held = False
+        tool_calls, self._held_tool_calls = self._held_tool_calls, []
+        async with self._lock:
+            for text, name, arguments in tool_calls:
+                if text:
+                    await self._stream(text)
+                self._show_tool_call(name, arguments)
+        await self.flush()
+
+    def discard(self) -> None:
+        """Drop the buffered text and tool calls without showing them."""
+        if self._timer is not None and not self._timer_sending:
+            self._timer.cancel()
+            self._timer = None
+        self._buffer.clear()
+        self._size = 0
+        self._held_tool_calls.clear()
+
+    async def tool_call(self, name: str, arguments: str) -> None:
+        """Show a tool call as a step, after the text that came before it."""
+        if self.held:
+            self._held_tool_calls.append((self._take_buffer(), name, arguments))
+            return
+        await self.flush()
+        self._show_tool_call(name, arguments)
+
+    async def stream_events(self, result) -> None:
+        """Stream the text and the tool calls of a streamed agent run."""
+        async for event in result.stream_events():
+            # Stream final message text to screen
+            if event.type == "raw_response_event" and isinstance(
+                event.data, ResponseTextDeltaEvent
+            ):
+                await self.write(event.data.delta)
+
+            elif (
+                event.type == "raw_response_event"
+                and hasattr(event.data, "item")
+                and hasattr(event.data.item, "type")
+                and event.data.item.type == "function_call"
+                and len(event.data.item.arguments) > 0
+            ):
+                await self.tool_call(event.data.item.name, event.data.item.arguments)
+
+        await self.flush()
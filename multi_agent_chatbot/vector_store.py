@@ -0,0 +1,379 @@
+"""
+Exact brute-force vector search over an export of the nutrition_db collection.
+
+At a few thousand food items a matrix-vector product over a contiguous float32
+array is faster and more predictable than the Chroma client and its HNSW index,
+and it is exact instead of approximate. The export is a memory-mapped .npy file
+with the normalized embeddings and a JSON file with the metadata in columns.
+
+For large catalogs the store can search a float16 or int8 copy of the embeddings
+instead, 2x or 4x smaller than float32. The float queries are scored against the
+quantized corpus, and the best candidates can be re-ranked exactly with the
+full-precision embeddings, which stay memory-mapped on disk.
+
+Export the collection, compare the backends and the quantized stores with:
+
+    python vector_store.py export
+    python vector_store.py compare
+    python vector_store.py quantization
+"""
+
+import argparse
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+from collection_version import atomic_output, read_version
+
+default_index_path = Path(__file__).parent.parent / "vector_index"
+
+EMBEDDINGS_FILE = "embeddings.npy"
+METADATA_FILE = "metadata.json"
+QUANTIZED_FILES = {"float16": "embeddings_float16.npy", "int8": "embeddings_int8.npy"}
+INT8_SCALES_FILE = "embeddings_int8_scales.npy"
+VERSION_FILE = "version.txt"
+
+
+def quantize(matrix: np.ndarray, quantization: str) -> tuple[np.ndarray, np.ndarray | None]:
+    """
+    Quantize normalized embeddings to "float16" or "int8".
+
+    Returns:
+        The quantized embeddings and, for int8, the float32 scale of every dimension
+        (an embedding is approximately codes * scales).
+    """
+    if quantization == "float16":
+        return matrix.astype(np.float16), None
+    if quantization == "int8":
+        # Symmetric quantization per dimension, so the largest value maps to 127
+        scales = np.abs(matrix).max(axis=0) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.clip(np.round(matrix / scales), -127, 127).astype(np.int8)
+        return codes, scales.astype(np.float32)
+    raise ValueError(f"Unknown quantization: {quantization}")
+
+
+def save_array(path: Path, array: np.ndarray) -> None:
+    """Save an array atomically, so workers memory-mapping the old file aren't affected."""
+    with atomic_output(path) as tmp, open(tmp, "wb") as f:
+        np.save(f, array)
+
+
+def export_collection(
+    collection, out_dir: str | Path, batch_size: int = 1000, version: str | None = None
+) -> int:
+    """
+    Export the embeddings, documents and metadata of a Chroma collection,
+    together with the float16 and int8 quantized embeddings.
+
+    Every file is replaced atomically, and `version` (see collection_version.py)
+    is written last, so an export interrupted halfway is redone on the next load.
+
+    Returns:
+        The number of exported items.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    ids, documents, metadatas, embeddings = [], [], [], []
+    for offset in range(0, collection.count(), batch_size):
+        batch = collection.get(
+            limit=batch_size,
+            offset=offset,
+            include=["embeddings", "documents", "metadatas"],
+        )
+        ids.extend(batch["ids"])
+        documents.extend(batch["documents"])
+        metadatas.extend(batch["metadatas"])
+        embeddings.append(np.asarray(batch["embeddings"], dtype=np.float32))
+
+    matrix = np.ascontiguousarray(np.concatenate(embeddings))
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+
+    # Store the metadata in columns, one list per metadata field
+    fields = sorted({field for metadata in metadatas for field in metadata})
+    columns = {
+        "ids": ids,
+        "documents": documents,
+        "metadata": {
+            field: [metadata.get(field) for metadata in metadatas] for field in fields
+        },
+    }
+
+    (out_dir / VERSION_FILE).unlink(missing_ok=True)
+    save_array(out_dir / EMBEDDINGS_FILE, matrix)
+    for quantization, file_name in QUANTIZED_FILES.items():
+        quantized, scales = quantize(matrix, quantization)
+        save_array(out_dir / file_name, quantized)
+        if scales is not None:
+            save_array(out_dir / INT8_SCALES_FILE, scales)
+    with atomic_output(out_dir / METADATA_FILE) as tmp, open(tmp, "w", encoding="utf-8") as f:
+        json.dump(columns, f)
+    if version is not None:
+        with atomic_output(out_dir / VERSION_FILE) as tmp:
+            tmp.write_text(version, encoding="utf-8")
+
+    return len(ids)
+
+
+class NumpyVectorStore:
+    """A read-only vector store answering top-k queries with a dot product and argpartition."""
+
+    def __init__(
+        self,
+        embeddings: np.ndarray,
+        columns: dict,
+        scales: np.ndarray | None = None,
+        full_embeddings: np.ndarray | None = None,
+        rerank_factor: int = 4,
+        block_size: int = 16384,
+    ):
+        """
+        Args:
+            embeddings: The normalized embeddings, one row per item, float32 or quantized.
+            columns: The ids, documents and metadata columns as written by export_collection.
+            scales: The per-dimension scales of int8 embeddings.
+            full_embeddings: The float32 embeddings to re-rank the candidates of a
+                quantized search with, or None to skip the re-ranking.
+            rerank_factor: Re-rank `rerank_factor * n_results` candidates.
+            block_size: How many quantized rows are converted to float32 at a time.
+        """
+        self.embeddings = embeddings
+        self.scales = scales
+        self.full_embeddings = full_embeddings
+        self.rerank_factor = rerank_factor
+        self.block_size = block_size
+        self.ids = columns["ids"]
+        self.documents = columns["documents"]
+        self.metadata_columns = columns["metadata"]
+
+    @classmethod
+    def load(
+        cls,
+        index_dir: str | Path = default_index_path,
+        quantization: str | None = None,
+        rerank_factor: int = 4,
+    ) -> "NumpyVectorStore":
+        """
+        Memory-map an exported collection.
+
+        Args:
+            quantization: Search the (also memory-mapped) "float16" or "int8" embeddings
+                instead of the float32 ones.
+            rerank_factor: Re-rank this many candidates per result with the (memory-mapped)
+                float32 embeddings, 0 to only use the quantized scores.
+        """
+        index_dir = Path(index_dir)
+        with open(index_dir / METADATA_FILE, encoding="utf-8") as f:
+            columns = json.load(f)
+
+        full_embeddings = np.load(index_dir / EMBEDDINGS_FILE, mmap_mode="r")
+        if not quantization or quantization == "float32":
+            return cls(full_embeddings, columns)
+
+        # Memory-mapped too, so that worker processes share the pages
+        embeddings = np.load(index_dir / QUANTIZED_FILES[quantization], mmap_mode="r")
+        scales = np.load(index_dir / INT8_SCALES_FILE) if quantization == "int8" else None
+        return cls(
+            embeddings,
+            columns,
+            scales=scales,
+            full_embeddings=full_embeddings if rerank_factor > 0 else None,
+            rerank_factor=rerank_factor,
+        )
+
+    @classmethod
+    def load_or_export(
+        cls,
+        collection,
+        index_dir: str | Path = default_index_path,
+        version: str | None = None,
+        **kwargs,
+    ) -> "NumpyVectorStore":
+        """
+        Load the export of the collection, exporting it first if there is none or if
+        it was exported from another `version` of the collection.
+        The keyword arguments are passed on to `load`.
+        """
+        index_dir = Path(index_dir)
+        quantization = kwargs.get("quantization")
+        stale = (
+            not (index_dir / EMBEDDINGS_FILE).exists()
+            or (
+                quantization in QUANTIZED_FILES
+                and not (index_dir / QUANTIZED_FILES[quantization]).exists()
+            )
+            or (version is not None and read_version(index_dir / VERSION_FILE) != version)
+        )
+        if stale:
+            export_collection(collection, index_dir, version=version)
+        return cls.load(index_dir, **kwargs)
+
+    @property
+    def nbytes(self) -> int:
+        """The size of the searched embeddings (the float32 re-rank embeddings stay on disk)."""
+        return self.embeddings.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def __len__(self) -> int:
+        return self.embeddings.shape[0]
+
+    def metadata(self, position: int) -> dict:
+        return {
+            field: values[position] for field, values in self.metadata_columns.items()
+        }
+
+    def scores(self, queries: np.ndarray) -> np.ndarray:
+        """The cosine similarity of the normalized queries with every item."""
+        if self.embeddings.dtype == np.float32:
+            return queries @ self.embeddings.T
+
+        # Score the float queries against the quantized corpus, block by block, so only
+        # `block_size` rows are ever converted to float32 at a time
+        if self.scales is not None:
+            queries = queries * self.scales
+        scores = np.empty((len(queries), len(self)), dtype=np.float32)
+        for start in range(0, len(self), self.block_size):
+            block = self.embeddings[start : start + self.block_size].astype(np.float32)
+            scores[:, start : start + self.block_size] = queries @ block.T
+        return scores
+
+    def query(self, query_embeddings: list, n_results: int = 10) -> dict:
+        """
+        Find the nearest items of each query embedding.
+
+        Returns:
+            A result in the same shape as Collection.query, with squared L2
+            distances like the default Chroma collection.
+        """
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+        k = min(n_results, len(self))
+
+        results = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        if k == 0:
+            for key in results:
+                results[key] = [[] for _ in queries]
+            return results
+
+        scores = self.scores(queries)
+        rerank = self.full_embeddings is not None
+        candidates = min(k * self.rerank_factor, len(self)) if rerank else k
+
+        # Partition out the best scores, then sort only those
+        top = np.argpartition(-scores, candidates - 1, axis=1)[:, :candidates]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        if rerank:
+            # Exact scores of the candidates, reading only their rows of the float32 embeddings
+            top_scores = np.einsum("qd,qcd->qc", queries, self.full_embeddings[top])
+        order = np.argsort(-top_scores, axis=1)[:, :k]
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+        for positions, position_scores in zip(top.tolist(), top_scores):
+            results["ids"].append([self.ids[i] for i in positions])
+            results["documents"].append([self.documents[i] for i in positions])
+            results["metadatas"].append([self.metadata(i) for i in positions])
+            # For unit vectors the squared L2 distance is 2 - 2 * cosine similarity
+            results["distances"].append((2.0 - 2.0 * position_scores).tolist())
+
+        return results
+
+
+def compare_backends(collection, store: NumpyVectorStore, embed, queries: list[str], k: int):
+    """Compare the latency and recall of Chroma and the NumPy store on the same query embeddings."""
+    query_embeddings = embed(queries)
+
+    chroma_ids, numpy_ids = [], []
+    chroma_times, numpy_times = [], []
+    for query_embedding in query_embeddings:
+        start = time.perf_counter()
+        chroma_ids.append(
+            collection.query(query_embeddings=[query_embedding], n_results=k)["ids"][0]
+        )
+        chroma_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        numpy_ids.append(store.query([query_embedding], n_results=k)["ids"][0])
+        numpy_times.append(time.perf_counter() - start)
+
+    # The exact NumPy search is the ground truth for the approximate HNSW search
+    recall = np.mean(
+        [len(set(c) & set(n)) / len(n) for c, n in zip(chroma_ids, numpy_ids) if n]
+    )
+    for name, times in [("chroma", chroma_times), ("numpy", numpy_times)]:
+        print(
+            f"{name:>6}: p50 {np.percentile(times, 50) * 1000:.3f} ms, "
+            f"p99 {np.percentile(times, 99) * 1000:.3f} ms"
+        )
+    print(f"Chroma recall@{k} against the exact search: {recall:.4f}")
+
+
+def quantization_report(index_dir: str | Path, embed, queries: list[str], k: int):
+    """Compare the memory, latency and recall@k of the quantized stores with the float32 store."""
+    query_embeddings = embed(queries)
+    configurations = [
+        # The float32 store is the ground truth
+        ("float32", None, 0),
+        ("float16", "float16", 0),
+        ("float16+rerank", "float16", 4),
+        ("int8", "int8", 0),
+        ("int8+rerank", "int8", 4),
+    ]
+
+    exact = NumpyVectorStore.load(index_dir)
+    positions = {id_: i for i, id_ in enumerate(exact.ids)}
+    queries_matrix = np.asarray(query_embeddings, dtype=np.float32)
+    queries_matrix /= np.linalg.norm(queries_matrix, axis=1, keepdims=True)
+    # The k-th best exact score of every query
+    kth_scores = np.sort(queries_matrix @ exact.embeddings.T, axis=1)[:, -k]
+
+    for name, quantization, rerank_factor in configurations:
+        store = NumpyVectorStore.load(index_dir, quantization, rerank_factor=rerank_factor)
+        hits, times = [], []
+        for query, kth_score in zip(queries_matrix, kth_scores):
+            start = time.perf_counter()
+            ids = store.query([query], n_results=k)["ids"][0]
+            times.append(time.perf_counter() - start)
+
+            # A result is a hit if it scores at least as high as the exact k-th result,
+            # so that duplicate food items with the same embedding count either way
+            scores = exact.embeddings[[positions[id_] for id_ in ids]] @ query
+            hits.append(np.mean(scores >= kth_score - 1e-6))
+
+        print(
+            f"{name:>15}: {store.nbytes / 2**20:8.2f} MiB, "
+            f"p50 {np.percentile(times, 50) * 1000:.3f} ms, recall@{k} {np.mean(hits):.4f}"
+        )
+
+
+if __name__ == "__main__":
+    import chromadb
+    from chromadb.utils.embedding_functions import ONNXMiniLM_L6_V2
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("command", choices=["export", "compare", "quantization"])
+    parser.add_argument("--index-path", default=str(default_index_path))
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--queries", type=int, default=500)
+    args = parser.parse_args()
+
+    chroma_path = Path(__file__).parent.parent / "chroma"
+    nutrition_db = chromadb.PersistentClient(path=str(chroma_path)).get_collection(
+        name="nutrition_db"
+    )
+
+    if args.command == "export":
+        count = export_collection(nutrition_db, args.index_path)
+        print(f"Exported {count} items to {args.index_path}")
+    else:
+        store = NumpyVectorStore.load_or_export(nutrition_db, args.index_path)
+        queries = [food.title() for food in store.metadata_columns["food_item"]]
+        if args.command == "compare":
+            compare_backends(
+                nutrition_db, store, ONNXMiniLM_L6_V2(), queries[: args.queries], args.k
+            )
+        else:
+            quantization_report(
+                args.index_path, ONNXMiniLM_L6_V2(), queries[: args.queries], args.k
+            )
@@ -1,11 +1,51 @@
 """
-Script to convert calories.csv to text format for RAG database.
+Script to convert calories.csv to text format for RAG database and to ingest it into ChromaDB.
 Reads the CSV and creates formatted text documents for each food item.
+
+The ChromaDB ingestion is incremental: every row is hashed, so re-running the script on an
+updated CSV only embeds and upserts the changed or new food items and deletes the removed ones.
+After every sync the BM25 keyword index of the hybrid calorie lookup is rebuilt next to the
+ChromaDB directory. The version of the collection (a digest of the ids and row hashes) is
+written to chroma_version.txt, so the chatbot knows when its exports and caches are stale.
+With --publish-snapshot the synced collection is also published as a read-only index
+snapshot for the chatbot workers (NUTRITION_BACKEND=snapshot).
 """
 
-import pandas as pd
+import argparse
+import hashlib
+import sys
 from pathlib import Path
 
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "multi_agent_chatbot"))
+
+from bm25_index import BM25Index, default_bm25_path  # noqa: E402
+from collection_version import collection_version, default_version_path, write_version  # noqa: E402
+from index_snapshot import default_snapshots_path, publish_snapshot  # noqa: E402
+
+
+def build_calorie_documents(df: pd.DataFrame) -> pd.Series:
+    """
+    Build the formatted document text of every food item.
+    Uses vectorized pandas string operations instead of looping over the rows.
+    """
+    # Clean up the calorie and kJ values
+    cals = df['Cals_per100grams'].astype(str).str.replace(' cal', '', regex=False)
+    kj = df['KJ_per100grams'].astype(str).str.replace(' kJ', '', regex=False)
+
+    # Create rich document text for semantic search
+    return (
+        "Food: " + df['FoodItem']
+        + "\nCategory: " + df['FoodCategory']
+        + "\nNutritional Information:"
+        + "\n- Calories: " + cals + " per 100g"
+        + "\n- Energy: " + kj + " kJ per 100g"
+        + "\n- Serving size reference: " + df['per100grams'].astype(str)
+        + "\n\nThis is a " + df['FoodCategory'].str.lower()
+        + " food item that provides " + cals + " calories per 100 grams."
+    )
+
 
 def create_calorie_text_database(csv_path: str, output_path: str):
     """
@@ -15,45 +55,181 @@ def create_calorie_text_database(csv_path: str, output_path: str):
     # Read the CSV
     df = pd.read_csv(csv_path)
 
-    documents = []
+    documents = build_calorie_documents(df).tolist()
 
-    for index, row in df.iterrows():
-        # Clean up the calorie and kJ values
-        cals = str(row['Cals_per100grams']).replace(' cal', '')
-        kj = str(row['KJ_per100grams']).replace(' kJ', '')
-
-        # Create rich document text for semantic search
-        document_text = f"""Food: {row['FoodItem']}
-Category: {row['FoodCategory']}
-Nutritional Information:
-- Calories: {cals} per 100g
-- Energy: {kj} kJ per 100g
-- Serving size reference: {row['per100grams']}
-
-This is a {row['FoodCategory'].lower()} food item that provides {cals} calories per 100 grams."""
-
-        documents.append(document_text)
-
-    # Write all documents to the output file
+    # Write all documents to the output file, with a separator between documents
     with open(output_path, 'w', encoding='utf-8') as f:
-        for i, doc in enumerate(documents):
-            f.write(doc)
-            # Add separator between documents (except for the last one)
-            if i < len(documents) - 1:
-                f.write('\n\n---\n\n')
+        f.write('\n\n---\n\n'.join(documents))
 
     print(f"Successfully created {output_path}")
     print(f"Converted {len(documents)} food items from {csv_path}")
     return len(documents)
 
 
+def prepare_nutrition_records(df: pd.DataFrame) -> dict:
+    """
+    Convert the nutrition CSV rows into ChromaDB-ready ids, documents and metadatas.
+
+    The ids are derived from the food category and name, so they stay stable when rows
+    are added or removed. Each record carries a hash of its content in `row_hash`.
+    """
+    documents = build_calorie_documents(df)
+
+    # Number repeated (category, food item) pairs so that every id is unique
+    occurrence = df.groupby(['FoodCategory', 'FoodItem']).cumcount().astype(str)
+    keys = df['FoodCategory'] + "|" + df['FoodItem'] + "|" + occurrence
+    ids = ["food_" + hashlib.sha1(key.encode('utf-8')).hexdigest()[:16] for key in keys]
+    row_hashes = [hashlib.sha256(doc.encode('utf-8')).hexdigest() for doc in documents]
+
+    # Rich metadata for filtering and exact lookups
+    metadata = pd.DataFrame(
+        {
+            "food_item": df['FoodItem'].str.lower(),
+            "food_category": df['FoodCategory'].str.lower(),
+            "calories_per_100g": pd.to_numeric(
+                df['Cals_per100grams'].astype(str).str.replace(' cal', '', regex=False),
+                errors='coerce',
+            ).fillna(0.0),
+            "kj_per_100g": pd.to_numeric(
+                df['KJ_per100grams'].astype(str).str.replace(' kJ', '', regex=False),
+                errors='coerce',
+            ).fillna(0.0),
+            "serving_info": df['per100grams'].astype(str),
+            # Add searchable keywords
+            "keywords": (
+                df['FoodItem'].str.lower() + " " + df['FoodCategory'].str.lower()
+            ).str.replace(" ", "_", regex=False),
+            "row_hash": row_hashes,
+        }
+    )
+
+    return {
+        "ids": ids,
+        "documents": documents.tolist(),
+        "metadatas": metadata.to_dict(orient='records'),
+    }
+
+
+def ingest_calorie_database(
+    csv_path: str,
+    chroma_path: str,
+    collection_name: str = "nutrition_db",
+    batch_size: int = 500,
+    full_rebuild: bool = False,
+    snapshot_path: str | None = None,
+) -> dict:
+    """
+    Incrementally sync the nutrition CSV into a ChromaDB collection.
+
+    Only rows whose content hash changed (or that are new) are embedded and upserted,
+    in batches of `batch_size`. Food items no longer in the CSV are deleted.
+    If `snapshot_path` is given, the synced collection is published there as a new snapshot.
+
+    Returns:
+        The number of upserted, deleted and unchanged food items.
+    """
+    import chromadb
+
+    client = chromadb.PersistentClient(path=chroma_path)
+
+    if full_rebuild:
+        try:
+            client.delete_collection(collection_name)
+        except Exception:
+            pass
+
+    collection = client.get_or_create_collection(
+        name=collection_name,
+        metadata={"description": "Nutrition database with calorie and food information"},
+    )
+
+    records = prepare_nutrition_records(pd.read_csv(csv_path))
+
+    # Compare the row hashes with what is already stored
+    stored = collection.get(include=["metadatas"])
+    stored_hashes = {
+        id_: (metadata or {}).get("row_hash")
+        for id_, metadata in zip(stored["ids"], stored["metadatas"])
+    }
+
+    changed = [
+        i
+        for i, (id_, metadata) in enumerate(zip(records["ids"], records["metadatas"]))
+        if stored_hashes.get(id_) != metadata["row_hash"]
+    ]
+    removed = sorted(set(stored_hashes) - set(records["ids"]))
+
+    batch_size = min(batch_size, client.get_max_batch_size())
+    for start in range(0, len(changed), batch_size):
+        batch = changed[start:start + batch_size]
+        collection.upsert(
+            ids=[records["ids"][i] for i in batch],
+            documents=[records["documents"][i] for i in batch],
+            metadatas=[records["metadatas"][i] for i in batch],
+        )
+        print(f"Upserted {start + len(batch)}/{len(changed)} changed food items")
+
+    for start in range(0, len(removed), batch_size):
+        collection.delete(ids=removed[start:start + batch_size])
+
+    # The synced collection now holds exactly the records
+    version = collection_version(
+        records["ids"], [metadata["row_hash"] for metadata in records["metadatas"]]
+    )
+
+    # The keyword index is cheap to build, so it's always rebuilt from the synced collection
+    bm25_path = default_bm25_path(chroma_path)
+    BM25Index.from_collection(collection, version=version).save(bm25_path)
+
+    # Written last and only when the version changed, the readers compare against it
+    version_path = default_version_path(chroma_path)
+    if write_version(version_path, version):
+        print(f"Wrote collection version {version} to {version_path}")
+
+    stats = {
+        "upserted": len(changed),
+        "deleted": len(removed),
+        "unchanged": len(records["ids"]) - len(changed),
+    }
+    print(
+        f"Synced {csv_path} into ChromaDB collection '{collection_name}': "
+        f"{stats['upserted']} upserted, {stats['deleted']} deleted, {stats['unchanged']} unchanged"
+    )
+    print(f"Wrote the BM25 keyword index to {bm25_path}")
+
+    if snapshot_path is not None:
+        snapshot = publish_snapshot(collection, snapshot_path)
+        print(f"Published index snapshot {snapshot} to {snapshot_path}")
+    return stats
+
+
 if __name__ == "__main__":
     # Define paths
     script_dir = Path(__file__).parent
-    csv_path = script_dir.parent / "data" / "calories.csv"
-    output_path = script_dir.parent / "data" / "calorie_database.txt"
+
+    parser = argparse.ArgumentParser(description="Build the calorie text database and ChromaDB collection.")
+    parser.add_argument("--csv-path", default=str(script_dir.parent / "data" / "calories.csv"))
+    parser.add_argument("--output-path", default=str(script_dir.parent / "data" / "calorie_database.txt"))
+    parser.add_argument("--chroma-path", default=str(script_dir.parent / "chroma"))
+    parser.add_argument("--collection-name", default="nutrition_db")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--full-rebuild", action="store_true", help="Drop the collection and re-embed every food item")
+    parser.add_argument("--text-only", action="store_true", help="Only write the text database, skip ChromaDB")
+    parser.add_argument("--publish-snapshot", action="store_true", help="Publish a read-only index snapshot for the chatbot workers")
+    parser.add_argument("--snapshot-path", default=str(default_snapshots_path))
+    args = parser.parse_args()
 
     # Create the text database
-    num_items = create_calorie_text_database(str(csv_path), str(output_path))
-    print(f"\nOutput file location: {output_path}")
+    num_items = create_calorie_text_database(args.csv_path, args.output_path)
+    print(f"\nOutput file location: {args.output_path}")
     print(f"Total items processed: {num_items}")
+
+    if not args.text_only:
+        ingest_calorie_database(
+            args.csv_path,
+            args.chroma_path,
+            collection_name=args.collection_name,
+            batch_size=args.batch_size,
+            full_rebuild=args.full_rebuild,
+            snapshot_path=args.snapshot_path if args.publish_snapshot else None,
+        )